@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+''' Per-row encrypt/decrypt cost of the `CryptoProvider`.
+
+    "uncached" builds a new provider and stretches the key for every
+    row, which is what each `EncryptedBlobField` access used to cost.
+    "cached" reuses keys from the process-wide keyring.
+
+        python benchmarks/bench_crypto.py --rows 200 --iterations 10000 -o crypto.json
+'''
+
+import os
+import time
+
+import click
+
+import common
+from tubedlapi.util.crypto import (
+    CryptoProvider,
+    Keyring,
+    default_keyring,
+)
+
+
+def _per_row(func, rows: int) -> float:
+    ''' Runs `func` `rows` times, returns the mean cost in microseconds.
+    '''
+
+    start = time.perf_counter()
+    for _ in range(rows):
+        func()
+
+    return (time.perf_counter() - start) / rows * 1e6
+
+
+def run(rows: int=200, iterations: int=10000, size: int=256) -> dict:
+
+    secret = os.urandom(32)
+    salt = os.urandom(16)
+    blob = os.urandom(size)
+    message = CryptoProvider(secret, iterations=iterations, salt=salt).encrypt_blob(blob)
+
+    def uncached():
+        return CryptoProvider(secret, iterations=iterations, salt=salt, keyring=Keyring())
+
+    def cached():
+        return CryptoProvider(secret, iterations=iterations, salt=salt, keyring=default_keyring)
+
+    results = {
+        'encrypt/uncached': _per_row(lambda: uncached().encrypt_blob(blob), rows),
+        'decrypt/uncached': _per_row(lambda: uncached().decrypt_message(message), rows),
+        'encrypt/cached': _per_row(lambda: cached().encrypt_blob(blob), rows),
+        'decrypt/cached': _per_row(lambda: cached().decrypt_message(message), rows),
+    }
+
+    return common.make_report(
+        'crypto',
+        {'rows': rows, 'iterations': iterations, 'size': size},
+        {name: {'us_per_row': cost} for name, cost in results.items()},
+    )
+
+
+@click.command()
+@click.option('--rows', default=200, help='Rows to encrypt and decrypt per case')
+@click.option('--iterations', default=10000, help='PBKDF2 iterations (CRYPTO_KDF_ITERATIONS)')
+@click.option('--size', default=256, help='Plaintext size in bytes')
+@common.output_option
+def main(rows: int, iterations: int, size: int, output: str):
+
+    common.emit(run(rows=rows, iterations=iterations, size=size), output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+''' `Job.meta_update`, `save` and `to_json` with a realistically
+    large youtube-dl info dict.
+
+        python benchmarks/bench_jobs.py --formats 40 -o jobs.json
+'''
+
+import click
+
+import common
+
+
+def run(number: int=200, repeat: int=5, formats: int=40) -> dict:
+
+    common.setup_app()
+
+    from tubedlapi.model.job import Job
+
+    info = common.make_info(formats=formats)
+    progress = {
+        'status': 'downloading',
+        'downloaded_bytes': 1024 * 1024,
+        'total_bytes': 16 * 1024 * 1024,
+        'total_bytes_estimated': False,
+        'speed': 2.5 * 1024 * 1024,
+        'eta': 6,
+    }
+
+    job = Job.create(
+        status='queued',
+        meta={
+            'url': f"https://www.youtube.com/watch?v={info['id']}",
+            'profile': 'default',
+            'destinations': ['local', 'archive'],
+        },
+    )
+    job.meta_update(info=info, progress=progress)
+    job.save()
+
+    def update_progress():
+        job.meta_update(progress=dict(progress))
+
+    def save_progress():
+        job.meta_update(progress=dict(progress))
+        job.save()
+
+    def save_info():
+        job.meta_update(info=info)
+        job.save()
+
+    def load_to_json():
+        return Job.get(Job.id == job.id).to_json()
+
+    try:
+        results = {
+            'meta_update/progress': common.measure(update_progress, number, repeat),
+            'meta_update/info': common.measure(lambda: job.meta_update(info=info), number, repeat),
+            'meta_update/meta': common.measure(
+                lambda: job.meta_update(error={'stage': 'fetching', 'message': 'x'}),
+                number, repeat),
+            'save/progress': common.measure(save_progress, number, repeat),
+            'save/info': common.measure(save_info, number, repeat),
+            'meta_dict': common.measure(lambda: job.meta_dict, number, repeat),
+            'to_json/loaded': common.measure(job.to_json, number, repeat),
+            'to_json/fresh': common.measure(load_to_json, number, repeat),
+        }
+    finally:
+        job.delete_instance()
+
+    return common.make_report(
+        'jobs',
+        {'number': number, 'repeat': repeat, 'formats': formats},
+        results,
+    )
+
+
+@click.command()
+@click.option('--number', default=200, help='Calls per round')
+@click.option('--repeat', default=5, help='Rounds per case')
+@click.option('--formats', default=40, help='Formats in the info dict')
+@common.output_option
+def main(number: int, repeat: int, formats: int, output: str):
+
+    common.emit(run(number=number, repeat=repeat, formats=formats), output)
+
+
+if __name__ == '__main__':
+    main()
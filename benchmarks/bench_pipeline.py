@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+''' Runs jobs through the whole pipeline, `job_begin_fetch` to the
+    last upload, with a stub extractor serving media from a local
+    HTTP server and uploading to `mem://` and `osfs://` destinations.
+
+        python benchmarks/bench_pipeline.py --jobs 20 --size 1048576 -o pipeline.json
+'''
+
+import os
+import shutil
+import statistics
+import tempfile
+import time
+import uuid
+from concurrent.futures import wait
+
+import click
+
+import common
+import stubs
+
+
+def run(jobs: int=20, size: int=1024 * 1024, rounds: int=3, timeout: float=300.0) -> dict:
+
+    common.setup_app()
+
+    from flask import json
+
+    from tubedlapi.exec import stage
+    from tubedlapi.model.destination import Destination
+    from tubedlapi.model.job import Job
+    from tubedlapi.model.profile import Profile
+
+    workdir = tempfile.mkdtemp(prefix='tubedlapi-bench-')
+    cwd = os.getcwd()
+    server = stubs.MediaServer(size=size).start()
+
+    # youtube-dl writes downloads relative to the working directory
+    os.chdir(workdir)
+
+    try:
+        profile = Profile.create(
+            name=f'bench-{uuid.uuid4().hex}',
+            options=json.dumps({'quiet': True, 'noprogress': True}).encode('utf-8'),
+        )
+        destinations = [
+            Destination.create(name=f'bench-mem-{uuid.uuid4().hex}', url='mem://'),
+            Destination.create(
+                name=f'bench-osfs-{uuid.uuid4().hex}',
+                url=f"osfs://{os.path.join(workdir, 'uploads')}",
+            ),
+        ]
+        os.makedirs(os.path.join(workdir, 'uploads'))
+
+        results = {}
+        for round_ in range(rounds):
+            results[f'round/{round_}'] = _run_round(
+                stage, Job, profile, destinations, server, jobs, size, timeout,
+            )
+
+        walls = [result['wall_s'] for result in results.values()]
+        results['summary'] = {
+            'wall_s_median': statistics.median(walls),
+            'jobs_per_s_median': statistics.median(
+                result['jobs_per_s'] for result in results.values()
+            ),
+            'failed': sum(result['failed'] for result in results.values()),
+        }
+
+        for destination in destinations:
+            destination.delete_instance()
+        profile.delete_instance()
+    finally:
+        os.chdir(cwd)
+        server.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return common.make_report(
+        'pipeline',
+        {'jobs': jobs, 'size': size, 'rounds': rounds},
+        results,
+    )
+
+
+def _run_round(stage, Job, profile, destinations, server: stubs.MediaServer, jobs: int,
+               size: int, timeout: float) -> dict:
+
+    run_id = uuid.uuid4().hex[:8]
+    latencies = []
+
+    def finished(started: float, fut) -> None:
+
+        latencies.append(time.perf_counter() - started)
+
+    start = time.perf_counter()
+
+    futs = []
+    job_ids = []
+    for i in range(jobs):
+        job = Job.create(
+            status='queued',
+            meta={
+                'url': server.url(f'{run_id}-{i}'),
+                'ie_key': stubs.BenchIE.ie_key(),
+                'profile': profile.name,
+                'destinations': [destination.name for destination in destinations],
+            },
+        )
+
+        job_ids.append(job.id)
+        done = stage.job_start(job, profile)
+        done.add_done_callback(lambda fut, started=time.perf_counter(): finished(started, fut))
+        futs.append(done)
+
+    _, pending = wait(futs, timeout=timeout)
+    wall = time.perf_counter() - start
+
+    # Completed jobs may still have failed uploads
+    failed = len(pending) + sum(
+        common.job_failed(job.to_dict()) for job in Job.select().where(Job.id.in_(job_ids))
+        if job.is_done
+    )
+
+    return {
+        'wall_s': wall,
+        'jobs_per_s': jobs / wall,
+        'bytes_per_s': jobs * size / wall,
+        'latency_s_mean': statistics.mean(latencies) if latencies else None,
+        'latency_s_max': max(latencies) if latencies else None,
+        'completed': jobs - failed,
+        'failed': failed,
+    }
+
+
+@click.command()
+@click.option('--jobs', default=20, help='Jobs per round')
+@click.option('--size', default=1024 * 1024, help='Media size in bytes')
+@click.option('--rounds', default=3, help='Rounds to run')
+@click.option('--timeout', default=300.0, help='Seconds to wait for a round')
+@common.output_option
+def main(jobs: int, size: int, rounds: int, timeout: float, output: str):
+
+    common.emit(run(jobs=jobs, size=size, rounds=rounds, timeout=timeout), output)
+
+
+if __name__ == '__main__':
+    main()
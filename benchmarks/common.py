@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+''' Shared helpers for the benchmark scripts: timing, JSON reports,
+    setting up the application against a scratch database, and
+    realistic youtube-dl documents.
+'''
+
+import atexit
+import base64
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+)
+
+import click
+
+_app = None
+
+
+def measure(func: Callable[[], Any], number: int=100, repeat: int=5,
+            setup: Callable[[], Any]=None) -> Dict[str, float]:
+    ''' Calls `func` `number` times in each of `repeat` rounds, after
+        one warm-up call. `setup`, if given, runs before every call
+        and is not timed.
+
+        Returns per-call statistics in microseconds.
+    '''
+
+    if setup:
+        setup()
+    func()
+
+    rounds = []
+    for _ in range(repeat):
+        elapsed = 0.0
+        for _ in range(number):
+            if setup:
+                setup()
+
+            start = time.perf_counter()
+            func()
+            elapsed += time.perf_counter() - start
+
+        rounds.append(elapsed / number * 1e6)
+
+    return {
+        'mean_us': statistics.mean(rounds),
+        'median_us': statistics.median(rounds),
+        'min_us': min(rounds),
+        'max_us': max(rounds),
+        'stdev_us': statistics.stdev(rounds) if len(rounds) > 1 else 0.0,
+        'number': number,
+        'repeat': repeat,
+    }
+
+
+def environment() -> Dict[str, str]:
+
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'timestamp': datetime.utcnow().isoformat() + 'Z',
+        'argv': ' '.join(sys.argv),
+    }
+
+
+def make_report(name: str, params: dict, results: dict) -> dict:
+
+    return {
+        'benchmark': name,
+        'params': params,
+        'environment': environment(),
+        'results': results,
+    }
+
+
+def emit(report: dict, output: str=None) -> None:
+    ''' Writes `report` as JSON to `output` ('-' for stdout), and
+        prints a summary table otherwise.
+    '''
+
+    if output == '-':
+        click.echo(json.dumps(report, indent=2, sort_keys=True))
+        return
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+
+    click.echo(f"{report['benchmark']}: {json.dumps(report['params'], sort_keys=True)}")
+    for case, result in report['results'].items():
+        if 'mean_us' in result:
+            click.echo(
+                f"  {case:<32} {result['mean_us']:>12.1f} us "
+                f"(median {result['median_us']:.1f}, min {result['min_us']:.1f})"
+            )
+        else:
+            click.echo(f'  {case:<32} {json.dumps(result, sort_keys=True)}')
+
+
+def output_option(func: Callable) -> Callable:
+
+    return click.option(
+        '--output', '-o',
+        default=None,
+        help='Write the JSON report to this file, or `-` for stdout',
+    )(func)
+
+
+def setup_app(**env: str):
+    ''' Creates the application once per process, against a scratch
+        SQLite database which is removed on exit, unless `DB_URI` is
+        set. `env` sets defaults for settings which are not set in the
+        environment.
+
+        The `bench://` extractor is always added, as the first benchmark
+        to run decides the settings for every other one.
+    '''
+
+    global _app
+
+    if _app is not None:
+        return _app
+
+    import stubs
+
+    workdir = tempfile.mkdtemp(prefix='tubedlapi-bench-db-')
+    atexit.register(shutil.rmtree, workdir, ignore_errors=True)
+
+    defaults = {
+        'CRYPTO_SECRET': base64.b64encode(os.urandom(32)).decode('ascii'),
+        'CRYPTO_SALT': base64.b64encode(os.urandom(16)).decode('ascii'),
+        'DB_URI': f"sqlite:///{os.path.join(workdir, 'tubedlapi.db')}",
+        'LOG_LEVEL': 'WARNING',
+        'SWAGGER': 'false',
+        'JOB_QUEUE': 'local',
+        'EXTRA_EXTRACTORS': stubs.EXTRACTOR,
+    }
+    defaults.update(env)
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+    from tubedlapi.app import main
+    _app = main()
+
+    return _app
+
+
+def upload_errors(job: dict) -> List[str]:
+    ''' The destinations of a serialized job whose upload failed.
+    '''
+
+    results = job['meta'].get('result') or {}
+    if not job['meta'].get('destinations'):
+        return []
+
+    return sorted(
+        dest for dest, result in results.items()
+        if not isinstance(result, dict) or 'error' in result
+    )
+
+
+def job_failed(job: dict) -> bool:
+    ''' Whether a finished job, serialized with its `result`, failed.
+        A job counts as failed unless it completed and every upload
+        succeeded.
+    '''
+
+    return job['status'] != 'completed' or bool(upload_errors(job))
+
+
+def clear_plaintext_cache() -> None:
+
+    from tubedlapi.app import registry
+    from tubedlapi.util.crypto import PlaintextCache
+
+    registry[PlaintextCache].clear()
+
+
+def make_info(video_id: str='dQw4w9WgXcQ', formats: int=40) -> dict:
+    ''' Builds an info dict shaped like youtube-dl's, with `formats`
+        formats, thumbnails, subtitles and a long description.
+    '''
+
+    return {
+        'id': video_id,
+        'title': f'Benchmark video {video_id}',
+        'fulltitle': f'Benchmark video {video_id}',
+        'description': 'Lorem ipsum dolor sit amet. ' * 150,
+        'uploader': 'tubedlapi',
+        'uploader_id': 'tubedlapi',
+        'upload_date': '20180211',
+        'duration': 212,
+        'view_count': 123456789,
+        'like_count': 1234567,
+        'tags': [f'tag-{i}' for i in range(30)],
+        'categories': ['Music'],
+        'extractor': 'youtube',
+        'extractor_key': 'Youtube',
+        'webpage_url': f'https://www.youtube.com/watch?v={video_id}',
+        'thumbnails': [
+            {
+                'id': str(i),
+                'url': f'https://i.ytimg.com/vi/{video_id}/{i}.jpg',
+                'width': 120 * (i + 1),
+                'height': 90 * (i + 1),
+            }
+            for i in range(5)
+        ],
+        'subtitles': {
+            lang: [{'ext': 'vtt', 'url': f'https://example.com/{video_id}.{lang}.vtt'}]
+            for lang in ('en', 'de', 'fr', 'es', 'ja')
+        },
+        'formats': [
+            {
+                'format_id': str(100 + i),
+                'format': f'{100 + i} - {144 * (1 + i % 6)}p',
+                'url': f'https://r{i}.googlevideo.com/videoplayback?id={video_id}&itag={100 + i}'
+                       '&expire=1518393600&signature=' + 'A' * 80,
+                'ext': 'mp4' if i % 2 else 'webm',
+                'width': 256 * (1 + i % 6),
+                'height': 144 * (1 + i % 6),
+                'tbr': 100.0 * (i + 1),
+                'filesize': 1024 * 1024 * (i + 1),
+                'vcodec': 'avc1.4d401e',
+                'acodec': 'mp4a.40.2',
+                'http_headers': {
+                    'User-Agent': 'Mozilla/5.0',
+                    'Accept': 'text/html,application/xhtml+xml',
+                },
+            }
+            for i in range(formats)
+        ],
+    }
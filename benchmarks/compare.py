@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+''' Compares two benchmark reports, case by case, and exits non-zero
+    if any case got slower by more than `--threshold`.
+
+        python benchmarks/compare.py baseline.json results.json --threshold 0.1
+'''
+
+import json
+import sys
+from typing import (
+    Dict,
+    Iterator,
+    Tuple,
+)
+
+import click
+
+# The figure compared for each kind of result, and whether lower is better
+METRICS = (
+    ('mean_us', True),
+    ('us_per_row', True),
+    ('wall_s_median', True),
+)
+
+
+def _cases(report: dict, prefix: str='') -> Iterator[Tuple[str, dict]]:
+
+    for name, result in report['results'].items():
+        if isinstance(result, dict) and 'results' in result:
+            yield from _cases(result, f"{prefix}{result['benchmark']}/")
+        else:
+            yield f'{prefix}{name}', result
+
+
+def _figure(result: dict) -> Tuple[str, float, bool]:
+
+    for key, lower_is_better in METRICS:
+        if key in result and result[key] is not None:
+            return key, float(result[key]), lower_is_better
+
+    return None, None, None
+
+
+@click.command()
+@click.argument('baseline', type=click.File('r'))
+@click.argument('current', type=click.File('r'))
+@click.option('--threshold', default=0.1, help='Allowed slowdown, as a fraction')
+def main(baseline, current, threshold: float):
+
+    before: Dict[str, dict] = dict(_cases(json.load(baseline)))
+    after: Dict[str, dict] = dict(_cases(json.load(current)))
+
+    regressions = 0
+    for case in sorted(set(before) & set(after)):
+        key, old, lower_is_better = _figure(before[case])
+        _, new, _ = _figure(after[case])
+        if key is None or new is None or not old:
+            continue
+
+        change = (new - old) / old if lower_is_better else (old - new) / old
+        flag = ''
+        if change > threshold:
+            regressions += 1
+            flag = '  REGRESSION'
+
+        click.echo(f'{case:<48} {key:<14} {old:>12.2f} -> {new:>12.2f} {change:>+8.1%}{flag}')
+
+    for case in sorted(set(before) ^ set(after)):
+        click.echo(f"{case:<48} only in {'baseline' if case in before else 'current'}")
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
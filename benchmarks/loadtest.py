@@ -0,0 +1,498 @@
+# -*- coding: utf-8 -*-
+''' Offline end-to-end load test. Starts the API server as a child
+    process against a scratch SQLite database, with the `bench://`
+    extractor and a local media server, then submits jobs through
+    `POST /jobs/` to an `osfs://` destination and waits for them to
+    finish.
+
+    Each concurrency level runs against a fresh server, and keeps at
+    most that many jobs in flight. Reports throughput, client-side job
+    latency, and queue wait and stage latency percentiles, estimated
+    from the `/metrics` histograms, along with the server's peak RSS.
+
+        python benchmarks/loadtest.py -c 10 -c 100 -c 1000 -o load.json
+        python benchmarks/loadtest.py -c 100 --rate 50 --latency 0.2 \\
+            --env FETCH_CONCURRENCY=16 --env UPLOAD_CONCURRENCY=8
+'''
+
+import base64
+import math
+import os
+import re
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import (
+    Dict,
+    List,
+    Tuple,
+)
+
+import click
+import requests
+
+import common
+import stubs
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(BENCHMARKS_DIR), 'src')
+
+TERMINAL_STATUSES = ('cancelled', 'completed', 'expanded', 'failed')
+QUANTILES = (0.5, 0.9, 0.99)
+
+_SAMPLE_RE = re.compile(r'^(?P<name>[a-zA-Z_:][\w:]*)(?:\{(?P<labels>[^}]*)\})? (?P<value>\S+)$')
+_LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse_metrics(text: str) -> Dict[str, List[Tuple[dict, float]]]:
+    ''' Parses the Prometheus text format into samples by metric name.
+    '''
+
+    samples: Dict[str, List[Tuple[dict, float]]] = {}
+    for line in text.splitlines():
+        match = _SAMPLE_RE.match(line)
+        if not match:
+            continue
+
+        labels = dict(_LABEL_RE.findall(match.group('labels') or ''))
+        samples.setdefault(match.group('name'), []).append(
+            (labels, float(match.group('value'))),
+        )
+
+    return samples
+
+
+def histogram_quantiles(samples: dict, name: str, **labels: str) -> dict:
+    ''' Estimates quantiles of histogram `name` the way Prometheus'
+        `histogram_quantile` does, interpolating within buckets.
+    '''
+
+    buckets = sorted(
+        (float(bucket['le']), count)
+        for bucket, count in samples.get(f'{name}_bucket', [])
+        if all(bucket.get(key) == value for key, value in labels.items())
+    )
+    total = buckets[-1][1] if buckets else 0.0
+    if not total:
+        return {'count': 0}
+
+    result = {'count': int(total)}
+    for quantile in QUANTILES:
+        rank = quantile * total
+        lower, below = 0.0, 0.0
+        for upper, count in buckets:
+            if count >= rank:
+                if math.isinf(upper):
+                    value = lower
+                elif count == below:
+                    value = upper
+                else:
+                    value = lower + (upper - lower) * (rank - below) / (count - below)
+                break
+            lower, below = upper, count
+
+        result[f'p{int(quantile * 100)}_s'] = value
+
+    return result
+
+
+def percentiles(values: List[float]) -> dict:
+
+    if not values:
+        return {'count': 0}
+
+    values = sorted(values)
+    result = {'count': len(values), 'mean_s': statistics.mean(values)}
+    for quantile in QUANTILES:
+        index = min(len(values) - 1, int(math.ceil(quantile * len(values))) - 1)
+        result[f'p{int(quantile * 100)}_s'] = values[index]
+
+    return result
+
+
+def peak_rss(pid: int) -> int:
+    ''' Peak resident set size of process `pid`, in bytes, or None
+        where /proc is not available.
+    '''
+
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    return None
+
+
+def _free_port() -> int:
+
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class APIServer(object):
+    ''' Runs the development server in a child process, in `workdir`.
+    '''
+
+    def __init__(self, workdir: str, env: Dict[str, str]) -> None:
+
+        self.workdir = workdir
+        self.port = _free_port()
+        self.base_url = f'http://127.0.0.1:{self.port}'
+
+        self.env = dict(os.environ)
+        self.env.update({
+            'CRYPTO_SECRET': base64.b64encode(os.urandom(32)).decode('ascii'),
+            'CRYPTO_SALT': base64.b64encode(os.urandom(16)).decode('ascii'),
+            'DB_URI': f"sqlite:///{os.path.join(workdir, 'tubedlapi.db')}",
+            'EXTRA_EXTRACTORS': stubs.EXTRACTOR,
+            'HOST': '127.0.0.1',
+            'JOB_QUEUE': 'local',
+            'LOG_LEVEL': 'WARNING',
+            'METRICS': 'true',
+            'PORT': str(self.port),
+            'PYTHONPATH': os.pathsep.join(
+                path for path in (SRC_DIR, BENCHMARKS_DIR, os.getenv('PYTHONPATH')) if path
+            ),
+            'SWAGGER': 'false',
+        })
+        self.env.update(env)
+
+        self.process: subprocess.Popen = None
+        self._log = None
+
+    def start(self, timeout: float=60.0) -> 'APIServer':
+
+        self._log = open(os.path.join(self.workdir, 'server.log'), 'wb')
+        self.process = subprocess.Popen(
+            [sys.executable, '-c', 'from tubedlapi.cmd.main import cli; cli()'],
+            cwd=self.workdir,
+            env=self.env,
+            stdout=self._log,
+            stderr=subprocess.STDOUT,
+        )
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f'server exited with {self.process.returncode}, '
+                                   f"see {os.path.join(self.workdir, 'server.log')}")
+            try:
+                requests.get(f'{self.base_url}/status/startup', timeout=1.0)
+                return self
+            except requests.ConnectionError:
+                time.sleep(0.1)
+
+        self.stop()
+        raise RuntimeError(f'server did not start within {timeout}s')
+
+    def peak_rss(self) -> int:
+
+        return peak_rss(self.process.pid)
+
+    def stop(self) -> None:
+
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(10.0)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+
+        if self._log:
+            self._log.close()
+
+
+class LoadRun(object):
+    ''' Submits `jobs` jobs to `api`, at up to `rate` per second and
+        with at most `concurrency` of them unfinished at a time.
+    '''
+
+    poll_interval = 0.25
+
+    def __init__(self, api: APIServer, media: stubs.MediaServer, concurrency: int, jobs: int,
+                 rate: float, timeout: float) -> None:
+
+        self.api = api
+        self.media = media
+        self.concurrency = concurrency
+        self.jobs = jobs
+        self.rate = rate
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        self.submitted: Dict[str, float] = {}
+        self.finished: Dict[str, Tuple[str, float]] = {}
+        self.submit_errors = 0
+        self.peak_rss = None
+
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def setup(self, workdir: str) -> None:
+
+        uploads = os.path.join(workdir, 'uploads')
+        os.makedirs(uploads)
+
+        self._post('/profiles/', {
+            'name': 'bench',
+            'options': {'quiet': True, 'noprogress': True},
+        })
+        self._post('/destinations/', {'name': 'bench', 'url': f'osfs://{uploads}'})
+
+    def run(self) -> dict:
+
+        poller = threading.Thread(target=self._poll, name='bench-poll', daemon=True)
+        poller.start()
+
+        start = time.perf_counter()
+        interval = 1.0 / self.rate if self.rate else 0.0
+        deadline = time.monotonic() + self.timeout
+
+        for i in range(self.jobs):
+            if interval:
+                delay = start + i * interval - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+            if not self._slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                break
+
+            self._submit(i)
+
+        self._done.wait(max(0.0, deadline - time.monotonic()))
+        wall = time.perf_counter() - start
+        self._done.set()
+        poller.join()
+
+        return self._report(wall)
+
+    def _post(self, path: str, payload: dict) -> dict:
+
+        response = self.session.post(f'{self.api.base_url}{path}', json=payload, timeout=30.0)
+        response.raise_for_status()
+        return response.json()
+
+    def _submit(self, i: int) -> None:
+
+        submitted = time.perf_counter()
+        try:
+            job = self._post('/jobs/', {
+                'url': self.media.url(f'{uuid.uuid4().hex[:8]}-{i}'),
+                'ie_key': stubs.BenchIE.ie_key(),
+                'profile': 'bench',
+                'destinations': ['bench'],
+            })
+        except requests.RequestException:
+            self.submit_errors += 1
+            self._slots.release()
+            self._check_done()
+            return
+
+        with self._lock:
+            self.submitted[job['id']] = submitted
+
+    def _poll(self) -> None:
+        ''' Pages through the finished jobs until every submitted job
+            has been seen finishing, or the run is stopped.
+        '''
+
+        session = requests.Session()
+        while not self._done.wait(self.poll_interval):
+            self.peak_rss = self.api.peak_rss() or self.peak_rss
+
+            cursor = None
+            while True:
+                params = {'status': ','.join(TERMINAL_STATUSES), 'limit': 500}
+                if cursor:
+                    params['cursor'] = cursor
+
+                try:
+                    page = session.get(
+                        f'{self.api.base_url}/jobs/', params=params, timeout=30.0,
+                    ).json()
+                except (requests.RequestException, ValueError):
+                    break
+
+                now = time.perf_counter()
+                with self._lock:
+                    for job in page['jobs']:
+                        if job['id'] in self.submitted and job['id'] not in self.finished:
+                            self.finished[job['id']] = (job['status'], now)
+                            self._slots.release()
+
+                cursor = page.get('next_cursor')
+                if not cursor:
+                    break
+
+            self._check_done()
+
+    def _check_done(self) -> None:
+
+        with self._lock:
+            if len(self.finished) + self.submit_errors >= self.jobs:
+                self._done.set()
+
+    def _upload_failures(self, job_ids: List[str]) -> int:
+        ''' Counts the completed jobs with a failed upload. The job list
+            leaves out upload results, so each job is fetched on its own.
+        '''
+
+        failed = 0
+        for job_id in job_ids:
+            try:
+                job = self.session.get(f'{self.api.base_url}/jobs/{job_id}', timeout=30.0).json()
+            except (requests.RequestException, ValueError):
+                failed += 1
+                continue
+
+            failed += bool(common.upload_errors(job))
+
+        return failed
+
+    def _report(self, wall: float) -> dict:
+
+        with self._lock:
+            finished = dict(self.finished)
+            submitted = dict(self.submitted)
+
+        samples = parse_metrics(
+            self.session.get(f'{self.api.base_url}/metrics', timeout=30.0).text,
+        )
+        statuses = [status for status, _ in finished.values()]
+        upload_failed = self._upload_failures(
+            [job_id for job_id, (status, _) in finished.items() if status == 'completed'],
+        )
+        completed = statuses.count('completed') + statuses.count('expanded') - upload_failed
+
+        return {
+            'wall_s': wall,
+            'submitted': len(submitted),
+            'submit_errors': self.submit_errors,
+            'completed': completed,
+            'failed': statuses.count('failed') + upload_failed,
+            'upload_failed': upload_failed,
+            'unfinished': len(submitted) - len(finished),
+            'jobs_per_s': completed / wall if wall else None,
+            'bytes_per_s': completed * self.media.size / wall if wall else None,
+            'job_latency_client': percentiles([
+                at - submitted[job_id] for job_id, (_, at) in finished.items()
+            ]),
+            'job_latency': histogram_quantiles(
+                samples, 'tubedlapi_job_seconds', status='completed',
+            ),
+            'queue_wait': histogram_quantiles(
+                samples, 'tubedlapi_job_status_seconds', status='queued',
+            ),
+            'stages': {
+                status: histogram_quantiles(
+                    samples, 'tubedlapi_job_status_seconds', status=status,
+                )
+                for status in ('processing', 'finished', 'uploading')
+            },
+            'upload': histogram_quantiles(
+                samples, 'tubedlapi_upload_seconds', destination='bench',
+            ),
+            'peak_rss_bytes': self.api.peak_rss() or self.peak_rss,
+            'media': self.media.stats(),
+        }
+
+
+def run(concurrency: Tuple[int, ...]=(10, 100, 1000), jobs: int=0, rate: float=0.0,
+        size: int=256 * 1024, latency: float=0.0, bandwidth: int=0, timeout: float=600.0,
+        env: Dict[str, str]=None) -> dict:
+    ''' Runs one load test per level in `concurrency`. `jobs` is the
+        number of jobs per level, twice the level (and at least 50)
+        when 0.
+    '''
+
+    results = {}
+    media = stubs.MediaServer(size=size, latency=latency, bandwidth=bandwidth).start()
+
+    try:
+        for level in concurrency:
+            workdir = tempfile.mkdtemp(prefix='tubedlapi-load-')
+            api = APIServer(workdir, env or {})
+            try:
+                api.start()
+                load = LoadRun(
+                    api, media, level, jobs or max(50, 2 * level), rate, timeout,
+                )
+                load.setup(workdir)
+                results[f'concurrency/{level}'] = load.run()
+            finally:
+                api.stop()
+                shutil.rmtree(workdir, ignore_errors=True)
+    finally:
+        media.stop()
+
+    return common.make_report(
+        'loadtest',
+        {
+            'concurrency': list(concurrency),
+            'jobs': jobs,
+            'rate': rate,
+            'size': size,
+            'latency': latency,
+            'bandwidth': bandwidth,
+            'env': env or {},
+        },
+        results,
+    )
+
+
+def _parse_env(ctx: click.Context, param: click.Parameter, values: Tuple[str, ...]) -> dict:
+
+    env = {}
+    for value in values:
+        key, sep, setting = value.partition('=')
+        if not sep:
+            raise click.BadParameter(f'expected KEY=VALUE, got `{value}`')
+        env[key] = setting
+
+    return env
+
+
+@click.command()
+@click.option('--concurrency', '-c', multiple=True, type=int,
+              help='Jobs in flight; repeat for several levels [default: 10, 100, 1000]')
+@click.option('--jobs', default=0, help='Jobs per level [default: 2x concurrency, at least 50]')
+@click.option('--rate', default=0.0, help='Jobs submitted per second, 0 for no limit')
+@click.option('--size', default=256 * 1024, help='Media size in bytes')
+@click.option('--latency', default=0.0, help='Seconds before the media server responds')
+@click.option('--bandwidth', default=0, help='Media server bytes per second, 0 for no limit')
+@click.option('--timeout', default=600.0, help='Seconds to wait for each level')
+@click.option('--env', multiple=True, callback=_parse_env,
+              help='KEY=VALUE setting for the server (repeatable)')
+@common.output_option
+def main(concurrency: tuple, jobs: int, rate: float, size: int, latency: float,
+         bandwidth: int, timeout: float, env: dict, output: str):
+
+    common.emit(
+        run(
+            concurrency=concurrency or (10, 100, 1000),
+            jobs=jobs,
+            rate=rate,
+            size=size,
+            latency=latency,
+            bandwidth=bandwidth,
+            timeout=timeout,
+            env=env,
+        ),
+        output,
+    )
+
+
+if __name__ == '__main__':
+    main()
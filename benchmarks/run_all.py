@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+''' Runs every benchmark in one process and writes one JSON report,
+    which `compare.py` can check against a previous run.
+
+        python benchmarks/run_all.py -o results.json
+        python benchmarks/run_all.py --quick -o results.json
+'''
+
+import click
+
+import bench_crypto
+import bench_fields
+import bench_jobs
+import bench_pipeline
+import bench_routes
+import common
+
+SUITES = {
+    'crypto': (bench_crypto.run, {}, {'rows': 20}),
+    'fields': (bench_fields.run, {}, {'number': 20, 'repeat': 3, 'rows': 20}),
+    'jobs': (bench_jobs.run, {}, {'number': 20, 'repeat': 3}),
+    'routes': (bench_routes.run, {}, {'number': 5, 'repeat': 3, 'rows': 20}),
+    'pipeline': (bench_pipeline.run, {}, {'jobs': 4, 'rounds': 1, 'size': 64 * 1024}),
+}
+
+
+@click.command()
+@click.option('--only', multiple=True, type=click.Choice(sorted(SUITES)),
+              help='Run only these benchmarks (repeatable)')
+@click.option('--quick', is_flag=True, help='Smaller sizes, for a smoke test')
+@common.output_option
+def main(only: tuple, quick: bool, output: str):
+
+    reports = []
+    for name, (run, params, quick_params) in SUITES.items():
+        if only and name not in only:
+            continue
+
+        click.echo(f'running {name}', err=True)
+        reports.append(run(**(quick_params if quick else params)))
+
+    combined = common.make_report(
+        'all',
+        {'only': list(only), 'quick': quick},
+        {report['benchmark']: report for report in reports},
+    )
+
+    if output:
+        common.emit(combined, output)
+
+    if output != '-':
+        for report in reports:
+            common.emit(report)
+
+
+if __name__ == '__main__':
+    main()
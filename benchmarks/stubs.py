@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+''' A local media server and a youtube-dl extractor for it, so the
+    pipeline can be run end to end without touching the network.
+
+    `bench://<host>:<port>/<id>` urls resolve to `<id>.mp4` on the
+    media server at `<host>:<port>`. The extractor is added to the
+    application with `EXTRA_EXTRACTORS=stubs:BenchIE`, with this
+    directory on `PYTHONPATH`.
+'''
+
+import hashlib
+import logging
+import re
+import threading
+import time
+from http.server import (
+    BaseHTTPRequestHandler,
+    HTTPServer,
+)
+from socketserver import ThreadingMixIn
+
+from youtube_dl.extractor.common import InfoExtractor
+
+log = logging.getLogger(__name__)
+
+EXTRACTOR = 'stubs:BenchIE'
+
+
+class BenchIE(InfoExtractor):
+
+    IE_NAME = 'bench'
+    _VALID_URL = r'bench://(?P<host>[^/]+)/(?P<id>[\w-]+)'
+
+    def _real_extract(self, url: str) -> dict:
+
+        mobj = re.match(self._VALID_URL, url)
+        video_id = mobj.group('id')
+
+        return {
+            'id': video_id,
+            'title': f'Benchmark video {video_id}',
+            'url': f"http://{mobj.group('host')}/{video_id}.mp4",
+            'ext': 'mp4',
+            'format_id': 'bench',
+        }
+
+
+def media_bytes(name: str, size: int) -> bytes:
+    ''' Deterministic content for `name`, distinct for every name so
+        downloads are never deduplicated by content.
+    '''
+
+    block = hashlib.sha256(name.encode('utf-8')).digest() * 2048
+    return (block * (size // len(block) + 1))[:size]
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+class MediaServer(object):
+    ''' Serves `size` bytes of media for any path, on a free local
+        port, from a background thread. Each response starts after
+        `latency` seconds, and is sent at up to `bandwidth` bytes per
+        second if given.
+    '''
+
+    chunk_size = 64 * 1024
+
+    def __init__(self, size: int=1024 * 1024, latency: float=0.0, bandwidth: int=0,
+                 host: str='127.0.0.1') -> None:
+
+        self.size = size
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.requests = 0
+        self.bytes_sent = 0
+
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            protocol_version = 'HTTP/1.1'
+
+            def do_HEAD(self) -> None:
+
+                self._send_headers()
+
+            def do_GET(self) -> None:
+
+                if server.latency:
+                    time.sleep(server.latency)
+
+                self._send_headers()
+                server.send_body(self.wfile, media_bytes(self.path, server.size))
+
+            def _send_headers(self) -> None:
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'video/mp4')
+                self.send_header('Content-Length', str(server.size))
+                self.end_headers()
+
+            def log_message(self, format: str, *args) -> None:
+
+                log.debug(format, *args)
+
+        self._server = _Server((host, 0), Handler)
+        self._thread = threading.Thread(
+            target=self._server.serve_forever,
+            name='bench-media',
+            daemon=True,
+        )
+
+    def send_body(self, wfile, body: bytes) -> None:
+
+        with self._lock:
+            self.requests += 1
+
+        for offset in range(0, len(body), self.chunk_size):
+            chunk = body[offset:offset + self.chunk_size]
+            wfile.write(chunk)
+
+            with self._lock:
+                self.bytes_sent += len(chunk)
+
+            if self.bandwidth:
+                time.sleep(len(chunk) / self.bandwidth)
+
+    @property
+    def address(self) -> str:
+
+        host, port = self._server.server_address
+        return f'{host}:{port}'
+
+    def url(self, video_id: str) -> str:
+        ''' The `bench://` url of video `video_id` on this server.
+        '''
+
+        return f'bench://{self.address}/{video_id}'
+
+    def start(self) -> 'MediaServer':
+
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self) -> dict:
+
+        return {
+            'requests': self.requests,
+            'bytes_sent': self.bytes_sent,
+        }
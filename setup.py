@@ -31,7 +31,7 @@ setup(
     },
     entry_points={
         'console_scripts': [
-            'tubedlapi = tubedlapi.app:run',
+            'tubedlapi = tubedlapi.cmd.main:cli',
         ],
         'flask.commands': [
             'make-secret = tubedlapi.cmd.crypto:cli_make_secret',
@@ -1,6 +1,11 @@
 # -*- coding: utf-8 -*-
 
 import logging
+import threading
+from typing import (
+    Callable,
+    Iterable,
+)
 
 import flask
 from diecast.inject import make_injector
@@ -8,53 +13,130 @@ from diecast.registry import ComponentRegistry
 from diecast.types import Injector
 
 from tubedlapi.components import (
+    artifacts,
+    cancel,
     crypto,
     database,
+    dlpool,
+    events,
     flasgger,
+    fspool,
+    infocache,
     jobexec,
+    limits,
+    metrics,
+    procpool,
+    profiles,
+    progress,
     sentry,
     settings as app_settings,
 )
+from tubedlapi.util.timing import PhaseTimer
 
 registry = ComponentRegistry()
 inject: Injector = make_injector(registry)
 
+log = logging.getLogger(__name__)
 
-def main() -> flask.Flask:
 
-    from tubedlapi.routes import (
-        destination,
-        job,
-        profile,
+def init_components(timer: PhaseTimer=None) -> PhaseTimer:
+    ''' Registers the components shared by the API and
+        the `tubedlapi worker` process.
+
+        Each component is initialized right away, in its own phase
+        of `timer`, so the cost of startup shows up in one place.
+    '''
+
+    timer = timer or PhaseTimer()
+
+    # Register initial component dependencies
+    with timer.phase('settings'):
+        registry.add(**app_settings.component)
+
+        # Grab the settings component for logging setup
+        settings = registry[app_settings.Settings]
+        logging.basicConfig(
+            level=settings.LOG_LEVEL,
+            format='%(levelname)-8s | %(name)12s | %(message)s',
+            handlers=[
+                logging.StreamHandler(),
+            ],
+        )
+
+    # Initialize the remaining components. The fetch process pool
+    # comes first, so its processes are forked before any other
+    # component has started a thread or opened a connection.
+    components = (
+        ('procpool', procpool.component),
+        ('metrics', metrics.component),
+        ('artifacts', artifacts.component),
+        ('cancel', cancel.component),
+        ('crypto', crypto.component),
+        ('crypto.cache', crypto.cache_component),
+        ('database', database.component),
+        ('dlpool', dlpool.component),
+        ('events', events.component),
+        ('fspool', fspool.component),
+        ('infocache', infocache.component),
+        ('jobexec', jobexec.component),
+        ('limits', limits.component),
+        ('profiles', profiles.component),
+        ('progress', progress.component),
+    )
+    for name, component in components:
+        with timer.phase(name):
+            registry.add(**component)
+            registry[component['cls']]
+
+    registry.add(
+        PhaseTimer,
+        init=lambda: timer,
+        persist=True,
     )
 
+    return timer
+
+
+def main() -> flask.Flask:
+    ''' Application factory. Nothing is initialized until
+        this is called.
+    '''
+
+    timer = PhaseTimer()
+
+    with timer.phase('routes'):
+        from tubedlapi.routes import (
+            destination,
+            job,
+            metrics as metrics_routes,
+            profile,
+            status,
+        )
+
     blueprints = [
         destination.blueprint,
         job.blueprint,
+        metrics_routes.blueprint,
         profile.blueprint,
+        status.blueprint,
     ]
 
-    # Register initial component dependencies
-    registry.add(**app_settings.component)
+    init_components(timer)
 
-    # Grab the settings component for logging setup
-    settings = registry[app_settings.Settings]
-    logging.basicConfig(
-        level=settings.LOG_LEVEL,
-        format='%(levelname)-8s | %(name)12s | %(message)s',
-        handlers=[
-            logging.StreamHandler(),
-        ],
-    )
-
-    # Initialize the remaining components
-    registry.add(**crypto.component)
-    registry.add(**database.component)
-    registry.add(**jobexec.component)
+    # Downloaders are created in the background, while startup goes on
+    with timer.phase('prewarm'):
+        from tubedlapi.exec.youtubedl import prewarm_downloaders
+        prewarm_downloaders()
 
     # Set up the application and register route blueprints
-    app = flask.Flask(__name__)
-    [app.register_blueprint(blueprint) for blueprint in blueprints]
+    with timer.phase('app'):
+        from tubedlapi.model import close_connection
+
+        app = flask.Flask(__name__)
+        [app.register_blueprint(blueprint) for blueprint in blueprints]
+
+        # Each request gives its database connection back when it ends
+        app.teardown_request(close_connection)
 
     # Register Flask app as a component
     registry.add(
@@ -64,22 +146,75 @@ def main() -> flask.Flask:
     )
 
     # Register flask extension components only after app creation!
-    registry.add(**sentry.component)
-    registry.add(**flasgger.component)
+    with timer.phase('sentry'):
+        registry.add(**sentry.component)
+        registry[sentry.component['cls']]
+
+    with timer.phase('flasgger'):
+        registry.add(**flasgger.component)
+        registry[flasgger.component['cls']]
+
+    timer.log('startup')
 
     return app
 
 
-@inject
-def run(settings: app_settings.Settings):
+def run():
 
     app = main()
+    settings = registry[app_settings.Settings]
     app.run(
         debug=settings.DEBUG,
         host=settings.HOST,
         port=settings.PORT,
+        threaded=True,
     )
 
 
+class LazyWSGIApp(object):
+    ''' WSGI callable which creates the app with `factory` when
+        it handles its first request, rather than on import.
+
+        Call `load` from a worker start hook (gunicorn's
+        `post_worker_init`) to create the app before the worker
+        accepts requests, so the first request does not wait for it.
+        With `FETCH_MODE=process` this is required: the fetch processes
+        are forked while the app is created, which must not happen on
+        a request thread while other server threads are running.
+    '''
+
+    def __init__(self, factory: Callable[[], flask.Flask]) -> None:
+
+        self.factory = factory
+        self.app: flask.Flask = None
+        self._lock = threading.Lock()
+
+    def load(self) -> flask.Flask:
+        ''' Creates the app, unless it was created already.
+        '''
+
+        if self.app is None:
+            with self._lock:
+                if self.app is None:
+                    self.app = self.factory()
+
+        return self.app
+
+    def __call__(self, environ: dict, start_response: Callable) -> Iterable[bytes]:
+
+        if self.app is None:
+            self.load()
+
+            pool_cls = procpool.component['cls']
+            if pool_cls in registry and registry[pool_cls].started:
+                log.warning(
+                    'fetch processes were forked while handling a request; with '
+                    'FETCH_MODE=process, call `wsgi.load()` from a worker start hook '
+                    'or use the `tubedlapi.app:main()` factory',
+                )
+
+        return self.app(environ, start_response)
+
+
 # WSGI Entrypoint
-wsgi = main()
+wsgi = LazyWSGIApp(main)
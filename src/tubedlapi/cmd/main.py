@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+
+import click
+
+
+@click.group(invoke_without_command=True)
+@click.pass_context
+def cli(ctx: click.Context):
+    ''' RESTful API around youtube-dl.
+
+        Runs the development server when no command is given.
+    '''
+
+    if ctx.invoked_subcommand is None:
+        from tubedlapi.app import run
+        run()
+
+
+@cli.command('worker')
+def cli_worker():
+    ''' Run jobs from the database job queue (env:JOB_QUEUE=database).
+    '''
+
+    from tubedlapi.app import (
+        init_components,
+        registry,
+    )
+    from tubedlapi.components.settings import Settings
+
+    timer = init_components()
+
+    settings = registry[Settings]
+
+    with timer.phase('worker'):
+        from tubedlapi.exec.worker import Worker
+        worker = Worker(settings)
+
+    if settings.METRICS and settings.METRICS_WORKER_PORT:
+        from tubedlapi.util import metrics
+        from tubedlapi.util.async import JobExecutor
+
+        executor = registry[JobExecutor]
+        service_metrics = registry[metrics.Metrics]
+        metrics.serve(
+            lambda: service_metrics.render(executor.stats()),
+            settings.HOST,
+            settings.METRICS_WORKER_PORT,
+        )
+
+    timer.log('worker startup')
+    worker.run()
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+
+from tubedlapi.components.settings import Settings
+from tubedlapi.util.retention import ArtifactRetention
+
+
+def make_artifact_retention(settings: Settings) -> ArtifactRetention:
+    ''' Component initializer for the retention limits of artifacts.
+    '''
+
+    return ArtifactRetention(
+        max_age=settings.ARTIFACT_MAX_AGE,
+        max_size=settings.ARTIFACT_MAX_SIZE,
+        interval=settings.ARTIFACT_SWEEP_INTERVAL,
+    )
+
+
+component = {
+    'cls': ArtifactRetention,
+    'init': make_artifact_retention,
+    'persist': True,
+}
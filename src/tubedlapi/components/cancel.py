@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+from tubedlapi.components.settings import Settings
+from tubedlapi.util.cancel import CancelRegistry
+from tubedlapi.util.procpool import RelayProcessPool
+
+
+def make_cancel_registry(settings: Settings, procs: RelayProcessPool) -> CancelRegistry:
+    ''' Component initializer for the job cancellation flags. Jobs
+        cancelled through another process are found in the database,
+        and fetches running in a fetch process are flagged through
+        the pool.
+    '''
+
+    # Imported here, as models are loaded after the components
+    from tubedlapi.model.job import Job
+
+    cancels = CancelRegistry(
+        lookup=Job.is_cancelled if settings.CANCEL_CHECK_INTERVAL > 0 else None,
+        lookup_interval=settings.CANCEL_CHECK_INTERVAL,
+    )
+    cancels.add_listener(lambda job_id: procs.cancel(job_id.hex))
+
+    return cancels
+
+
+component = {
+    'cls': CancelRegistry,
+    'init': make_cancel_registry,
+    'persist': True,
+}
@@ -4,18 +4,20 @@ import logging
 
 from tubedlapi.components import settings as app_settings
 from tubedlapi.util import crypto
+from tubedlapi.util.metrics import Metrics
 
 log = logging.getLogger(__name__)
 
 
-def make_crypt_provider(settings: app_settings.Settings) -> crypto.CryptoProvider:
+def make_crypt_provider(settings: app_settings.Settings,
+                        metrics: Metrics) -> crypto.CryptoProvider:
     ''' Component initializer for CryptoProvider.
     '''
 
     if not settings.CRYPTO_SALT:
         log.warning(
-            'env:CRYPTO_SALT is None -- this can cause unexpected behaviour '
-            'due to regeneration of salt on each initialization of CryptoProvider'
+            'env:CRYPTO_SALT is None -- a random salt will be generated and '
+            'blobs encrypted by this process will be unreadable after a restart'
         )
         salt = None
     else:
@@ -25,11 +27,26 @@ def make_crypt_provider(settings: app_settings.Settings) -> crypto.CryptoProvide
         secret=settings.crypto_secret_bytes,
         iterations=settings.CRYPTO_KDF_ITERATIONS,
         salt=salt,
+        previous_salts=settings.crypto_previous_salts_bytes,
+        observer=metrics.observe_crypto if metrics.enabled else None,
     )
 
 
+def make_plaintext_cache(settings: app_settings.Settings) -> crypto.PlaintextCache:
+    ''' Component initializer for PlaintextCache.
+    '''
+
+    return crypto.PlaintextCache(maxsize=settings.CRYPTO_CACHE_SIZE)
+
+
 component = {
     'cls': crypto.CryptoProvider,
     'init': make_crypt_provider,
-    'persist': False,
+    'persist': True,
+}
+
+cache_component = {
+    'cls': crypto.PlaintextCache,
+    'init': make_plaintext_cache,
+    'persist': True,
 }
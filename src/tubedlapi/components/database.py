@@ -4,13 +4,19 @@ import peewee
 
 from tubedlapi.components import settings as app_settings
 from tubedlapi.model import init_database_from_uri
+from tubedlapi.util.metrics import Metrics
 
 
-def init_database_with_settings(settings: app_settings.Settings) -> peewee.Proxy:
+def init_database_with_settings(settings: app_settings.Settings,
+                                metrics: Metrics) -> peewee.Proxy:
     ''' Component initializer for a peewee.Proxy
     '''
 
-    return init_database_from_uri(settings.DATABASE_URI)
+    return init_database_from_uri(
+        settings.DATABASE_URI,
+        settings.database_options,
+        query_observer=metrics.observe_query if metrics.enabled else None,
+    )
 
 
 component = {
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+
+from tubedlapi.components.settings import Settings
+from tubedlapi.util.dlpool import YoutubeDLPool
+
+
+def make_downloader_pool(settings: Settings) -> YoutubeDLPool:
+    ''' Component initializer for YoutubeDLPool.
+    '''
+
+    return YoutubeDLPool(
+        max_idle=settings.DOWNLOADER_POOL_SIZE,
+        extractors=settings.EXTRA_EXTRACTORS,
+    )
+
+
+component = {
+    'cls': YoutubeDLPool,
+    'init': make_downloader_pool,
+    'persist': True,
+}
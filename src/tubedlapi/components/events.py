@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+
+from tubedlapi.components.settings import Settings
+from tubedlapi.util.pubsub import PubSub
+
+
+def make_event_hub(settings: Settings) -> PubSub:
+    ''' Component initializer for the job event hub.
+    '''
+
+    return PubSub(maxsize=settings.EVENTS_QUEUE_SIZE)
+
+
+component = {
+    'cls': PubSub,
+    'init': make_event_hub,
+    'persist': True,
+}
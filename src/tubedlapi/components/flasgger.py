@@ -1,14 +1,59 @@
 # -*- coding: utf-8 -*-
 
-import flask
-from flask import request
+import threading
+from typing import TYPE_CHECKING
 
-from flasgger import LazyString, Swagger
+import flask
+from flask import (
+    redirect,
+    request,
+)
 
 from tubedlapi.components.settings import Settings
 
+if TYPE_CHECKING:
+    import flasgger  # noqa: F401
+
+# Paths served by flasgger
+SWAGGER_PATHS = ('/apidocs', '/apispec', '/flasgger_static')
+
+
+class LazySwagger(object):
+    ''' Installs `flasgger` on the app the first time the API docs are
+        requested, so it is not imported while the app starts up.
+    '''
+
+    def __init__(self, app: flask.Flask, template: dict) -> None:
+
+        self.app = app
+        self.template = template
+        self.swagger: 'flasgger.Swagger' = None
+        self._lock = threading.Lock()
+
+        app.before_request(self.before_request)
+
+    def load(self) -> 'flasgger.Swagger':
+
+        with self._lock:
+            if self.swagger is None:
+                from flasgger import Swagger
+                self.swagger = Swagger(self.app, template=self.template)
 
-def init_flasgger(app: flask.Flask, settings: Settings) -> None:
+        return self.swagger
+
+    def before_request(self) -> flask.Response:
+
+        if self.swagger is None and request.path.startswith(SWAGGER_PATHS):
+            self.load()
+
+            # This request was routed before the docs existed, so send
+            # the client back to the same url to be routed again.
+            return redirect(request.url)
+
+        return None
+
+
+def init_flasgger(app: flask.Flask, settings: Settings) -> LazySwagger:
 
     # Disable `flasgger` if settings.SWAGGER is not true
     if not settings.SWAGGER:
@@ -25,11 +70,18 @@ def init_flasgger(app: flask.Flask, settings: Settings) -> None:
         # ),
     }
 
-    return Swagger(app, template=template)
+    swagger = LazySwagger(app, template)
+
+    # The debug server does not allow adding routes once
+    # it has handled a request, so load the docs right away.
+    if settings.DEBUG:
+        swagger.load()
+
+    return swagger
 
 
 component = {
-    'cls': Swagger,
+    'cls': LazySwagger,
     'init': init_flasgger,
     'persist': True,
 }
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+
+from tubedlapi.components.settings import Settings
+from tubedlapi.util.fspool import FSPool
+
+
+def make_fs_pool(settings: Settings) -> FSPool:
+    ''' Component initializer for FSPool.
+    '''
+
+    return FSPool(
+        max_connections=settings.DESTINATION_MAX_CONNECTIONS,
+        idle_timeout=settings.DESTINATION_IDLE_TIMEOUT,
+        check_interval=settings.DESTINATION_CHECK_INTERVAL,
+    )
+
+
+component = {
+    'cls': FSPool,
+    'init': make_fs_pool,
+    'persist': True,
+}
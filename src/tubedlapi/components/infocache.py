@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+
+from tubedlapi.components.settings import Settings
+from tubedlapi.util.infocache import (
+    DiskInfoCache,
+    InfoCache,
+    MemoryInfoCache,
+)
+
+
+def make_info_cache(settings: Settings) -> InfoCache:
+    ''' Component initializer for the extractor info cache.
+    '''
+
+    if settings.INFO_CACHE_BACKEND == 'disk':
+        return DiskInfoCache(
+            path=settings.INFO_CACHE_PATH,
+            maxsize=settings.INFO_CACHE_SIZE,
+            ttl=settings.INFO_CACHE_TTL,
+        )
+    elif settings.INFO_CACHE_BACKEND == 'memory':
+        return MemoryInfoCache(
+            maxsize=settings.INFO_CACHE_SIZE,
+            ttl=settings.INFO_CACHE_TTL,
+        )
+
+    return InfoCache(maxsize=0)
+
+
+component = {
+    'cls': InfoCache,
+    'init': make_info_cache,
+    'persist': True,
+}
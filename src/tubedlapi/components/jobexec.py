@@ -1,9 +1,37 @@
 # -*- coding: utf-8 -*-
 
-from tubedlapi.util.async import JobExecutor
+from tubedlapi.components.settings import Settings
+from tubedlapi.model import connection_scope
+from tubedlapi.util.async import (
+    JobExecutor,
+    STAGE_FETCH,
+    STAGE_POSTPROCESS,
+    STAGE_UPLOAD,
+)
+
+
+def make_job_executor(settings: Settings) -> JobExecutor:
+    ''' Component initializer for JobExecutor.
+    '''
+
+    return JobExecutor(
+        limits={
+            STAGE_FETCH: settings.FETCH_CONCURRENCY,
+            STAGE_UPLOAD: settings.UPLOAD_CONCURRENCY,
+            STAGE_POSTPROCESS: settings.POSTPROCESS_CONCURRENCY,
+        },
+        # Tasks give their database connection back when they finish
+        task_context=connection_scope,
+        scheduling={
+            'weights': settings.SCHEDULER_WEIGHTS,
+            'max_share': settings.SCHEDULER_MAX_SHARE,
+            'background_share': settings.SCHEDULER_BACKGROUND_SHARE,
+        },
+    )
+
 
 component = {
     'cls': JobExecutor,
-    'init': lambda: JobExecutor(),
+    'init': make_job_executor,
     'persist': True,
 }
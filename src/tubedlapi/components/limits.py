@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+
+from tubedlapi.components.settings import Settings
+from tubedlapi.util.ratelimit import FetchLimits
+
+
+def make_fetch_limits(settings: Settings) -> FetchLimits:
+    ''' Component initializer for the per-host and per-extractor
+        fetch limits.
+    '''
+
+    return FetchLimits(specs=settings.FETCH_LIMITS)
+
+
+component = {
+    'cls': FetchLimits,
+    'init': make_fetch_limits,
+    'persist': True,
+}
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+
+from tubedlapi.components.settings import Settings
+from tubedlapi.util.metrics import Metrics
+
+
+def make_metrics(settings: Settings) -> Metrics:
+    ''' Component initializer for the service metrics.
+    '''
+
+    return Metrics(enabled=settings.METRICS)
+
+
+component = {
+    'cls': Metrics,
+    'init': make_metrics,
+    'persist': True,
+}
@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+
+from tubedlapi.components.settings import Settings
+from tubedlapi.util.procpool import RelayProcessPool
+
+
+def make_process_pool(settings: Settings) -> RelayProcessPool:
+    ''' Component initializer for the fetch process pool.
+    '''
+
+    pool = RelayProcessPool(max_workers=settings.FETCH_CONCURRENCY)
+    if settings.FETCH_MODE == 'process':
+        pool.start()
+
+    return pool
+
+
+component = {
+    'cls': RelayProcessPool,
+    'init': make_process_pool,
+    'persist': True,
+}
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+
+from tubedlapi.components.settings import Settings
+from tubedlapi.model.profile import ProfileCache
+
+
+def make_profile_cache(settings: Settings) -> ProfileCache:
+    ''' Component initializer for the profile cache.
+    '''
+
+    return ProfileCache(check_interval=settings.PROFILE_CACHE_CHECK_INTERVAL)
+
+
+component = {
+    'cls': ProfileCache,
+    'init': make_profile_cache,
+    'persist': True,
+}
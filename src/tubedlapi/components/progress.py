@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+
+from tubedlapi.components.settings import Settings
+from tubedlapi.exec.progress import ProgressBuffer
+
+
+def make_progress_buffer(settings: Settings) -> ProgressBuffer:
+    ''' Component initializer for ProgressBuffer.
+    '''
+
+    return ProgressBuffer(interval=settings.PROGRESS_FLUSH_INTERVAL)
+
+
+component = {
+    'cls': ProgressBuffer,
+    'init': make_progress_buffer,
+    'persist': True,
+}
@@ -1,27 +1,36 @@
 # -*- coding: utf-8 -*-
 
 import logging
-import pkg_resources
 import typing
 
 from flask import Flask
-try:
-    from raven.contrib.flask import Sentry
-    from raven.transport import Transport, default_transports
-except ImportError:
-    Sentry = None
-    Transport = None
-    default_transports = []
 
 from tubedlapi.components import settings as app_settings
 
+if typing.TYPE_CHECKING:
+    import raven.contrib.flask  # noqa: F401
+
 log = logging.getLogger(__name__)
 
 
+class SentryExtension(object):
+    ''' Holds the `raven` Flask extension.
+
+        `raven` (and `pkg_resources`, for the release version) are
+        only imported when a Sentry DSN is configured.
+    '''
+
+    def __init__(self, client: 'raven.contrib.flask.Sentry'=None) -> None:
+
+        self.client = client
+
+
 def get_package_version() -> str:
     ''' Retrieves the package version from the registered egg.
     '''
 
+    import pkg_resources
+
     try:
         package = pkg_resources.require('tubedlapi')
         return package[0].version
@@ -31,44 +40,48 @@ def get_package_version() -> str:
         return 'source'
 
 
-def get_transport_class(name: str) -> typing.Type[Transport]:
+def get_transport_class(name: str) -> typing.Type['raven.transport.Transport']:
     ''' Given the name of a transport class, find it and
         return the class object for use with the Sentry client.
     '''
 
+    from raven.transport import default_transports
+
     return list(filter(
         lambda t: t.__name__ == name,
         default_transports,
     ))[0]
 
 
-def init_sentry(app: Flask, settings: app_settings.Settings) -> Sentry:
+def init_sentry(app: Flask, settings: app_settings.Settings) -> SentryExtension:
     ''' Initializes the Sentry DSN for Flask, if configured.
     '''
 
-    if not Sentry:
-        log.info('`raven.contrib.flask.Sentry` could not be imported -- is it installed?')
-        return None
+    if not settings.SENTRY_URL:
+        return SentryExtension()
 
-    if settings.SENTRY_URL:
-        app.config['SENTRY_CONFIG'] = {
-            'release': get_package_version(),
-            'environment': settings.environment,
-            'transport': get_transport_class(settings.SENTRY_TRANSPORT),
-        }
+    try:
+        from raven.contrib.flask import Sentry
+    except ImportError:
+        log.info('`raven.contrib.flask.Sentry` could not be imported -- is it installed?')
+        return SentryExtension()
 
-        return Sentry(
-            app=app,
-            dsn=settings.SENTRY_URL,
-            logging=True,
-            level=settings.SENTRY_LOG_LEVEL,
-        )
+    app.config['SENTRY_CONFIG'] = {
+        'release': get_package_version(),
+        'environment': settings.environment,
+        'transport': get_transport_class(settings.SENTRY_TRANSPORT),
+    }
 
-    return None
+    return SentryExtension(Sentry(
+        app=app,
+        dsn=settings.SENTRY_URL,
+        logging=True,
+        level=settings.SENTRY_LOG_LEVEL,
+    ))
 
 
 component = {
-    'cls': Sentry,
+    'cls': SentryExtension,
     'init': init_sentry,
     'persist': True,
 }
@@ -4,7 +4,11 @@ import base64
 import binascii
 import logging
 import os
-from typing import Type
+from typing import (
+    Dict,
+    List,
+    Type,
+)
 
 from diecast.component import Component
 
@@ -13,18 +17,66 @@ log = logging.getLogger(__name__)
 
 class Settings(Component):
 
+    ARTIFACT_DEDUP: bool = True
+    ARTIFACT_MAX_AGE: float = 7 * 24 * 3600.0
+    ARTIFACT_MAX_SIZE: int = 10 * 1024 * 1024 * 1024
+    ARTIFACT_SWEEP_INTERVAL: float = 300.0
+    CANCEL_CHECK_INTERVAL: float = 2.0
+    CRYPTO_CACHE_SIZE: int = 1024
+    CRYPTO_PREVIOUS_SALTS: List[str] = []
     CRYPTO_SALT: str = None
     CRYPTO_SECRET: str = None
     CRYPTO_KDF_ITERATIONS: int = 10000
+    DATABASE_BUSY_TIMEOUT: float = 5.0
+    DATABASE_JOURNAL_MODE: str = 'wal'
+    DATABASE_MAX_CONNECTIONS: int = 20
+    DATABASE_MMAP_SIZE: int = 64 * 1024 * 1024
+    DATABASE_STALE_TIMEOUT: float = 300.0
+    DATABASE_SYNCHRONOUS: str = 'normal'
     DATABASE_URI: str = 'sqlite:///:memory:'
     DEBUG: bool = False
+    DESTINATION_CHECK_INTERVAL: float = 30.0
+    DESTINATION_IDLE_TIMEOUT: float = 300.0
+    DESTINATION_MAX_CONNECTIONS: int = 4
+    DOWNLOADER_POOL_SIZE: int = 4
+    DOWNLOADER_PREWARM: int = 1
+    EVENTS_KEEPALIVE_INTERVAL: float = 15.0
+    EVENTS_QUEUE_SIZE: int = 100
+    EXTRA_EXTRACTORS: List[str] = []
+    FETCH_CONCURRENCY: int = 4
+    FETCH_LIMITS: Dict[str, str] = {}
+    FETCH_MODE: str = 'thread'
     HOST: str = 'localhost'
+    INFO_CACHE_BACKEND: str = 'memory'
+    INFO_CACHE_PATH: str = None
+    INFO_CACHE_SIZE: int = 256
+    INFO_CACHE_TTL: float = 1800.0
+    JOB_QUEUE: str = 'local'
     LOG_LEVEL: int = logging.INFO
+    METRICS: bool = True
+    METRICS_WORKER_PORT: int = 0
+    PLAYLIST_FANOUT: bool = True
     PORT: int = 5000
+    POSTPROCESS_CONCURRENCY: int = 2
+    PROFILE_CACHE_CHECK_INTERVAL: float = 5.0
+    PROGRESS_FLUSH_INTERVAL: float = 1.0
+    QUEUE_LEASE_SECONDS: int = 300
+    QUEUE_MAX_ATTEMPTS: int = 3
+    SCHEDULER_BACKGROUND_SHARE: float = 0.75
+    SCHEDULER_CLIENT_HEADER: str = 'X-Client-Id'
+    SCHEDULER_MAX_SHARE: float = 1.0
+    SCHEDULER_TENANT: str = 'client'
+    SCHEDULER_WEIGHTS: Dict[str, float] = {}
     SENTRY_LOG_LEVEL: int = logging.WARNING
     SENTRY_TRANSPORT: str = 'HTTPTransport'
     SENTRY_URL: str = None
     SWAGGER: bool = True
+    UPLOAD_BUFFER_SIZE: int = 1024 * 1024
+    UPLOAD_BUFFER_SIZES: Dict[str, int] = {}
+    UPLOAD_CONCURRENCY: int = 8
+    UPLOAD_RESUME: bool = True
+    WORKER_CONCURRENCY: int = 4
+    WORKER_POLL_INTERVAL: float = 1.0
 
     @classmethod
     def init(cls: Type[Component]):
@@ -42,18 +94,172 @@ class Settings(Component):
         this.PORT = int(os.getenv('PORT', Settings.PORT))
         this.SWAGGER = str(os.getenv('SWAGGER', Settings.SWAGGER)).lower() == 'true'
 
+        # Database connection settings, which the DB URI's query string overrides
+        this.DATABASE_MAX_CONNECTIONS = _env_int(
+            'DB_MAX_CONNECTIONS',
+            Settings.DATABASE_MAX_CONNECTIONS,
+        )
+        this.DATABASE_STALE_TIMEOUT = _env_float(
+            'DB_STALE_TIMEOUT',
+            Settings.DATABASE_STALE_TIMEOUT,
+        )
+        this.DATABASE_BUSY_TIMEOUT = _env_float('DB_BUSY_TIMEOUT', Settings.DATABASE_BUSY_TIMEOUT)
+        this.DATABASE_JOURNAL_MODE = os.getenv(
+            'DB_JOURNAL_MODE',
+            Settings.DATABASE_JOURNAL_MODE,
+        ).lower()
+        this.DATABASE_SYNCHRONOUS = os.getenv(
+            'DB_SYNCHRONOUS',
+            Settings.DATABASE_SYNCHRONOUS,
+        ).lower()
+        this.DATABASE_MMAP_SIZE = _env_int('DB_MMAP_SIZE', Settings.DATABASE_MMAP_SIZE)
+
         # Crypto settings
         this.CRYPTO_SECRET = os.getenv('CRYPTO_SECRET')
         this.CRYPTO_SALT = os.getenv('CRYPTO_SALT')
+        this.CRYPTO_PREVIOUS_SALTS = [
+            salt.strip() for salt in os.getenv('CRYPTO_PREVIOUS_SALTS', '').split(',')
+            if salt.strip()
+        ]
+
+        this.CRYPTO_KDF_ITERATIONS = _env_int(
+            'CRYPTO_KDF_ITERATIONS',
+            Settings.CRYPTO_KDF_ITERATIONS,
+        )
+        this.CRYPTO_CACHE_SIZE = _env_int('CRYPTO_CACHE_SIZE', Settings.CRYPTO_CACHE_SIZE)
+
+        # Pipeline stage settings
+        this.FETCH_CONCURRENCY = _env_int('FETCH_CONCURRENCY', Settings.FETCH_CONCURRENCY)
+        this.FETCH_MODE = os.getenv('FETCH_MODE', Settings.FETCH_MODE).lower()
+        this.UPLOAD_CONCURRENCY = _env_int('UPLOAD_CONCURRENCY', Settings.UPLOAD_CONCURRENCY)
+        this.POSTPROCESS_CONCURRENCY = _env_int(
+            'POSTPROCESS_CONCURRENCY',
+            Settings.POSTPROCESS_CONCURRENCY,
+        )
+
+        this.ARTIFACT_DEDUP = _env_bool('ARTIFACT_DEDUP', Settings.ARTIFACT_DEDUP)
+        this.ARTIFACT_MAX_AGE = _env_float('ARTIFACT_MAX_AGE', Settings.ARTIFACT_MAX_AGE)
+        this.ARTIFACT_MAX_SIZE = _env_int('ARTIFACT_MAX_SIZE', Settings.ARTIFACT_MAX_SIZE)
+        this.ARTIFACT_SWEEP_INTERVAL = _env_float(
+            'ARTIFACT_SWEEP_INTERVAL',
+            Settings.ARTIFACT_SWEEP_INTERVAL,
+        )
+        this.CANCEL_CHECK_INTERVAL = _env_float(
+            'CANCEL_CHECK_INTERVAL',
+            Settings.CANCEL_CHECK_INTERVAL,
+        )
+        this.PLAYLIST_FANOUT = _env_bool('PLAYLIST_FANOUT', Settings.PLAYLIST_FANOUT)
+        this.EXTRA_EXTRACTORS = [
+            path.strip() for path in os.getenv('EXTRA_EXTRACTORS', '').split(',')
+            if path.strip()
+        ]
+        this.DOWNLOADER_POOL_SIZE = _env_int(
+            'DOWNLOADER_POOL_SIZE',
+            Settings.DOWNLOADER_POOL_SIZE,
+        )
+        this.DOWNLOADER_PREWARM = _env_int('DOWNLOADER_PREWARM', Settings.DOWNLOADER_PREWARM)
+        this.PROFILE_CACHE_CHECK_INTERVAL = _env_float(
+            'PROFILE_CACHE_CHECK_INTERVAL',
+            Settings.PROFILE_CACHE_CHECK_INTERVAL,
+        )
+        this.PROGRESS_FLUSH_INTERVAL = _env_float(
+            'PROGRESS_FLUSH_INTERVAL',
+            Settings.PROGRESS_FLUSH_INTERVAL,
+        )
+
+        # Metrics settings
+        this.METRICS = _env_bool('METRICS', Settings.METRICS)
+        this.METRICS_WORKER_PORT = _env_int('METRICS_WORKER_PORT', Settings.METRICS_WORKER_PORT)
+
+        # Job event stream settings
+        this.EVENTS_KEEPALIVE_INTERVAL = _env_float(
+            'EVENTS_KEEPALIVE_INTERVAL',
+            Settings.EVENTS_KEEPALIVE_INTERVAL,
+        )
+        this.EVENTS_QUEUE_SIZE = _env_int('EVENTS_QUEUE_SIZE', Settings.EVENTS_QUEUE_SIZE)
+
+        # Extractor info cache settings
+        this.INFO_CACHE_BACKEND = os.getenv(
+            'INFO_CACHE_BACKEND',
+            Settings.INFO_CACHE_BACKEND,
+        ).lower()
+        this.INFO_CACHE_PATH = os.getenv('INFO_CACHE_PATH', Settings.INFO_CACHE_PATH)
+        this.INFO_CACHE_SIZE = _env_int('INFO_CACHE_SIZE', Settings.INFO_CACHE_SIZE)
+        this.INFO_CACHE_TTL = _env_float('INFO_CACHE_TTL', Settings.INFO_CACHE_TTL)
+
+        # Destination connection pool settings
+        this.DESTINATION_MAX_CONNECTIONS = _env_int(
+            'DESTINATION_MAX_CONNECTIONS',
+            Settings.DESTINATION_MAX_CONNECTIONS,
+        )
+        this.DESTINATION_IDLE_TIMEOUT = _env_float(
+            'DESTINATION_IDLE_TIMEOUT',
+            Settings.DESTINATION_IDLE_TIMEOUT,
+        )
+        this.DESTINATION_CHECK_INTERVAL = _env_float(
+            'DESTINATION_CHECK_INTERVAL',
+            Settings.DESTINATION_CHECK_INTERVAL,
+        )
+
+        # Upload settings
+        this.UPLOAD_BUFFER_SIZE = _env_int('UPLOAD_BUFFER_SIZE', Settings.UPLOAD_BUFFER_SIZE)
+        this.UPLOAD_BUFFER_SIZES = {}
+        for entry in os.getenv('UPLOAD_BUFFER_SIZES', '').split(','):
+            if not entry.strip():
+                continue
+
+            scheme, _, size = entry.partition('=')
+            try:
+                this.UPLOAD_BUFFER_SIZES[scheme.strip().lower()] = int(size)
+            except ValueError:
+                log.exception(f'env:UPLOAD_BUFFER_SIZES has a malformed entry: {entry}')
+
+        this.UPLOAD_RESUME = _env_bool('UPLOAD_RESUME', Settings.UPLOAD_RESUME)
+
+        # Job queue settings
+        this.JOB_QUEUE = os.getenv('JOB_QUEUE', Settings.JOB_QUEUE).lower()
+        this.QUEUE_LEASE_SECONDS = _env_int('QUEUE_LEASE_SECONDS', Settings.QUEUE_LEASE_SECONDS)
+        this.QUEUE_MAX_ATTEMPTS = _env_int('QUEUE_MAX_ATTEMPTS', Settings.QUEUE_MAX_ATTEMPTS)
+        this.WORKER_CONCURRENCY = _env_int('WORKER_CONCURRENCY', Settings.WORKER_CONCURRENCY)
+        this.WORKER_POLL_INTERVAL = _env_float(
+            'WORKER_POLL_INTERVAL',
+            Settings.WORKER_POLL_INTERVAL,
+        )
+
+        # Scheduler settings
+        this.SCHEDULER_TENANT = os.getenv('SCHEDULER_TENANT', Settings.SCHEDULER_TENANT).lower()
+        this.SCHEDULER_CLIENT_HEADER = os.getenv(
+            'SCHEDULER_CLIENT_HEADER',
+            Settings.SCHEDULER_CLIENT_HEADER,
+        )
+        this.SCHEDULER_MAX_SHARE = _env_float('SCHEDULER_MAX_SHARE', Settings.SCHEDULER_MAX_SHARE)
+        this.SCHEDULER_BACKGROUND_SHARE = _env_float(
+            'SCHEDULER_BACKGROUND_SHARE',
+            Settings.SCHEDULER_BACKGROUND_SHARE,
+        )
+        this.SCHEDULER_WEIGHTS = {}
+        for entry in os.getenv('SCHEDULER_WEIGHTS', '').split(','):
+            if not entry.strip():
+                continue
+
+            tenant, _, weight = entry.partition('=')
+            try:
+                this.SCHEDULER_WEIGHTS[tenant.strip()] = float(weight)
+            except ValueError:
+                log.exception(f'env:SCHEDULER_WEIGHTS has a malformed entry: {entry}')
 
-        try:
-            this.CRYPTO_KDF_ITERATIONS = int(os.getenv(
-                'CRYPTO_KDF_ITERATIONS',
-                Settings.CRYPTO_KDF_ITERATIONS
-            ))
-        except ValueError:
-            log.exception('env:CRYPTO_KDF_ITERATIONS is not an integer, default to 10000')
-            this.CRYPTO_KDF_ITERATIONS = Settings.CRYPTO_KDF_ITERATIONS
+        # Fetch limits, as `key=concurrency[/rate[/burst]]`
+        this.FETCH_LIMITS = {}
+        for entry in os.getenv('FETCH_LIMITS', '').split(','):
+            if not entry.strip():
+                continue
+
+            key, _, spec = entry.partition('=')
+            if not key.strip() or not spec.strip():
+                log.error(f'env:FETCH_LIMITS has a malformed entry: {entry}')
+                continue
+
+            this.FETCH_LIMITS[key.strip()] = spec.strip()
 
         # Sentry settings
         this.SENTRY_LOG_LEVEL = logging._nameToLevel.get(
@@ -67,6 +273,18 @@ class Settings(Component):
         if not this.CRYPTO_SECRET:
             raise ValueError('env:CRYPTO_SECRET must be provided!')
 
+        if this.JOB_QUEUE not in ('local', 'database'):
+            raise ValueError('env:JOB_QUEUE must be one of `local` or `database`')
+
+        if this.FETCH_MODE not in ('thread', 'process'):
+            raise ValueError('env:FETCH_MODE must be one of `thread` or `process`')
+
+        if this.SCHEDULER_TENANT not in ('client', 'profile'):
+            raise ValueError('env:SCHEDULER_TENANT must be one of `client` or `profile`')
+
+        if this.INFO_CACHE_BACKEND not in ('memory', 'disk', 'none'):
+            raise ValueError('env:INFO_CACHE_BACKEND must be one of `memory`, `disk` or `none`')
+
         return this
 
     @property
@@ -79,25 +297,90 @@ class Settings(Component):
         else:
             return 'production'
 
+    @property
+    def database_options(self) -> dict:
+        ''' Connection options for `model.init_database_from_uri`.
+        '''
+
+        return {
+            'max_connections': self.DATABASE_MAX_CONNECTIONS,
+            'stale_timeout': self.DATABASE_STALE_TIMEOUT,
+            'busy_timeout': self.DATABASE_BUSY_TIMEOUT,
+            'journal_mode': self.DATABASE_JOURNAL_MODE,
+            'synchronous': self.DATABASE_SYNCHRONOUS,
+            'mmap_size': self.DATABASE_MMAP_SIZE,
+        }
+
+    def upload_buffer_size(self, url: str) -> int:
+        ''' Returns the upload buffer size for the destination
+            backend of `url`, chosen by URL scheme.
+        '''
+
+        scheme = url.split('://', 1)[0].lower()
+        return self.UPLOAD_BUFFER_SIZES.get(scheme, self.UPLOAD_BUFFER_SIZE)
+
     @property
     def crypto_salt_bytes(self) -> bytes:
         ''' Try to return CRYPTO_SALT as decoded bytes.
         '''
 
-        try:
-            return base64.b64decode(self.CRYPTO_SALT)
-        except binascii.Error:
-            return bytes(self.CRYPTO_SALT, 'utf-8')
+        return _decode_bytes(self.CRYPTO_SALT)
+
+    @property
+    def crypto_previous_salts_bytes(self) -> List[bytes]:
+        ''' Try to return each of CRYPTO_PREVIOUS_SALTS as decoded bytes.
+        '''
+
+        return [_decode_bytes(salt) for salt in self.CRYPTO_PREVIOUS_SALTS]
 
     @property
     def crypto_secret_bytes(self) -> bytes:
         ''' Try to return CRYPTO_SECRET as decoded bytes.
         '''
 
-        try:
-            return base64.b64decode(self.CRYPTO_SECRET)
-        except binascii.Error:
-            return bytes(self.CRYPTO_SECRET, 'utf-8')
+        return _decode_bytes(self.CRYPTO_SECRET)
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    ''' Read a boolean flag from the environment.
+    '''
+
+    return str(os.getenv(name, default)).lower() == 'true'
+
+
+def _env_int(name: str, default: int) -> int:
+    ''' Read an integer from the environment, falling back
+        to `default` if it is unset or malformed.
+    '''
+
+    try:
+        return int(os.getenv(name, default))
+    except ValueError:
+        log.exception(f'env:{name} is not an integer, default to {default}')
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    ''' Read a float from the environment, falling back
+        to `default` if it is unset or malformed.
+    '''
+
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        log.exception(f'env:{name} is not a number, default to {default}')
+        return default
+
+
+def _decode_bytes(value: str) -> bytes:
+    ''' Try to decode `value` as base64, falling back to
+        the raw `utf-8` bytes of the value.
+    '''
+
+    try:
+        return base64.b64decode(value)
+    except binascii.Error:
+        return bytes(value, 'utf-8')
 
 
 component = {
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import uuid
+from typing import (
+    Iterator,
+    Tuple,
+)
+
+from flask import json
+
+from tubedlapi.app import inject
+from tubedlapi.components.settings import Settings
+from tubedlapi.model import (
+    close_connection,
+    connection_scope,
+)
+from tubedlapi.model.job import Job
+from tubedlapi.util.metrics import Metrics
+from tubedlapi.util.pubsub import (
+    PubSub,
+    Subscription,
+)
+
+log = logging.getLogger(__name__)
+
+EVENT_STATUS = 'status'
+EVENT_PROGRESS = 'progress'
+EVENT_END = 'end'
+
+Event = Tuple[str, dict]
+
+
+def status_event(job: Job) -> Event:
+
+    return EVENT_STATUS, job.to_dict()
+
+
+def progress_event(job: Job, progress: dict) -> Event:
+
+    return EVENT_PROGRESS, {
+        'id': job.id,
+        'status': job.status,
+        'progress': progress,
+    }
+
+
+def end_event(job: Job) -> Event:
+
+    return EVENT_END, {
+        'id': job.id,
+        'status': job.status,
+    }
+
+
+@inject
+def publish_status(hub: PubSub, metrics: Metrics, job: Job) -> int:
+    ''' Publishes the current state of `job` to everyone watching it,
+        and records its status in metrics. The snapshot is only built
+        when someone is watching.
+    '''
+
+    metrics.job_status(job.id, job.status, job.created_at.timestamp(), terminal=job.is_done)
+
+    if not hub.has_subscribers(job.id):
+        return 0
+
+    return hub.publish(job.id, status_event(job))
+
+
+@inject
+def publish_end(hub: PubSub, job: Job) -> int:
+
+    return hub.publish(job.id, end_event(job))
+
+
+@inject
+def subscribe(hub: PubSub, job_id: uuid.UUID) -> Subscription:
+
+    return hub.subscribe(job_id)
+
+
+def format_event(event: Event) -> str:
+    ''' Formats `event` as a server-sent event.
+    '''
+
+    name, data = event
+    return f'event: {name}\ndata: {json.dumps(data)}\n\n'
+
+
+@inject
+def stream(settings: Settings, subscription: Subscription, job: Job) -> Iterator[str]:
+    ''' Yields server-sent events for `job`, starting with a snapshot
+        of its current state, until the pipeline is finished with it.
+
+        `subscription` should be opened before `job` is loaded, so no
+        event published in between is lost. It is closed when the
+        stream ends.
+    '''
+
+    # Streams stay open for a long time, so they only hold a
+    # database connection while checking on the job.
+    close_connection()
+
+    try:
+        yield format_event(status_event(job))
+        if job.is_done:
+            yield format_event(end_event(job))
+            return
+
+        last_status = job.status
+        while True:
+            event = subscription.get(timeout=settings.EVENTS_KEEPALIVE_INTERVAL)
+            if event is None:
+                # Nothing was published for a while. The job may be running
+                # in a worker process, whose events never reach this hub,
+                # so fall back to checking the database.
+                with connection_scope():
+                    job = Job.get(id=job.id)
+
+                if job.status == last_status and not job.is_done:
+                    yield ': keepalive\n\n'
+                    continue
+
+                last_status = job.status
+                yield format_event(status_event(job))
+                if job.is_done:
+                    yield format_event(end_event(job))
+                    return
+
+                continue
+
+            name, data = event
+            if name == EVENT_STATUS:
+                last_status = data['status']
+
+            yield format_event(event)
+            if name == EVENT_END:
+                return
+    finally:
+        subscription.close()
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+import uuid
+
+from tubedlapi.util.writebehind import WriteBehindBuffer
+
+log = logging.getLogger(__name__)
+
+
+class ProgressBuffer(WriteBehindBuffer):
+    ''' Write-behind buffer for download progress, keyed by job id.
+        Only the `progress` column of the job is written.
+    '''
+
+    def __init__(self, interval: float=1.0) -> None:
+
+        super().__init__(self.write_progress, interval=interval)
+
+    @staticmethod
+    def write_progress(job_id: uuid.UUID, progress: dict) -> None:
+
+        # Imported here, as this module is loaded while components are registered
+        from tubedlapi.model.job import Job
+
+        Job.update(progress=progress).where(Job.id == job_id).execute()
+
+
+def make_progress(info: dict) -> dict:
+    ''' Builds a job progress record from a youtube-dl progress hook dict.
+    '''
+
+    downloaded = info.get('downloaded_bytes')
+    total = info.get('total_bytes') or info.get('total_bytes_estimate')
+
+    percent = None
+    if downloaded is not None and total:
+        percent = round(downloaded / total * 100, 1)
+
+    return {
+        'status': info.get('status'),
+        'downloaded_bytes': downloaded,
+        'total_bytes': total,
+        'total_bytes_estimated': not info.get('total_bytes') and total is not None,
+        'percent': percent,
+        'speed': info.get('speed'),
+        'eta': info.get('eta'),
+        'elapsed': info.get('elapsed'),
+        'fragment_index': info.get('fragment_index'),
+        'fragment_count': info.get('fragment_count'),
+        'updated_at': time.time(),
+    }
@@ -1,15 +1,49 @@
 # -*- coding: utf-8 -*-
 
+import itertools
 import logging
+import os
+import uuid
 from concurrent.futures import Future
-from functools import partial
+from functools import (
+    lru_cache,
+    partial,
+)
+from typing import (
+    List,
+    Tuple,
+)
+from urllib.parse import urlparse
 
 from tubedlapi.app import inject
+from tubedlapi.components.settings import Settings
+from tubedlapi.exec import events
 from tubedlapi.exec.uploader import upload_file
-from tubedlapi.exec.youtubedl import fetch_url
+from tubedlapi.exec.youtubedl import (
+    Playlist,
+    fetch_url,
+    remove_downloads,
+)
+from tubedlapi.model.artifact import Artifact
 from tubedlapi.model.job import Job
-from tubedlapi.model.profile import Profile
-from tubedlapi.util.async import JobExecutor
+from tubedlapi.model.jobqueue import QueueEntry
+from tubedlapi.model.profile import (
+    Profile,
+    find_profile,
+)
+from tubedlapi.util.async import (
+    JobExecutor,
+    STAGE_POSTPROCESS,
+)
+from tubedlapi.util.cancel import CancelRegistry
+from tubedlapi.util.dlpool import (
+    YoutubeDLPool,
+    load_extractor,
+)
+from tubedlapi.util.ratelimit import (
+    FetchLimits,
+    Limiter,
+)
 
 log = logging.getLogger(__name__)
 
@@ -18,73 +52,280 @@ STAGE_UPLOADING = 'uploading'
 
 
 @inject
-def job_begin_fetch(executor: JobExecutor, job: Job, profile: Profile) -> Future:
+def job_tenant(settings: Settings, job: Job) -> str:
+    ''' The tenant `job` is scheduled as, which is the API client that
+        submitted it or its profile, depending on `SCHEDULER_TENANT`.
+    '''
+
+    meta = job.meta or {}
+    if settings.SCHEDULER_TENANT == 'profile':
+        return meta.get('profile') or ''
+
+    return meta.get('client') or ''
+
+
+@inject
+def job_limiters(limits: FetchLimits, pool: YoutubeDLPool, job: Job,
+                 profile: Profile) -> List[Limiter]:
+    ''' The fetch limiters `job` must pass before it starts fetching,
+        by the host of its url and its extractor, including the limits
+        given by its profile's `fetch_limits` option.
+
+        Playlist entries know their extractor. For other jobs it is
+        only looked up from the url when some limit needs it.
+    '''
+
+    profile_specs = profile.options_dict.get('fetch_limits')
+    if not limits.enabled and not profile_specs:
+        return []
+
+    meta = job.meta_dict
+    url = meta.get('url') or ''
+    extractor = meta.get('ie_key')
+    if extractor is None and (limits.by_extractor or profile_specs):
+        extractor = _guess_extractor(tuple(pool.extractors), url)
+
+    return limits.limiters(
+        host=urlparse(url).hostname,
+        extractor=extractor,
+        profile_id=profile.id,
+        profile_specs=profile_specs if isinstance(profile_specs, dict) else None,
+    )
+
+
+@lru_cache(maxsize=1024)
+def _guess_extractor(extra: Tuple[str, ...], url: str) -> str:
+    ''' The key of the first extractor other than the generic one
+        that accepts `url`, or None.
+    '''
+
+    from youtube_dl.extractor import gen_extractor_classes
+
+    classes = [load_extractor(path) for path in extra]
+    for ie in itertools.chain(classes, gen_extractor_classes()):
+        if ie.ie_key() != 'Generic' and ie.suitable(url):
+            return ie.ie_key()
+
+    return None
+
+
+@inject
+def job_submit(settings: Settings, job: Job, profile: Profile) -> None:
+    ''' Hands a newly created job to the pipeline.
+
+        With `JOB_QUEUE=database`, the job is written to the durable
+        queue and picked up by a `tubedlapi worker` process. Otherwise
+        it starts in this process right away.
+    '''
+
+    if settings.JOB_QUEUE == 'database':
+        QueueEntry.enqueue(job)
+    else:
+        job_start(job, profile)
+
+
+@inject
+def job_submit_many(settings: Settings, jobs: List[Tuple[Job, Profile]]) -> None:
+    ''' Hands a batch of newly created jobs to the pipeline. With
+        `JOB_QUEUE=database`, every job is enqueued in one transaction.
+    '''
+
+    if settings.JOB_QUEUE == 'database':
+        QueueEntry.enqueue_many([job for job, _ in jobs])
+    else:
+        for job, profile in jobs:
+            job_start(job, profile)
+
+
+@inject
+def job_cancel(settings: Settings, job: Job) -> bool:
+    ''' Cancels `job` and its unfinished children. Returns whether
+        anything was cancelled, which is not the case once the job
+        has finished.
+
+        Jobs running in this process are stopped at their next
+        cancellation check. With `JOB_QUEUE=database`, jobs which no
+        worker has claimed yet are dropped from the queue, and workers
+        stop the jobs they hold when they next renew their leases.
+    '''
+
+    cancelled = Job.cancel(job.id)
+    if not cancelled:
+        return False
+
+    # Nothing runs for these any more, so nothing else reports them
+    idle = [job_id for job_id, status in cancelled.items() if status == 'expanded']
+
+    if settings.JOB_QUEUE == 'database':
+        idle.extend(QueueEntry.cancel(list(cancelled)))
+    else:
+        for job_id, status in cancelled.items():
+            if status != 'expanded':
+                job_interrupt(job_id)
+
+    for idle_job in Job.select().where(Job.id.in_(idle)):
+        events.publish_status(idle_job)
+        events.publish_end(idle_job)
+
+    return True
+
+
+@inject
+def job_interrupt(cancels: CancelRegistry, job_id: uuid.UUID) -> None:
+    ''' Flags the pipeline of `job_id` in this process, which stops
+        at its next cancellation check.
+    '''
+
+    cancels.cancel(job_id)
+
+
+@inject
+def job_is_cancelled(cancels: CancelRegistry, job_id: uuid.UUID, fresh: bool=False) -> bool:
+    ''' Whether `job_id` was cancelled, in this process or, as found in
+        the database, through another one. With `fresh`, the database
+        is checked right away.
+    '''
+
+    return cancels.is_cancelled(job_id, fresh=fresh)
+
+
+def job_start(job: Job, profile: Profile) -> Future:
+    ''' Starts the job pipeline in this process. Returns a future
+        that resolves with the final job status once every stage
+        of the pipeline has finished.
+    '''
+
+    done: Future = Future()
+    job_begin_fetch(job, profile, done=done)
+
+    return done
+
+
+@inject
+def job_begin_fetch(executor: JobExecutor, job: Job, profile: Profile,
+                    done: Future=None) -> Future:
     ''' Kickstarts the fetcher job. Returns the future
         that will contain the result of the fetch.
 
+        The fetch waits in the scheduler, by the job's priority and
+        tenant, until the fetch pool has a thread for it and its fetch
+        limits allow it to start.
+
         Automatically adds `job_stage_callback` as a done callback,
         which will use job metadata to determine the next steps.
     '''
 
-    fut: Future = executor.execute_future(
+    fut: Future = executor.execute_scheduled(
+        job_tenant(job),
+        job.priority,
+        job_limiters(job, profile),
         fetch_url,
         job,
         profile,
     )
-    fut.add_done_callback(
-        partial(
-            job_stage_callback,
-            job,
-            STAGE_FETCHING,
-        ),
-    )
+    fut.add_done_callback(partial(_stage_done, executor, job, STAGE_FETCHING, done))
 
     return fut
 
 
 @inject
-def job_begin_upload(executor: JobExecutor, job: Job) -> Future:
-    ''' Begins execution of a future whih spawns another future
-        each destination upload. The number of futures that will be
-        spawned/running is limited by the default size of the `ThreadPoolExecutor`.
+def job_begin_upload(executor: JobExecutor, job: Job, done: Future=None) -> Future:
+    ''' Begins execution of a future for each destination upload.
+        The number of uploads running at once is limited by the size
+        of the upload stage pool.
     '''
 
-    # Update the job status to notify that the file is uploading
-    job.status = 'uploading'
-    job.save()
+    try:
+        # Update the job status to notify that the file is uploading
+        job.status = 'uploading'
+        job.save()
+        events.publish_status(job)
 
-    fut: Future = executor.execute_future(
-        upload_file,
-        job,
-    )
-    fut.add_done_callback(
-        partial(
-            job_stage_callback,
-            job,
-            STAGE_UPLOADING,
-        ),
-    )
+        fut: Future = upload_file(job)
+    except Exception as e:
+        fut = Future()
+        fut.set_exception(e)
+
+    fut.add_done_callback(partial(_stage_done, executor, job, STAGE_UPLOADING, done))
 
     return fut
 
 
-def job_stage_callback(job: Job, stage: str, fut: Future) -> None:
-    ''' Generic job stage completion callback.
-        Accepts a Job model, stage name, and the future.
+def job_stage_callback(job: Job, stage: str, done: Future, fut: Future) -> None:
+    ''' Generic job stage completion callback, run on the
+        post-processing stage pool.
+        Accepts a Job model, stage name, the pipeline completion
+        future (if any), and the stage future.
 
         When this is called, it means the job stage has completed
         in some form or fashion. Should use `fut`'s result methods
         to figure out what happened and update accordingly.
+
+        A job cancelled in the meantime, by any process, is finished as
+        cancelled. Status changes saved here never replace `cancelled`
+        (see `Job.save`), so a job cancelled later still ends cancelled.
+
+        If handling the stage raises, the job is failed and `done` is
+        resolved with the exception, so nothing waits on it forever.
+    '''
+
+    try:
+        _finish_stage(job, stage, done, fut)
+    except Exception as e:
+        log.exception('job %s could not finish stage %s', job.id, stage)
+        _pipeline_failed(job, stage, done, e)
+
+
+def _stage_done(executor: JobExecutor, job: Job, stage: str, done: Future,
+                fut: Future) -> None:
+    ''' Hands a finished stage to `job_stage_callback`, on the
+        post-processing stage pool.
     '''
 
+    try:
+        executor.execute_stage(STAGE_POSTPROCESS, job_stage_callback, job, stage, done, fut)
+    except Exception as e:
+        log.exception('job %s could not finish stage %s', job.id, stage)
+        _pipeline_failed(job, stage, done, e)
+
+
+def _finish_stage(job: Job, stage: str, done: Future, fut: Future) -> None:
+
+    if job_is_cancelled(job.id, fresh=True):
+        job_finish_cancelled(job, stage, done)
+        return
+
     # First, update job metadata with the execution result.
-    exc = fut.exception()
-    if not fut.cancelled() and exc:
-        raise exc
+    exc = None if fut.cancelled() else fut.exception()
+    if fut.cancelled() or exc:
+        log.error(
+            'job %s failed in stage %s: %s',
+            job.id,
+            stage,
+            'cancelled' if fut.cancelled() else exc,
+        )
 
-    if fut.done():
-        job.meta_update(result=fut.result())
+        job.status = 'failed'
+        job.meta_update(error={
+            'stage': stage,
+            'message': 'cancelled' if fut.cancelled() else str(exc),
+        })
         job.save()
+        events.publish_status(job)
+
+        _pipeline_finished(job, done)
+        return
+
+    result = fut.result()
+    if isinstance(result, Playlist):
+        job_expand(job, result, done)
+        return
+
+    if isinstance(result, Artifact):
+        result = job_reuse_artifact(job, result)
+
+    job.meta_update(result=result)
+    job.save()
 
     # Dispatch the next futures chain, if applicable
     if stage == STAGE_FETCHING:
@@ -94,9 +335,150 @@ def job_stage_callback(job: Job, stage: str, fut: Future) -> None:
             # Spawn the uploader future
             # TODO: Add a marker in the job meta showing
             # that destination uploads are queued
-            job_begin_upload(job)
+            job_begin_upload(job, done=done)
+        else:
+            _pipeline_finished(job, done)
     elif stage == STAGE_UPLOADING:
         job.status = 'completed'
         job.save()
+        events.publish_status(job)
+
+        log.info(f'job {job.id} has finished job pipeline as {job.status}')
+        _pipeline_finished(job, done)
+
+
+@inject
+def job_finish_cancelled(cancels: CancelRegistry, job: Job, stage: str,
+                         done: Future=None) -> None:
+    ''' Ends the pipeline of a cancelled job, removing whatever it
+        downloaded so far.
+    '''
+
+    log.info('job %s cancelled in stage %s', job.id, stage)
+
+    try:
+        remove_downloads(job)
+    except Exception:
+        log.exception('could not remove the downloads of job %s', job.id)
+
+    job.status = 'cancelled'
+    job.meta_update(error={
+        'stage': stage,
+        'message': 'cancelled',
+    })
+    job.save()
+    events.publish_status(job)
+
+    cancels.discard(job.id)
+    _pipeline_finished(job, done)
+
+
+def job_reuse_artifact(job: Job, artifact: Artifact) -> dict:
+    ''' Finishes the fetch stage of `job` with a retained download
+        instead of downloading it again. Returns the fetch result.
+    '''
+
+    log.info('job %s reuses artifact %s', job.id, artifact.filename)
+
+    artifact.touch()
+
+    # Uploaded under this job's name, like a fresh download
+    extension = os.path.splitext(artifact.filename)[1]
+
+    job.status = 'finished'
+    job.meta_update(info=artifact.info_for(f'{job.id}{extension}'))
+    job.save()
+    events.publish_status(job)
+
+    return {
+        'artifact': {
+            'sha256': artifact.sha256,
+            'size': artifact.size,
+        },
+    }
+
+
+def job_expand(job: Job, playlist: Playlist, done: Future=None) -> None:
+    ''' Creates a child job for each entry of `playlist` and submits
+        them together, so entries download concurrently within the
+        fetch stage limits. `job` is finished by its last child.
+    '''
+
+    profile = find_profile(job.meta_dict['profile'])
+
+    metas = []
+    for index, entry in enumerate(playlist.entries, start=1):
+        meta = dict(job.meta)
+        meta.update({
+            'url': entry['url'],
+            'ie_key': entry['ie_key'],
+            'playlist_index': index,
+        })
+        metas.append(meta)
+
+    with Job._meta.database.atomic():
+        children = Job.create_many(metas, parent=job, priority=job.priority)
+
+        job.status = 'expanded' if children else 'completed'
+        job.children_total = len(children)
+        job.meta_update(info=playlist.info)
+        job.save()
+
+    log.info('job %s expanded into %d child jobs', job.id, len(children))
+    events.publish_status(job)
+
+    job_submit_many([(child, profile) for child in children])
+
+    # The parent's own pipeline ends here, its children carry on.
+    _pipeline_finished(job, done, end=job.is_done)
+
+
+def _pipeline_failed(job: Job, stage: str, done: Future, exc: Exception) -> None:
+    ''' Fails `job` after an unexpected error in the pipeline itself,
+        and resolves `done` with `exc`.
+    '''
+
+    try:
+        job.status = 'failed'
+        job.meta_update(error={
+            'stage': stage,
+            'message': str(exc),
+        })
+        job.save()
+        events.publish_status(job)
+
+        _pipeline_finished(job, None)
+    except Exception:
+        log.exception('could not fail job %s', job.id)
+    finally:
+        if done is not None and not done.done():
+            done.set_exception(exc)
+
+
+def _pipeline_finished(job: Job, done: Future, end: bool=True) -> None:
+
+    if end:
+        events.publish_end(job)
+
+        if job.parent_id is not None:
+            _child_finished(job)
+
+    if done is not None and not done.done():
+        done.set_result(job.status)
+
+
+def _child_finished(job: Job) -> None:
+    ''' Counts `job` towards its parent, finishing the parent (and
+        in turn its own parent) if `job` was the last child.
+    '''
+
+    failed = job.status in ('cancelled', 'failed')
+    parent, finished = Job.child_finished(job.parent_id, failed=failed)
+    events.publish_status(parent)
+
+    if finished:
+        log.info('job %s finished with all %d children', parent.id, parent.children_total)
+        events.publish_end(parent)
 
-        log.info(f'job {job.id} has finished job pipeline')
+        if parent.parent_id is not None:
+            _child_finished(parent)
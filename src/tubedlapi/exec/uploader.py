@@ -1,12 +1,10 @@
 # -*- coding: utf-8 -*-
 
-import io
 import logging
-from concurrent import futures
-from concurrent.futures import (
-    wait,
-    Future,
-)
+import os
+import uuid
+from concurrent.futures import Future
+from functools import partial
 from typing import (
     Any,
     Dict,
@@ -15,22 +13,47 @@ from typing import (
     Tuple,
 )
 
+from fs.base import FS
+from fs.errors import FSError
+
 from tubedlapi.app import inject
+from tubedlapi.components.settings import Settings
 from tubedlapi.model.destination import Destination
 from tubedlapi.model.job import Job
-from tubedlapi.util.async import JobExecutor
+from tubedlapi.util.async import (
+    JobExecutor,
+    STAGE_UPLOAD,
+    gather_futures,
+)
+from tubedlapi.util.cancel import (
+    CancelRegistry,
+    JobCancelled,
+)
+from tubedlapi.util.fspool import FSPool
+from tubedlapi.util.metrics import Metrics
+from tubedlapi.util.transfer import (
+    copy_chunked,
+    marker_path,
+)
 
 log = logging.getLogger(__name__)
 
 
 @inject
-def upload_file(executor: JobExecutor, job: Job) -> dict:
+def upload_file(executor: JobExecutor, pool: FSPool, job: Job) -> Future:
     ''' This will actually spawn off a new future for each
-        destination and wait for each to complete before
-        this function will complete/return.
+        destination on the upload stage pool. Returns a future
+        which resolves with the results of every destination upload
+        once all of them have completed.
+
+        Nothing waits on the destination futures, so uploads can
+        never starve the pool they are running on. Uploads to a
+        destination whose connections are all in use wait in the
+        connection pool, not on an upload thread.
     '''
 
-    local_filename = job.meta_dict.get('info', {}).get('downloaded', {}).get('filename')
+    downloaded = job.meta_dict.get('info', {}).get('downloaded', {})
+    local_filename = downloaded.get('path') or downloaded.get('filename')
     if not local_filename:
         # TODO: This is technically correct... which is also the best (read: worst)
         # kind of correct
@@ -45,29 +68,48 @@ def upload_file(executor: JobExecutor, job: Job) -> dict:
 
     dests: List[str] = []
     futs: List[Future] = []
-    for dest in job.meta_dict.get('destinations', []):
-        future = executor.execute_future(
-            upload_to_destination,
-            local_filename,
-            dest,
-        )
-
-        dests.append(dest)
+    for dest_name in job.meta_dict.get('destinations', []):
+        try:
+            dest = Destination.get(name=dest_name)
+        except Destination.DoesNotExist as e:
+            future = Future()
+            future.set_exception(e)
+        else:
+            future = pool.submit(
+                dest.id,
+                dest.url,
+                partial(executor.execute_stage, STAGE_UPLOAD),
+                upload_to_destination,
+                local_filename,
+                dest,
+                job.id,
+                remote_path=os.path.basename(downloaded.get('filename') or local_filename),
+            )
+
+        dests.append(dest_name)
         futs.append(future)
 
-    wait(futs, return_when=futures.ALL_COMPLETED)
+    return gather_futures(futs, partial(_collect_results, dests))
+
+
+def _collect_results(dests: List[str], futs: List[Future]) -> Dict[str, Dict]:
+    ''' Builds the upload results for each destination from
+        the finished destination futures.
+    '''
 
     all_results: Dict[str, Dict] = {}
     for dest, fut in zip(dests, futs):
         result: Dict[str, Any] = {}
 
-        exc = fut.exception()
-        if not fut.cancelled() and exc:
+        if fut.cancelled():
             result.update({
-                'error': str(exc),
+                'error': 'cancelled',
             })
-
-        if fut.done():
+        elif fut.exception():
+            result.update({
+                'error': str(fut.exception()),
+            })
+        else:
             result.update({
                 'result': fut.result(),
             })
@@ -79,25 +121,73 @@ def upload_file(executor: JobExecutor, job: Job) -> dict:
     return all_results
 
 
-def upload_to_destination(filename: str, dest_name: str) -> dict:
-    ''' Given a source filename and the name of a destination,
-        load the destination record, open a connection to the
-        underlying filesystem, and copy the source into the
-        destination filesystem.
+@inject
+def upload_to_destination(settings: Settings, metrics: Metrics, cancels: CancelRegistry,
+                          fs: FS, filename: str, dest: Destination, job_id: uuid.UUID=None,
+                          remote_path: str=None) -> dict:
+    ''' Given a source filename, a destination and a filesystem
+        handle checked out for it from the pool, copy the source into
+        the destination filesystem as `remote_path`, by default the
+        base name of the source.
+
+        If job `job_id` is cancelled, the copy stops after the chunk
+        in flight and the partial file is removed from the destination.
+
+        Returns the transfer statistics for the upload.
     '''
 
+    def check_cancelled(done: int=0, total: int=0) -> None:
+
+        if job_id is not None:
+            cancels.check(job_id)
+
+    check_cancelled()
+
+    remote_path = remote_path or os.path.basename(filename)
+
     log.info(
-        'trying to upload file `%s` to destination %s',
+        'trying to upload file `%s` to destination %s as `%s`',
         filename,
-        dest_name,
+        dest.name,
+        remote_path,
     )
 
-    # Try to find the destination model
-    dest = Destination.get(name=dest_name)
-    with dest.as_fs as fs:
-        with io.open(filename, 'rb') as src_file:
-            fs.setbinfile(filename, src_file)
+    with metrics.upload(dest.name):
+        try:
+            transfer = copy_chunked(
+                filename,
+                fs,
+                remote_path,
+                buffer_size=settings.upload_buffer_size(dest.url),
+                resume=settings.UPLOAD_RESUME,
+                progress=check_cancelled,
+            )
+        except JobCancelled:
+            log.info('upload of `%s` to destination %s cancelled', filename, dest.name)
+            _remove_partial(fs, remote_path)
+            raise
+
+    metrics.uploaded(dest.name, transfer['bytes_transferred'])
+
+    log.info(
+        'uploaded %d bytes of `%s` to destination %s at %.0f bytes/sec',
+        transfer['bytes_transferred'],
+        filename,
+        dest.name,
+        transfer['bytes_per_second'],
+    )
 
-    return {
+    transfer.update({
         'success': True,
-    }
+    })
+    return transfer
+
+
+def _remove_partial(fs: FS, path: str) -> None:
+
+    for partial_path in (path, marker_path(path)):
+        try:
+            if fs.exists(partial_path):
+                fs.remove(partial_path)
+        except FSError:
+            log.warning('could not remove partial upload %s from %r', partial_path, fs)
@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import signal
+import socket
+import threading
+from concurrent.futures import Future
+from functools import partial
+from typing import Dict
+
+from tubedlapi.components.settings import Settings
+from tubedlapi.exec import (
+    events,
+    stage,
+)
+from tubedlapi.model.jobqueue import QueueEntry
+from tubedlapi.model.profile import (
+    Profile,
+    find_profile,
+)
+
+log = logging.getLogger(__name__)
+
+
+class Worker(object):
+    ''' Claims jobs from the durable job queue and runs them
+        through the `exec.stage` pipeline.
+
+        At most `WORKER_CONCURRENCY` jobs are held at once. Leases on
+        held jobs are renewed every poll, so jobs held by a worker that
+        died become claimable again after `QUEUE_LEASE_SECONDS`. Held
+        jobs which were cancelled in the meantime are stopped.
+    '''
+
+    def __init__(self, settings: Settings, name: str=None) -> None:
+
+        self.name = name or f'{socket.gethostname()}:{os.getpid()}'
+        self.concurrency = settings.WORKER_CONCURRENCY
+        self.poll_interval = settings.WORKER_POLL_INTERVAL
+        self.lease = settings.QUEUE_LEASE_SECONDS
+        self.max_attempts = settings.QUEUE_MAX_ATTEMPTS
+
+        self._running: Dict[int, Future] = {}
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    def stop(self, *args) -> None:
+        ''' Stops claiming new jobs. Jobs that are already running
+            are allowed to finish.
+        '''
+
+        if not self._stopping.is_set():
+            log.info('worker %s stopping, waiting for running jobs', self.name)
+
+        self._stopping.set()
+
+    def run(self) -> None:
+
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+
+        log.info('worker %s started with concurrency %d', self.name, self.concurrency)
+
+        while not self._stopping.is_set() or self._running:
+            try:
+                self.renew()
+                if not self._stopping.is_set():
+                    self.claim()
+            except Exception:
+                log.exception('worker %s failed to poll the job queue', self.name)
+
+            self._stopping.wait(self.poll_interval)
+
+        log.info('worker %s stopped', self.name)
+
+    def renew(self) -> None:
+
+        with self._lock:
+            held = list(self._running.keys())
+
+        QueueEntry.renew(self.name, held, self.lease)
+
+        for job_id in QueueEntry.cancelled(self.name, held):
+            stage.job_interrupt(job_id)
+
+    def claim(self) -> None:
+
+        with self._lock:
+            free = self.concurrency - len(self._running)
+
+        if free <= 0:
+            return
+
+        for entry in QueueEntry.claim(self.name, free, self.lease):
+            self.start(entry)
+
+    def start(self, entry: QueueEntry) -> None:
+        ''' Starts the pipeline for a claimed queue entry.
+        '''
+
+        job = entry.job
+        if entry.attempts > self.max_attempts:
+            log.warning('job %s abandoned after %d attempts', job.id, entry.attempts - 1)
+            self.fail(entry, f'abandoned after {entry.attempts - 1} attempts')
+            return
+
+        try:
+            profile = find_profile(job.meta_dict.get('profile'))
+        except Profile.DoesNotExist:
+            self.fail(entry, 'profile not found')
+            return
+
+        log.info('worker %s starting job %s (attempt %d)', self.name, job.id, entry.attempts)
+
+        done = stage.job_start(job, profile)
+        with self._lock:
+            self._running[entry.id] = done
+
+        done.add_done_callback(partial(self.finished, entry))
+
+    def finished(self, entry: QueueEntry, fut: Future) -> None:
+
+        with self._lock:
+            if self._running.get(entry.id) is fut:
+                del self._running[entry.id]
+
+        # The job may have outlived its lease and be running elsewhere
+        if not entry.finish():
+            log.warning(
+                'worker %s lost the lease on job %s before it finished',
+                self.name,
+                entry.job_id,
+            )
+
+    def fail(self, entry: QueueEntry, message: str) -> None:
+
+        job = entry.job
+        job.status = 'failed'
+        job.meta_update(error={
+            'stage': 'queued',
+            'message': message,
+        })
+        job.save()
+        events.publish_status(job)
+
+        entry.finish()
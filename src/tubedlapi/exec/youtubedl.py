@@ -1,18 +1,61 @@
 # -*- coding: utf-8 -*-
 
 import functools
+import glob
+import itertools
 import logging
-from typing import Any
-
-import youtube_dl
-from flask import json
-from youtube_dl.postprocessor.common import PostProcessor
-
+import os
+import threading
+import time
+import uuid
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    List,
+)
+
+from tubedlapi.app import inject
+from tubedlapi.components.settings import Settings
+from tubedlapi.exec import events
+from tubedlapi.exec.progress import (
+    ProgressBuffer,
+    make_progress,
+)
+from tubedlapi.model import connection_scope
+from tubedlapi.model.artifact import (
+    Artifact,
+    local_host,
+)
 from tubedlapi.model.job import Job
 from tubedlapi.model.profile import Profile
+from tubedlapi.util.cancel import (
+    CancelRegistry,
+    JobCancelled,
+)
+from tubedlapi.util.dlpool import YoutubeDLPool
+from tubedlapi.util.infocache import InfoCache
+from tubedlapi.util.metrics import Metrics
+from tubedlapi.util.procpool import (
+    Relay,
+    RelayProcessPool,
+)
+from tubedlapi.util.pubsub import PubSub
+from tubedlapi.util.retention import ArtifactRetention
+
+if TYPE_CHECKING:
+    import youtube_dl  # noqa: F401
 
 log = logging.getLogger(__name__)
 
+PLAYLIST_TYPES = ('playlist', 'multi_video')
+
+# Seconds between cancellation checks in a fetch process
+CANCEL_CHECK_INTERVAL = 0.5
+
+# Downloaders of a fetch process, see `_fetch_in_process`
+_process_downloaders: YoutubeDLPool = None
+
 
 class FetchLogger(object):
 
@@ -31,15 +74,44 @@ class FetchLogger(object):
     warning = message
 
 
-class JobPostProcessor(PostProcessor):
+class JobPostProcessor(object):
     ''' Youtube-DL post-processor for getting
         the final filename from the end of the
         post-processor chain.
+
+        Implements the post-processor interface without subclassing
+        `youtube_dl.postprocessor.common.PostProcessor`, so youtube-dl
+        is not imported until the first fetch.
     '''
 
-    def __init__(self, job: Job) -> None:
+    # Keys of the final info dict used by `filter_info` and `record_artifact`
+    INFO_KEYS = (
+        'acodec',
+        'description',
+        'duration',
+        'extractor_key',
+        'filepath',
+        'filesize',
+        'id',
+        'tags',
+        'thumbnails',
+        'title',
+        'uploader_id',
+        'uploader_url',
+        'vcodec',
+        'webpage_url',
+    )
+
+    def __init__(self, job: Job, format_key: str=None, source_key: str=None) -> None:
 
         self._job = job
+        self._format_key = format_key
+        self._source_key = source_key
+        self._downloader = None
+
+    def set_downloader(self, downloader: 'youtube_dl.YoutubeDL') -> None:
+
+        self._downloader = downloader
 
     def filter_info(self, info: dict) -> dict:
 
@@ -77,55 +149,470 @@ class JobPostProcessor(PostProcessor):
             self._job.id,
         )
 
-        info = self.filter_info(info)
+        raw_info, info = info, self.filter_info(info)
+        if self._format_key and info['downloaded']['filename']:
+            try:
+                self.record_artifact(raw_info, info)
+            except Exception:
+                log.exception('could not record artifact for job %s', self._job.id)
 
         self._job.status = 'finished'
         self._job.meta_update(info=info)
         self._job.save()
+        events.publish_status(self._job)
 
         return [], self.filter_info(info)
 
+    def record_artifact(self, raw_info: dict, info: dict) -> Artifact:
+        ''' Retains the downloaded file for reuse by later jobs, and
+            points `info` at the retained file. `downloaded.filename`
+            keeps the name the download is uploaded under, and
+            `downloaded.path` is the retained file.
+        '''
+
+        artifact = Artifact.record(
+            raw_info.get('extractor_key'),
+            raw_info.get('id'),
+            self._format_key,
+            self._source_key,
+            info['downloaded']['filename'],
+            info,
+        )
+
+        info['downloaded'].update({
+            'path': artifact.filename,
+            'filesize_bytes': artifact.size,
+            'sha256': artifact.sha256,
+        })
+
+        return artifact
+
+
+class Playlist(object):
+    ''' A playlist which was resolved, but not downloaded.
+        Returned by `fetch_url` in place of a download result.
+    '''
+
+    def __init__(self, info: dict, entries: List[dict]) -> None:
+
+        self.info = info
+        self.entries = entries
+
+    @classmethod
+    def from_ie_result(cls, ie_result: dict, options: dict) -> 'Playlist':
+        ''' Builds a playlist from an unprocessed youtube-dl result,
+            honoring the `playliststart` and `playlistend` options.
+        '''
+
+        start = max(options.get('playliststart', 1), 1) - 1
+        end = options.get('playlistend')
+        if end is not None and end < 0:
+            end = None
+
+        entries = []
+        for entry in itertools.islice(ie_result.get('entries') or [], start, end):
+            url = entry.get('webpage_url') or entry.get('url')
+            if not url:
+                continue
+
+            entries.append({
+                'url': url,
+                'ie_key': entry.get('ie_key') or entry.get('extractor_key'),
+                'title': entry.get('title'),
+            })
+
+        info = {
+            'source': {
+                'id': ie_result.get('id'),
+                'title': ie_result.get('title'),
+                'original_url': ie_result.get('webpage_url'),
+                'extractor': ie_result.get('extractor_key'),
+            },
+            'entries': len(entries),
+        }
+
+        return cls(info, entries)
+
+
+class RelayPostProcessor(object):
+    ''' Post-processor for fetch processes. Sends the final info dict
+        to the parent process, where `JobPostProcessor` handles it.
+    '''
+
+    def __init__(self, relay: Relay) -> None:
+
+        self._relay = relay
+        self._downloader = None
+
+    def set_downloader(self, downloader: 'youtube_dl.YoutubeDL') -> None:
+
+        self._downloader = downloader
+
+    def run(self, info: dict):
+
+        # Missing keys stay missing, as `filter_info` expects
+        self._relay.send('postprocess', {
+            key: info[key] for key in JobPostProcessor.INFO_KEYS if key in info
+        })
+
+        return [], info
+
+
+class RelayInfoCache(object):
+    ''' Info cache for fetch processes. Serves the entry looked up by
+        the parent process, and sends changes back to the parent.
+    '''
+
+    def __init__(self, relay: Relay, info: dict) -> None:
+
+        self._relay = relay
+        self._info = info
+
+    def get(self, key: str) -> dict:
+
+        return self._info
+
+    def put(self, key: str, info: dict) -> None:
+
+        try:
+            self._relay.send('extracted', info)
+        except Exception:
+            log.debug('info for %s could not be sent to the parent process', key)
+
+    def discard(self, key: str) -> None:
+
+        self._relay.send('discard')
+
+
+@inject
+def prewarm_downloaders(settings: Settings, pool: YoutubeDLPool,
+                        profiles: List[Profile]=None) -> threading.Thread:
+    ''' Creates `DOWNLOADER_PREWARM` idle downloaders for each of
+        `profiles`, or for every profile, in a background thread, so
+        the first jobs of a profile do not wait for one to be set up.
+
+        Nothing is created with `FETCH_MODE=process`, where fetch
+        processes keep downloaders of their own.
+    '''
+
+    if settings.DOWNLOADER_PREWARM <= 0 or settings.FETCH_MODE == 'process':
+        return None
+
+    def prewarm() -> None:
+
+        with connection_scope():
+            for profile in profiles if profiles is not None else Profile.select():
+                try:
+                    pool.prewarm(
+                        profile.id,
+                        bytes(profile.options),
+                        profile.options_dict,
+                        count=settings.DOWNLOADER_PREWARM,
+                    )
+                except Exception:
+                    log.exception('could not prewarm downloaders for profile %s', profile.name)
+
+    thread = threading.Thread(
+        target=prewarm,
+        name='tubedlapi-prewarm',
+        daemon=True,
+    )
+    thread.start()
+
+    return thread
+
+
+@inject
+def fetch_url(settings: Settings, progress: ProgressBuffer, hub: PubSub, cache: InfoCache,
+              pool: YoutubeDLPool, procs: RelayProcessPool, metrics: Metrics,
+              cancels: CancelRegistry, retention: ArtifactRetention, job: Job,
+              profile: Profile) -> Any:
+    ''' Fetches the media for `job`. If the job's url is a playlist
+        and `PLAYLIST_FANOUT` is enabled, nothing is downloaded and
+        a `Playlist` is returned instead.
+
+        Extracted info is cached by url and profile options, so
+        fetching the same url again skips extraction. With
+        `ARTIFACT_DEDUP`, a retained `Artifact` of the same video
+        and format is returned instead of downloading it again, and
+        artifacts past their retention limits are swept now and then.
+
+        The `YoutubeDL` is checked out from the profile's pool, with
+        the per-job output template, logger, progress hook and
+        post-processor swapped in.
+
+        With `FETCH_MODE=process`, extraction and download run in a
+        fetch process instead. Its progress, post-processing and info
+        cache updates are relayed back and handled here as usual.
+
+        A cancelled job raises `JobCancelled` before it starts, or from
+        the next progress update of its download.
+    '''
 
-def fetch_url(job: Job, profile: Profile) -> Any:
+    cancels.check(job.id)
 
-    options = json.loads(profile.options)
-    options.update({
-        'outtmpl': f'{job.id}.%(format)s',
-        'logger': FetchLogger(job, profile),
-        'progress_hooks': [
-            functools.partial(_progress_hook, job)
-        ],
-    })
+    url = job.meta_dict['url']
+    ie_key = job.meta_dict.get('ie_key')
 
-    job_proc = JobPostProcessor(job)
+    options = profile.options_dict
+    cache_key = cache.make_key(url, options, ie_key)
 
-    return _fetch(job.meta_dict['url'], options, job_proc)
+    format_key = None
+    if settings.ARTIFACT_DEDUP:
+        retention.sweep()
 
+        format_key = Artifact.make_format_key(options)
+        artifact = Artifact.find_source(cache_key)
+        if artifact:
+            return artifact
 
-def _fetch(url: str, options: dict, job_proc: JobPostProcessor) -> Any:
+    job_proc = JobPostProcessor(job, format_key=format_key, source_key=cache_key)
+    progress_hook = functools.partial(_progress_hook, progress, hub, metrics, job)
 
-    with youtube_dl.YoutubeDL(options) as dl:
-        job_proc.set_downloader(dl)
-        dl.add_post_processor(job_proc)
-        return dl.download([url])
+    if settings.FETCH_MODE == 'process':
+        handlers = {
+            'progress': functools.partial(_watch_cancel, cancels, job.id, progress_hook),
+            'postprocess': job_proc.run,
+            'extracted': functools.partial(cache.put, cache_key),
+            'discard': lambda _: cache.discard(cache_key),
+        }
+
+        return procs.call(
+            handlers,
+            _fetch_in_process,
+            job.id,
+            url,
+            options,
+            ie_key,
+            settings.PLAYLIST_FANOUT,
+            cache.get(cache_key),
+            (profile.id, bytes(profile.options)),
+            pool.extractors,
+            call_id=job.id.hex,
+        )
+
+    checkout = pool.checkout(
+        profile.id,
+        bytes(profile.options),
+        options,
+        params={
+            'outtmpl': f'{job.id}.%(format)s',
+            'logger': FetchLogger(job, profile),
+        },
+        progress_hooks=[functools.partial(_cancel_hook, cancels, job.id), progress_hook],
+        postprocessors=[job_proc],
+    )
+
+    with checkout as dl:
+        return _fetch(
+            dl,
+            url,
+            options,
+            ie_key=ie_key,
+            fanout=settings.PLAYLIST_FANOUT,
+            cache=cache,
+            cache_key=cache_key,
+            format_key=format_key,
+        )
+
+
+def _fetch_in_process(relay: Relay, job_id: uuid.UUID, url: str, options: dict, ie_key: str,
+                      fanout: bool, info: dict, profile_version: tuple,
+                      extractors: List[str]) -> Any:
+    ''' Runs in a fetch process. Fetches like `fetch_url` does, with
+        everything touching the database left to the parent process.
+    '''
+
+    global _process_downloaders
+    if _process_downloaders is None:
+        _process_downloaders = YoutubeDLPool(max_idle=1, extractors=extractors)
+
+    profile_id, version = profile_version
+    checkout = _process_downloaders.checkout(
+        profile_id,
+        version,
+        options,
+        params={
+            'outtmpl': f'{job_id}.%(format)s',
+            'logger': FetchLogger(None, None),
+        },
+        progress_hooks=[_relay_progress(relay)],
+        postprocessors=[RelayPostProcessor(relay)],
+    )
+
+    with checkout as dl:
+        return _fetch(
+            dl,
+            url,
+            options,
+            ie_key=ie_key,
+            fanout=fanout,
+            cache=RelayInfoCache(relay, info),
+        )
+
+
+def _relay_progress(relay: Relay) -> Callable[[dict], None]:
+
+    checked = [time.monotonic()]
+
+    def _hook(info: dict) -> None:
+
+        now = time.monotonic()
+        if now - checked[0] >= CANCEL_CHECK_INTERVAL:
+            checked[0] = now
+            if relay.cancelled():
+                raise JobCancelled(f'fetch {relay.call_id} was cancelled')
+
+        relay.send('progress', {key: value for key, value in info.items() if key != 'info_dict'})
+
+    return _hook
+
+
+def _fetch(dl: 'youtube_dl.YoutubeDL', url: str, options: dict, ie_key: str=None,
+           fanout: bool=True, cache: InfoCache=None, cache_key: str=None,
+           format_key: str=None) -> Any:
+
+    ie_result = cache.get(cache_key) if cache else None
+    cached = ie_result is not None
+    if not cached:
+        ie_result = _extract(dl, url, ie_key)
+        if cache and ie_result.get('_type', 'video') == 'video':
+            cache.put(cache_key, ie_result)
+
+    if fanout and ie_result.get('_type') in PLAYLIST_TYPES:
+        return Playlist.from_ie_result(ie_result, options)
+
+    if format_key and ie_result.get('_type', 'video') == 'video':
+        artifact = Artifact.find(
+            ie_result.get('extractor_key'),
+            ie_result.get('id'),
+            format_key,
+        )
+        if artifact:
+            return artifact
+
+    from youtube_dl.utils import DownloadError
+
+    try:
+        dl.process_ie_result(ie_result, download=True)
+    except DownloadError:
+        if not cached:
+            raise
+
+        # Media urls in cached info expire, so extract once more.
+        log.info('download from cached info for %s failed, extracting again', url)
+        cache.discard(cache_key)
+        dl.process_ie_result(_extract(dl, url, ie_key), download=True)
+
+    # Same return value as `YoutubeDL.download`
+    return dl._download_retcode
+
+
+def _extract(dl: 'youtube_dl.YoutubeDL', url: str, ie_key: str=None) -> dict:
+    ''' Resolves `url` to an info dict without processing it, so
+        playlist entries are not extracted or downloaded yet.
+    '''
+
+    ie_result = dl.extract_info(url, download=False, ie_key=ie_key, process=False)
+    while ie_result.get('_type') == 'url':
+        ie_result = dl.extract_info(
+            ie_result['url'],
+            download=False,
+            ie_key=ie_result.get('ie_key'),
+            process=False,
+        )
+
+    return ie_result
+
+
+def _cancel_hook(cancels: CancelRegistry, job_id: uuid.UUID, info: dict) -> None:
+    ''' Aborts the download of a cancelled job, by raising out of
+        youtube-dl's download loop.
+    '''
+
+    cancels.check(job_id)
+
+
+def _watch_cancel(cancels: CancelRegistry, job_id: uuid.UUID, hook: Callable,
+                  info: dict) -> None:
+    ''' Progress handler for fetches in a fetch process. Looks for a
+        cancellation made through another process, which the registry
+        passes on to the fetch process, before handing `info` to `hook`.
+    '''
+
+    cancels.is_cancelled(job_id)
+    hook(info)
+
+
+def remove_downloads(job: Job) -> List[str]:
+    ''' Removes the files downloaded for `job` into the working
+        directory, finished or partial (`.part`, `.ytdl`, fragments).
+        Files retained as artifacts for other jobs are left alone.
+
+        Returns the removed paths.
+    '''
+
+    paths = [os.path.abspath(path) for path in glob.glob(f'{glob.escape(str(job.id))}.*')]
+    if not paths:
+        return []
+
+    retained = {
+        artifact.filename
+        for artifact in (Artifact
+                         .select(Artifact.filename)
+                         .where((Artifact.host == local_host()) & Artifact.filename.in_(paths)))
+    }
+
+    removed = []
+    for path in paths:
+        if path in retained:
+            continue
+
+        try:
+            os.remove(path)
+            removed.append(path)
+        except FileNotFoundError:
+            pass
+
+    log.info('removed %d downloaded files of job %s', len(removed), job.id)
+
+    return removed
+
+
+def _progress_hook(buffer: ProgressBuffer, hub: PubSub, metrics: Metrics, job: Job,
+                   info: dict) -> None:
+    ''' Records download progress for `job`.
+
+        Status transitions are written immediately. Progress updates in
+        between go through the write-behind buffer, so the database sees
+        at most one write per job per `PROGRESS_FLUSH_INTERVAL`. Every
+        update is published to the job's event stream right away.
+    '''
 
+    progress = make_progress(info)
 
-def _progress_hook(job: Job, info: dict) -> None:
+    # status == 'finished' means download is finished -- waiting
+    # for post-processor chain to complete execution.
+    if info['status'] == 'finished':
+        new_status = 'processing'
+        metrics.downloaded(info.get('downloaded_bytes') or 0)
+    else:
+        new_status = info['status']
 
-    if job.status != info['status']:
+    if job.status != new_status:
         log.info(
             'Job transitioning from {old_state} to {new_state}'.format(
                 old_state=job.status,
-                new_state=info['status'],
+                new_state=new_status,
             )
         )
 
-        # status == 'finished' means download is finished -- waiting
-        # for post-processor chain to complete execution.
-        if info['status'] == 'finished':
-            job.status = 'processing'
-        else:
-            job.status = info['status']
+        buffer.discard(job.id)
 
-        job.meta_update(extractor=info)
+        job.status = new_status
+        job.meta_update(progress=progress)
         job.save()
+        events.publish_status(job)
+    else:
+        buffer.update(job.id, progress)
+        hub.publish(job.id, events.progress_event(job, progress))
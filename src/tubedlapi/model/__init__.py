@@ -4,12 +4,21 @@ import glob
 import inspect
 import logging
 import os
+import sqlite3
+import time
+from contextlib import contextmanager
+from typing import (
+    Callable,
+    Iterator,
+)
+from urllib.parse import parse_qsl
+
 import peewee
-import playhouse
 
 from playhouse.migrate import (
     PostgresqlMigrator,
     SqliteMigrator,
+    migrate,
 )
 from importlib import import_module
 from malibu.text import parse_uri
@@ -24,8 +33,46 @@ log = logging.getLogger(__name__)
 database_proxy = peewee.Proxy()
 database_migrator = None
 
+# Connection options, which may also be given in the query string of
+# the DB URI, and the type each is parsed as.
+DATABASE_OPTIONS = {
+    'max_connections': int,
+    'stale_timeout': float,
+    'busy_timeout': float,
+    'journal_mode': str,
+    'synchronous': str,
+    'mmap_size': int,
+}
+
+DEFAULT_DATABASE_OPTIONS = {
+    'max_connections': 20,
+    'stale_timeout': 300.0,
+    'busy_timeout': 5.0,
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'mmap_size': 64 * 1024 * 1024,
+}
+
+
+class ObservedDatabaseMixin(object):
+    ''' Reports how long each query takes to `query_observer`, if set.
+    '''
+
+    query_observer: Callable[[float], None] = None
+
+    def execute_sql(self, *args, **kwargs):
+
+        if self.query_observer is None:
+            return super().execute_sql(*args, **kwargs)
 
-class FKSqliteDatabase(peewee.SqliteDatabase):
+        start = time.perf_counter()
+        try:
+            return super().execute_sql(*args, **kwargs)
+        finally:
+            self.query_observer(time.perf_counter() - start)
+
+
+class FKSqliteDatabase(ObservedDatabaseMixin, peewee.SqliteDatabase):
     ''' A simple wrapper around peewee's SqliteDatabase that
         enables foreign keys with a pragma when the connection
         is initialized.
@@ -47,29 +94,102 @@ class BaseModel(peewee.Model):
         database = database_proxy
 
 
-def init_database_from_uri(db_uri: str) -> peewee.Proxy:
-    ''' Builds a database connection from a DB URI.
+def parse_database_options(query: str, defaults: dict=None) -> dict:
+    ''' Merges connection options from the query string of a DB URI
+        over `defaults`.
+    '''
+
+    options = dict(DEFAULT_DATABASE_OPTIONS)
+    options.update(defaults or {})
+
+    for key, value in parse_qsl(query):
+        if key not in DATABASE_OPTIONS:
+            raise ValueError('Unknown DB option: {}'.format(key))
+
+        options[key] = DATABASE_OPTIONS[key](value)
+
+    return options
+
+
+def make_sqlite_database(path: str, options: dict) -> peewee.SqliteDatabase:
+    ''' Builds a SQLite database which opens one connection per thread,
+        tuned for concurrent use with WAL journaling.
+
+        An in-memory database is shared by every thread of the process
+        through SQLite's shared cache, and kept alive by a connection
+        which is never closed.
+    '''
+
+    pragmas = [
+        ('busy_timeout', int(options['busy_timeout'] * 1000)),
+        ('synchronous', options['synchronous']),
+    ]
+
+    # `sqlite:///:memory:` parses to `/:memory:`
+    if path.lstrip('/') == ':memory:':
+        path = 'file:tubedlapi-{}?mode=memory&cache=shared'.format(os.getpid())
+        database = FKSqliteDatabase(path, pragmas=pragmas, uri=True)
+        database._keeper = sqlite3.connect(path, uri=True)
+        return database
+
+    pragmas.extend([
+        ('journal_mode', options['journal_mode']),
+        ('mmap_size', options['mmap_size']),
+    ])
+
+    return FKSqliteDatabase(path, pragmas=pragmas, timeout=options['busy_timeout'])
+
+
+def make_postgres_database(parsed: dict, options: dict) -> peewee.Database:
+    ''' Builds a pooled Postgres database. Closing a connection
+        returns it to the pool, and pooled connections that have been
+        idle for longer than `stale_timeout` seconds are discarded.
+    '''
+
+    from playhouse.pool import PooledPostgresqlExtDatabase
+
+    class ObservedPostgresDatabase(ObservedDatabaseMixin, PooledPostgresqlExtDatabase):
+        pass
+
+    return ObservedPostgresDatabase(
+        parsed['database'],
+        max_connections=options['max_connections'],
+        stale_timeout=options['stale_timeout'],
+        user=parsed['username'],
+        password=parsed['password'],
+        host=parsed['host'],
+        port=parsed['port'],
+    )
+
+
+def init_database_from_uri(db_uri: str, options: dict=None,
+                           query_observer: Callable[[float], None]=None) -> peewee.Proxy:
+    ''' Builds a database connection from a DB URI. Connection
+        `options` may be overridden in the URI's query string, such as
+        `postgres://host/db?max_connections=50`. `query_observer` is
+        called with the duration of every query.
+
+        Connections are opened per thread, on first use. Threads that
+        are done with the database for now (a request, a pipeline
+        task) should call `close_connection`.
     '''
 
     global database_migrator
 
+    db_uri, _, query = db_uri.partition('?')
+    options = parse_database_options(query, options)
     parsed = parse_uri(db_uri)
 
     if parsed['protocol'] == 'sqlite':
-        database = FKSqliteDatabase(parsed['resource'])
+        database = make_sqlite_database(parsed['resource'], options)
         database_migrator = SqliteMigrator(database)
     elif parsed['protocol'] == 'postgres':
-        database = playhouse.postgres_ext.PostgresqlExtDatabase(
-            parsed['database'],
-            user=parsed['username'],
-            password=parsed['password'],
-            host=parsed['host'],
-            port=parsed['port'],
-        )
+        database = make_postgres_database(parsed, options)
         database_migrator = PostgresqlMigrator(database)
     else:
         raise ValueError('Unknown DB schema: {}'.format(parsed['protocol']))
 
+    database.query_observer = query_observer
     database_proxy.initialize(database)
     database.connect()
 
@@ -86,7 +206,7 @@ def init_database_from_uri(db_uri: str) -> peewee.Proxy:
             if member_obj.__name__ == 'BaseModel':
                 continue
 
-            if issubclass(member_obj, BaseModel):
+            if issubclass(member_obj, BaseModel) and member_obj not in tables:
                 log.debug('Loading database model: %s.%s.%s' % (
                     __package__, module, member))
                 tables.append(member_obj)
@@ -94,8 +214,102 @@ def init_database_from_uri(db_uri: str) -> peewee.Proxy:
     log.debug('Ensuring tables are safely created..')
 
     try:
+        # Existing tables are brought up to date before the indexes
+        # of the current schema are created
+        ensure_columns(database, tables)
+        drop_stale_indexes(database, tables)
         database.create_tables(tables, safe=True)
     except Exception:
         log.exception('An error occurred while ensuring tables')
 
+    database.close()
+
     return database_proxy
+
+
+def close_connection(*args) -> None:
+    ''' Closes this thread's connection, if it has one open. Pooled
+        connections are returned to the pool.
+
+        Accepts and ignores any arguments, so it can be used as a
+        Flask teardown function.
+    '''
+
+    if database_proxy.obj is None or database_proxy.is_closed():
+        return
+
+    database_proxy.close()
+
+
+@contextmanager
+def connection_scope() -> Iterator[None]:
+    ''' Closes the connection this thread opened within the block, if
+        it did not have one open before.
+    '''
+
+    was_closed = database_proxy.obj is None or database_proxy.is_closed()
+    try:
+        yield
+    finally:
+        if was_closed:
+            close_connection()
+
+
+def ensure_columns(database: peewee.Database, tables: list) -> None:
+    ''' Adds columns for fields that were added to a model after
+        its table was created. Added fields must be nullable or
+        have a default.
+    '''
+
+    operations = []
+    created = set(database.get_tables())
+    for model in tables:
+        table = model._meta.table_name
+        if table not in created:
+            continue
+
+        existing = {column.name for column in database.get_columns(table)}
+
+        for field in model._meta.sorted_fields:
+            if field.column_name in existing:
+                continue
+
+            log.info('Adding column %s.%s', table, field.column_name)
+            operations.append(
+                database_migrator.add_column(table, field.column_name, field),
+            )
+
+    if operations:
+        migrate(*operations)
+
+
+def drop_stale_indexes(database: peewee.Database, tables: list) -> None:
+    ''' Drops unique indexes which a model no longer declares, such
+        as one that was widened by a column, so they do not reject rows
+        the model allows now. The current indexes are created with
+        the tables.
+    '''
+
+    operations = []
+    created = set(database.get_tables())
+    for model in tables:
+        table = model._meta.table_name
+        if table not in created:
+            continue
+
+        declared = {index._name for index in model._meta.fields_to_index()}
+        primary_key = [model._meta.primary_key.column_name]
+
+        for index in database.get_indexes(table):
+            if not index.unique or index.name in declared or index.columns == primary_key:
+                continue
+
+            if not index.name.startswith(f'{table}_'):
+                continue
+
+            log.info('Dropping index %s of %s', index.name, table)
+            operations.append(database_migrator.drop_index(table, index.name))
+
+    if operations:
+        migrate(*operations)
+
@@ -0,0 +1,275 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import logging
+import os
+import socket
+from datetime import datetime
+from typing import List
+
+import peewee
+from flask import json
+from peewee import (
+    AutoField,
+    DateTimeField,
+    IntegerField,
+    TextField,
+)
+
+from tubedlapi.model import BaseModel
+from tubedlapi.model.fields import JSONBlobField
+from tubedlapi.util.transfer import file_digest
+
+log = logging.getLogger(__name__)
+
+
+def local_host() -> str:
+    ''' The name of this host, which artifacts downloaded
+        here are recorded under.
+    '''
+
+    return socket.gethostname()
+
+
+class Artifact(BaseModel):
+    ''' A downloaded file kept for reuse by later jobs.
+
+        Artifacts are found by `(extractor, video_id, format_key)`, where
+        `format_key` is a hash of the profile options which decide the
+        downloaded format, or by `source_key`, the info cache key of the
+        url they were downloaded from. Files with the same content are
+        stored once, by SHA-256.
+
+        Files are kept on the local disk of the `host` which downloaded
+        them, so hosts sharing the database only find their own.
+    '''
+
+    id = AutoField(primary_key=True)
+    host = TextField(default=local_host)
+    extractor = TextField()
+    video_id = TextField()
+    format_key = TextField()
+    source_key = TextField(index=True)
+    sha256 = TextField(index=True)
+    size = IntegerField()
+    filename = TextField()
+    info = JSONBlobField()
+    created_at = DateTimeField(default=datetime.now)
+    last_used_at = DateTimeField(default=datetime.now)
+
+    class Meta:
+        indexes = (
+            (('host', 'extractor', 'video_id', 'format_key'), True),
+        )
+
+    @staticmethod
+    def make_format_key(options: dict) -> str:
+
+        blob = json.dumps(options, sort_keys=True).encode('utf-8')
+        return hashlib.sha256(blob).hexdigest()
+
+    @classmethod
+    def find(cls, extractor: str, video_id: str, format_key: str) -> 'Artifact':
+        ''' Finds a usable artifact of a video in a format.
+        '''
+
+        if not extractor or not video_id:
+            return None
+
+        artifact = (cls
+                    .select()
+                    .where(
+                        (cls.host == local_host()) &
+                        (cls.extractor == extractor) &
+                        (cls.video_id == video_id) &
+                        (cls.format_key == format_key)
+                    )
+                    .first())
+
+        return artifact if artifact and artifact.usable() else None
+
+    @classmethod
+    def find_source(cls, source_key: str) -> 'Artifact':
+        ''' Finds a usable artifact downloaded from a url
+            with the same profile options.
+        '''
+
+        artifact = (cls
+                    .select()
+                    .where((cls.host == local_host()) & (cls.source_key == source_key))
+                    .first())
+
+        return artifact if artifact and artifact.usable() else None
+
+    @classmethod
+    def record(cls, extractor: str, video_id: str, format_key: str, source_key: str,
+               filename: str, info: dict) -> 'Artifact':
+        ''' Records the finished download at `filename`.
+
+            If a file with the same content is already retained, the new
+            file is removed and the artifact points at the existing one.
+            The retained file is stored by absolute path, in the
+            artifact and as `downloaded.path` of its `info`.
+        '''
+
+        filename = os.path.abspath(filename)
+        size = os.path.getsize(filename)
+        sha256 = file_digest(filename)
+
+        duplicate = (cls
+                     .select()
+                     .where(
+                         (cls.host == local_host()) &
+                         (cls.sha256 == sha256) &
+                         (cls.size == size)
+                     )
+                     .first())
+        if duplicate and duplicate.filename != filename and duplicate.usable():
+            log.info(
+                '%s has the same content as %s, keeping one copy',
+                filename,
+                duplicate.filename,
+            )
+            os.remove(filename)
+            filename = duplicate.filename
+
+        downloaded = dict(info.get('downloaded') or {})
+        downloaded.update({
+            'path': filename,
+            'filesize_bytes': size,
+            'sha256': sha256,
+        })
+
+        fields = {
+            'source_key': source_key,
+            'sha256': sha256,
+            'size': size,
+            'filename': filename,
+            'info': dict(info, downloaded=downloaded),
+            'last_used_at': datetime.now(),
+        }
+
+        updated = (cls
+                   .update(**fields)
+                   .where(
+                       (cls.host == local_host()) &
+                       (cls.extractor == extractor) &
+                       (cls.video_id == video_id) &
+                       (cls.format_key == format_key)
+                   )
+                   .execute())
+        if not updated:
+            try:
+                cls.create(
+                    host=local_host(),
+                    extractor=extractor,
+                    video_id=video_id,
+                    format_key=format_key,
+                    **fields
+                )
+            except peewee.IntegrityError:
+                # Recorded by a concurrent job in the meantime
+                pass
+
+        return cls.get(
+            host=local_host(),
+            extractor=extractor,
+            video_id=video_id,
+            format_key=format_key,
+        )
+
+    def info_for(self, filename: str) -> dict:
+        ''' The info of this artifact for a job which reuses it, with
+            `filename` as the name it is uploaded under.
+        '''
+
+        info = dict(self.info or {})
+        info['downloaded'] = dict(info.get('downloaded') or {})
+        info['downloaded'].update({
+            'filename': filename,
+            'path': self.filename,
+            'filesize_bytes': self.size,
+            'sha256': self.sha256,
+        })
+
+        return info
+
+    def usable(self) -> bool:
+        ''' Whether the file is still in place. Artifacts whose
+            file has gone are deleted. Artifacts of other hosts are
+            never usable here, and are left to their host.
+        '''
+
+        if self.host != local_host():
+            return False
+
+        try:
+            if os.path.getsize(self.filename) == self.size:
+                return True
+        except OSError:
+            pass
+
+        log.info('artifact %s is gone, forgetting it', self.filename)
+        self.delete_instance()
+        return False
+
+    def touch(self) -> None:
+
+        self.last_used_at = datetime.now()
+        self.save()
+
+    @classmethod
+    def sweep(cls, max_age: float=0, max_size: int=0, min_idle: float=0) -> List[str]:
+        ''' Forgets this host's artifacts which were last used more
+            than `max_age` seconds ago, then the least recently used
+            ones until their files take up at most `max_size` bytes.
+            Artifacts used within the last `min_idle` seconds are not
+            forgotten for size. A limit of 0 is no limit.
+
+            Files which no remaining artifact points at are removed,
+            and returned.
+        '''
+
+        now = datetime.now()
+        kept = {}
+        forgotten = []
+        artifacts = (cls
+                     .select()
+                     .where(cls.host == local_host())
+                     .order_by(cls.last_used_at.desc()))
+        for artifact in artifacts:
+            idle = (now - artifact.last_used_at).total_seconds()
+            if max_age and idle > max_age:
+                forgotten.append(artifact)
+                continue
+
+            # Artifacts sharing a retained file cost nothing more
+            over = sum(kept.values()) + artifact.size > max_size
+            if max_size and artifact.filename not in kept and over and idle > min_idle:
+                forgotten.append(artifact)
+                continue
+
+            kept.setdefault(artifact.filename, artifact.size)
+
+        if not forgotten:
+            return []
+
+        cls.delete().where(cls.id.in_([artifact.id for artifact in forgotten])).execute()
+
+        removed = []
+        for filename in {artifact.filename for artifact in forgotten} - set(kept):
+            try:
+                os.remove(filename)
+                removed.append(filename)
+            except FileNotFoundError:
+                pass
+
+        log.info(
+            'forgot %d artifacts, removed %d files, %d bytes retained',
+            len(forgotten),
+            len(removed),
+            sum(kept.values()),
+        )
+
+        return removed
+
@@ -2,12 +2,26 @@
 
 import json
 import logging
-from typing import Any, Union
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Union,
+)
 
-from peewee import BlobField
+from flask import json as flask_json
+from peewee import (
+    BlobField,
+    FieldAccessor,
+    Model,
+)
 
 from tubedlapi.app import inject
-from tubedlapi.util.crypto import CryptoProvider
+from tubedlapi.util.crypto import (
+    CryptoProvider,
+    PlaintextCache,
+)
 
 log = logging.getLogger(__name__)
 
@@ -19,34 +33,189 @@ def encrypt_blob(crypt: CryptoProvider, blob: bytes) -> bytes:
 
 
 @inject
-def decrypt_blob(crypt: CryptoProvider, message: bytes) -> bytes:
+def decrypt_blob(crypt: CryptoProvider, cache: PlaintextCache, message: bytes) -> bytes:
 
-    return crypt.decrypt_message(message)
+    digest = cache.digest(message)
+    blob = cache.get(digest)
+    if blob is None:
+        blob = crypt.decrypt_message(message)
+        cache.put(digest, blob)
+
+    return blob
+
+
+@inject
+def decrypt_blobs(crypt: CryptoProvider, cache: PlaintextCache,
+                  messages: Dict[bytes, bytes]) -> Dict[bytes, bytes]:
+    ''' Decrypts a mapping of `{digest: message}`, returning a mapping
+        of `{digest: blob}`. Each distinct message is decrypted at most once.
+    '''
+
+    blobs: Dict[bytes, bytes] = {}
+    for digest, message in messages.items():
+        blob = cache.get(digest)
+        if blob is None:
+            blob = crypt.decrypt_message(message)
+            cache.put(digest, blob)
+
+        blobs[digest] = blob
+
+    return blobs
+
+
+class DeferredValue(object):
+    ''' A database value which has not been converted into
+        its Python form yet.
+    '''
+
+    __slots__ = ()
+
+
+class RawJSON(DeferredValue):
+    ''' A JSON document as loaded from the database which
+        has not been parsed yet.
+    '''
+
+    __slots__ = ('blob',)
+
+    def __init__(self, blob: bytes) -> None:
+
+        self.blob = blob
+
+    def __repr__(self) -> str:
+
+        return '<RawJSON>'
+
+
+class SealedValue(DeferredValue):
+    ''' An encrypted value as loaded from the database which
+        has not been decrypted yet.
+    '''
+
+    __slots__ = ('message', '_digest')
+
+    def __init__(self, message: bytes) -> None:
+
+        self.message = message
+        self._digest: bytes = None
+
+    @property
+    def digest(self) -> bytes:
+
+        if self._digest is None:
+            self._digest = PlaintextCache.digest(self.message)
+
+        return self._digest
+
+    def __repr__(self) -> str:
+
+        return '<SealedValue>'
+
+
+class DeferredAccessor(FieldAccessor):
+    ''' Field accessor which converts a `DeferredValue` with the
+        field's `resolve` method the first time the attribute is read,
+        and keeps the converted value on the instance.
+    '''
+
+    def __get__(self, instance: Model, instance_type=None) -> Any:
+
+        if instance is None:
+            return self.field
+
+        value = instance.__data__.get(self.name)
+        if isinstance(value, DeferredValue):
+            value = self.field.resolve(value)
+            instance.__data__[self.name] = value
+
+        return value
+
+
+class JSONBlobField(BlobField):
+    ''' A `BlobField` holding a JSON document.
+
+        Documents are parsed when the attribute is first read, and
+        documents which were never read are written back as-is.
+    '''
+
+    accessor_class = DeferredAccessor
+
+    def db_value(self, value: Any) -> bytes:
+
+        if value is None:
+            return None
+
+        if isinstance(value, RawJSON):
+            return value.blob
+
+        return flask_json.dumps(value).encode('utf-8')
+
+    def python_value(self, value: Union[bytes, str]) -> RawJSON:
+
+        if value is None:
+            return None
+
+        if isinstance(value, str):
+            return RawJSON(value.encode('utf-8'))
+
+        return RawJSON(bytes(value))
+
+    def resolve(self, value: RawJSON) -> Any:
+
+        return flask_json.loads(value.blob.decode('utf-8'))
 
 
 class EncryptedBlobField(BlobField):
     ''' A normal `BlobField` with transparent encryption on top.
+
+        Values are decrypted lazily, when the attribute is first read
+        on a model instance. Queries that bypass model instances
+        (`.tuples()`, `.dicts()`, `.scalar()`) return `SealedValue`s,
+        which can be decrypted with `resolve`.
     '''
 
-    def db_value(self, value: Union[bytes, str]) -> bytes:
+    accessor_class = DeferredAccessor
+
+    def db_value(self, value: Union[bytes, str, SealedValue]) -> bytes:
         ''' Encrypt some bytes value and encode as `utf-8` string.
         '''
 
-        value_bytes: bytes = b''
-        if isinstance(value, str):
-            value_bytes = value.encode('utf-8')
-        else:
-            value_bytes = value
+        if value is None:
+            return None
 
-        enc_blob: bytes = encrypt_blob(value_bytes)
+        if isinstance(value, SealedValue):
+            # Never read since it was loaded, so the stored message is still valid.
+            return value.message
+
+        enc_blob: bytes = encrypt_blob(self.encode(value))
         return enc_blob
 
-    def python_value(self, value: bytes) -> str:
-        ''' Decrypt and decode the database value into a bytes
-            value.
+    def python_value(self, value: bytes) -> SealedValue:
+        ''' Wrap the database value so that it is only decrypted
+            when it is actually used.
         '''
 
-        return decrypt_blob(value).decode('utf-8')
+        if value is None:
+            return None
+
+        return SealedValue(bytes(value))
+
+    def encode(self, value: Union[bytes, str]) -> bytes:
+
+        if isinstance(value, str):
+            return value.encode('utf-8')
+
+        return value
+
+    def decode(self, blob: bytes) -> str:
+
+        return blob.decode('utf-8')
+
+    def resolve(self, value: SealedValue) -> Any:
+        ''' Decrypt and decode a sealed database value.
+        '''
+
+        return self.decode(decrypt_blob(value.message))
 
 
 class EncryptedJSONBlobField(EncryptedBlobField):
@@ -55,16 +224,44 @@ class EncryptedJSONBlobField(EncryptedBlobField):
         library.
     '''
 
-    def db_value(self, value: Any) -> bytes:
-        ''' Encode some value into JSON, encrypt
-            the JSON blob, and encode as `utf-8` string.
+    def encode(self, value: Any) -> bytes:
+        ''' Encode some value into JSON before it is encrypted.
         '''
 
-        return super().db_value(json.dumps(value))
+        return super().encode(json.dumps(value))
 
-    def python_value(self, value: bytes) -> Any:
-        ''' Decrypt and decode the stored value from JSON
-            into a Python object.
+    def decode(self, blob: bytes) -> Any:
+        ''' Decode the decrypted JSON blob into a Python object.
         '''
 
-        return json.loads(super().python_value(value))
+        return json.loads(super().decode(blob))
+
+
+def unseal_rows(rows: Iterable[Model], *fields: EncryptedBlobField) -> List[Model]:
+    ''' Decrypts `fields` on every row of a result set in one pass.
+
+        Identical ciphertexts are only decrypted once and the plaintexts
+        go through the same cache as single-row reads, so repeated
+        listings are mostly cache hits.
+    '''
+
+    rows = list(rows)
+
+    pending: Dict[bytes, bytes] = {}
+    for row in rows:
+        for field in fields:
+            value = row.__data__.get(field.name)
+            if isinstance(value, SealedValue):
+                pending.setdefault(value.digest, value.message)
+
+    if not pending:
+        return rows
+
+    blobs = decrypt_blobs(pending)
+    for row in rows:
+        for field in fields:
+            value = row.__data__.get(field.name)
+            if isinstance(value, SealedValue):
+                row.__data__[field.name] = field.decode(blobs[value.digest])
+
+    return rows
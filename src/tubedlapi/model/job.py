@@ -1,54 +1,307 @@
 # -*- coding: utf-8 -*-
 
-import codecs
+import functools
 import uuid
 from datetime import datetime
+from typing import (
+    Dict,
+    Iterable,
+    List,
+    Tuple,
+)
 
+import peewee
 from flask import json
 from peewee import (
-    BlobField,
+    Case,
     DateTimeField,
+    ForeignKeyField,
+    IntegerField,
     TextField,
     UUIDField,
+    Value,
 )
 
 from tubedlapi.model import BaseModel
+from tubedlapi.model.fields import JSONBlobField
+from tubedlapi.util.scheduler import PRIORITY_NORMAL
 
 
 class Job(BaseModel):
+    ''' A single download job.
+
+        Small job metadata (url, profile, destinations, ...) lives in
+        `meta`. The large sections in `SECTIONS` each live in their own
+        column, so a status change only writes the columns which changed.
+
+        A playlist job is `expanded` into one child job per entry. It
+        counts its finished children, and finishes with the last one.
+
+        Jobs with a higher `priority` are fetched first, see
+        `util.scheduler` for the named priorities.
+    '''
+
+    SECTIONS = ('info', 'extractor', 'progress', 'result')
+    TERMINAL_STATUSES = ('cancelled', 'completed', 'failed')
 
     id = UUIDField(primary_key=True, unique=True, default=uuid.uuid4)
     created_at = DateTimeField(default=datetime.now)
     status = TextField()
-    meta = BlobField()
+    priority = IntegerField(default=PRIORITY_NORMAL)
+    meta = JSONBlobField()
+    info = JSONBlobField(null=True)
+    extractor = JSONBlobField(null=True)
+    progress = JSONBlobField(null=True)
+    result = JSONBlobField(null=True)
+    parent = ForeignKeyField('self', null=True, backref='children', on_delete='CASCADE')
+    children_total = IntegerField(default=0)
+    children_completed = IntegerField(default=0)
+    children_failed = IntegerField(default=0)
+
+    class Meta:
+        only_save_dirty = True
+        indexes = (
+            # Keyset pagination over all jobs, and over jobs by status
+            (('created_at', 'id'), False),
+            (('status', 'created_at', 'id'), False),
+        )
+
+    @classmethod
+    def select_page(cls, limit: int, statuses: List[str]=None, since: datetime=None,
+                    until: datetime=None, after: Tuple[datetime, uuid.UUID]=None) -> peewee.Query:
+        ''' Selects a page of jobs, newest first, using keyset pagination
+            on `(created_at, id)`. `after` is the `(created_at, id)` of
+            the last job on the previous page.
+
+            Only the columns needed to list jobs are selected.
+        '''
+
+        query = (cls
+                 .select(cls.id, cls.created_at, cls.status, cls.priority, cls.meta, cls.progress,
+                         cls.parent, cls.children_total, cls.children_completed,
+                         cls.children_failed)
+                 .order_by(cls.created_at.desc(), cls.id.desc())
+                 .limit(limit))
+
+        if statuses:
+            query = query.where(cls.status.in_(statuses))
+
+        if since:
+            query = query.where(cls.created_at >= since)
+
+        if until:
+            query = query.where(cls.created_at < until)
+
+        if after:
+            created_at, job_id = after
+            query = query.where(
+                (cls.created_at < created_at) |
+                ((cls.created_at == created_at) & (cls.id < job_id))
+            )
+
+        return query
+
+    @classmethod
+    def create_many(cls, metas: Iterable[dict], status: str='queued', parent: 'Job'=None,
+                    priority: int=PRIORITY_NORMAL, priorities: Iterable[int]=None,
+                    chunk_size: int=100) -> List['Job']:
+        ''' Creates a job for each of `metas` in one transaction, with
+            one multi-row insert per `chunk_size` jobs, optionally as
+            children of `parent`. Jobs get `priority`, or the matching
+            entry of `priorities` if given.
+
+            Ids and timestamps are generated here, so the returned
+            jobs are usable without reading them back.
+        '''
+
+        metas = list(metas)
+        priorities = list(priorities) if priorities is not None else [priority] * len(metas)
+
+        now = datetime.now()
+        rows = [{
+            'id': uuid.uuid4(),
+            'created_at': now,
+            'status': status,
+            'priority': job_priority,
+            'meta': meta,
+            'parent': parent.id if parent else None,
+        } for meta, job_priority in zip(metas, priorities)]
+
+        with cls._meta.database.atomic():
+            for offset in range(0, len(rows), chunk_size):
+                cls.insert_many(rows[offset:offset + chunk_size]).execute()
+
+        jobs = []
+        for row in rows:
+            job = cls(**row)
+            # Already written, nothing is dirty until the job is modified.
+            job._dirty.clear()
+            jobs.append(job)
+
+        return jobs
+
+    @classmethod
+    def child_finished(cls, parent_id: uuid.UUID, failed: bool) -> Tuple['Job', bool]:
+        ''' Counts a finished child of the job `parent_id`.
+
+            Counters are incremented in the database, so children finishing
+            at the same time in different threads or processes are all
+            counted, and exactly one of them finishes the parent. Returns
+            the parent and whether it was finished by this call.
+        '''
+
+        counter = cls.children_failed if failed else cls.children_completed
+        cls.update({counter: counter + 1}).where(cls.id == parent_id).execute()
+
+        # The statuses are converted as text explicitly, as they would
+        # otherwise be converted like the integer fields they follow
+        status = functools.partial(Value, converter=cls.status.db_value)
+        finished = (cls
+                    .update(status=Case(None, (
+                        (cls.children_failed >= cls.children_total, status('failed')),
+                    ), status('completed')))
+                    .where(
+                        (cls.id == parent_id) &
+                        (cls.status == 'expanded') &
+                        (cls.children_completed + cls.children_failed >= cls.children_total)
+                    )
+                    .execute())
+
+        return cls.get(id=parent_id), bool(finished)
+
+    @classmethod
+    def cancel(cls, job_id: uuid.UUID) -> Dict[uuid.UUID, str]:
+        ''' Marks job `job_id` and its unfinished descendants as
+            `cancelled`. Jobs which already finished are left alone.
+
+            Returns the status each cancelled job had before, by id.
+        '''
+
+        cancelled: Dict[uuid.UUID, str] = {}
+        unfinished = ~cls.status.in_(cls.TERMINAL_STATUSES)
+
+        with cls._meta.database.atomic():
+            query = cls.select(cls.id, cls.status).where((cls.id == job_id) & unfinished)
+            while True:
+                found = {job.id: job.status for job in query}
+                if not found:
+                    break
+
+                cls.update(status='cancelled').where(cls.id.in_(list(found)) & unfinished).execute()
+                cancelled.update(found)
+
+                query = cls.select(cls.id, cls.status).where(
+                    cls.parent.in_(list(found)) & unfinished
+                )
+
+        return cancelled
+
+    @classmethod
+    def is_cancelled(cls, job_id: uuid.UUID) -> bool:
+        ''' Whether job `job_id` is marked `cancelled` in the database.
+        '''
+
+        return cls.select(cls.status).where(cls.id == job_id).scalar() == 'cancelled'
 
     @classmethod
     def from_json(self, data: bytes) -> 'Job':
 
         return Job(**json.loads(data))
 
+    @property
+    def is_done(self) -> bool:
+        ''' Whether the pipeline is finished with this job. A `finished`
+            download is only done when there is nothing to upload.
+        '''
+
+        if self.status in self.TERMINAL_STATUSES:
+            return True
+
+        return self.status == 'finished' and not (self.meta or {}).get('destinations')
+
     @property
     def meta_dict(self) -> dict:
+        ''' The job metadata merged with each non-empty section.
+        '''
 
-        return json.loads(self.meta)
+        return self._merged_meta(self.SECTIONS)
 
-    def meta_update(self, **kw) -> dict:
+    def _merged_meta(self, sections: Tuple[str, ...]) -> dict:
 
-        meta = self.meta_dict
-        meta.update(kw)
-        self.meta = json.dumps(meta)
+        meta = dict(self.meta or {})
+        for section in sections:
+            value = getattr(self, section)
+            if value is not None:
+                meta[section] = value
 
         return meta
 
-    def to_dict(self) -> dict:
+    def save(self, force_insert: bool=False, only=None):
+        ''' Saves the job. A changed status is only written while the
+            job is not `cancelled` in the database, so a job cancelled
+            through another process stays cancelled. The job takes on
+            the `cancelled` status instead.
+
+            The status and the other changed columns are written in
+            one transaction, so neither is kept without the other.
+        '''
+
+        with self._meta.database.atomic():
+            if (not force_insert and only is None and 'status' in self._dirty and
+                    self.status != 'cancelled'):
+                updated = (Job
+                           .update(status=self.status)
+                           .where((Job.id == self.id) & (Job.status != 'cancelled'))
+                           .execute())
+                if not updated:
+                    self.status = 'cancelled'
+                self._dirty.discard('status')
+
+            return super().save(force_insert=force_insert, only=only)
+
+    def meta_update(self, **kw) -> dict:
+        ''' Updates job metadata in place. Only the columns touched
+            by `kw` are marked dirty and written on the next `save()`.
+        '''
+
+        meta = None
+        for key, value in kw.items():
+            if key in self.SECTIONS:
+                setattr(self, key, value)
+            else:
+                meta = meta if meta is not None else dict(self.meta or {})
+                meta[key] = value
+
+        if meta is not None:
+            self.meta = meta
+
+        return self.meta_dict
+
+    def to_dict(self, sections: Tuple[str, ...]=SECTIONS) -> dict:
+        ''' Dictionary representation of a Job. Only the
+            metadata sections named in `sections` are included.
+        '''
 
-        return {
+        data = {
             'id': self.id,
             'created_at': self.created_at,
             'status': self.status,
-            'meta': self.meta_dict,
+            'priority': self.priority,
+            'meta': self._merged_meta(sections),
         }
 
+        if self.parent_id is not None:
+            data['parent'] = self.parent_id
+
+        if self.children_total:
+            data['children'] = {
+                'total': self.children_total,
+                'completed': self.children_completed,
+                'failed': self.children_failed,
+            }
+
+        return data
+
     def to_json(self) -> bytes:
 
         return json.dumps(self.to_dict())
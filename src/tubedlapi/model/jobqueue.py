@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+import uuid
+from datetime import (
+    datetime,
+    timedelta,
+)
+from typing import List
+
+from peewee import (
+    AutoField,
+    DateTimeField,
+    ForeignKeyField,
+    IntegerField,
+    TextField,
+)
+
+from tubedlapi.model import BaseModel
+from tubedlapi.model.job import Job
+from tubedlapi.util.scheduler import PRIORITY_NORMAL
+
+STATE_PENDING = 'pending'
+STATE_CLAIMED = 'claimed'
+STATE_CANCELLED = 'cancelled'
+
+
+class QueueEntry(BaseModel):
+    ''' A job waiting for, or being run by, a worker process.
+
+        Entries are claimed with a lease that the worker renews while
+        the job runs. If a worker dies, its lease expires and the entry
+        can be claimed by another worker. Every claim gets a new
+        `lease_token`, and entries are removed once the job pipeline
+        has finished, only by the claim which still holds them.
+
+        Cancelling a job removes its entry if no worker has claimed it
+        yet. Otherwise the entry is marked `cancelled`, and the worker
+        holding it stops the job when it next renews its leases.
+    '''
+
+    id = AutoField(primary_key=True)
+    job = ForeignKeyField(Job, unique=True, on_delete='CASCADE')
+    created_at = DateTimeField(default=datetime.now)
+    state = TextField(default=STATE_PENDING)
+    priority = IntegerField(default=PRIORITY_NORMAL)
+    attempts = IntegerField(default=0)
+    worker = TextField(null=True)
+    lease_expires_at = DateTimeField(null=True)
+    lease_token = TextField(null=True)
+
+    class Meta:
+        table_name = 'job_queue'
+        indexes = (
+            (('state', 'lease_expires_at'), False),
+            (('state', 'priority', 'id'), False),
+        )
+
+    @classmethod
+    def enqueue(cls, job: Job) -> 'QueueEntry':
+
+        return cls.create(job=job, priority=job.priority)
+
+    @classmethod
+    def enqueue_many(cls, jobs: List[Job], chunk_size: int=200) -> None:
+        ''' Enqueues `jobs` in one transaction.
+        '''
+
+        now = datetime.now()
+        rows = [{'job': job.id, 'created_at': now, 'priority': job.priority} for job in jobs]
+
+        with cls._meta.database.atomic():
+            for offset in range(0, len(rows), chunk_size):
+                cls.insert_many(rows[offset:offset + chunk_size]).execute()
+
+    @classmethod
+    def _claimable(cls, now: datetime):
+
+        return (
+            (cls.state == STATE_PENDING) |
+            ((cls.state == STATE_CLAIMED) & (cls.lease_expires_at < now))
+        )
+
+    @classmethod
+    def claim(cls, worker: str, limit: int, lease: int) -> List['QueueEntry']:
+        ''' Claims up to `limit` entries for `worker`, holding each
+            for `lease` seconds.
+
+            Each entry is claimed with a conditional update, so two
+            workers racing for the same entry can never both win. Higher
+            priorities are claimed first, oldest first within a priority.
+        '''
+
+        now = datetime.now()
+        candidates = (cls
+                      .select(cls.id)
+                      .where(cls._claimable(now))
+                      .order_by(cls.priority.desc(), cls.id)
+                      .limit(limit))
+
+        claimed: List[int] = []
+        for candidate in candidates:
+            updated = (cls
+                       .update(
+                           state=STATE_CLAIMED,
+                           worker=worker,
+                           lease_expires_at=now + timedelta(seconds=lease),
+                           lease_token=uuid.uuid4().hex,
+                           attempts=cls.attempts + 1,
+                       )
+                       .where((cls.id == candidate.id) & cls._claimable(now))
+                       .execute())
+            if updated:
+                claimed.append(candidate.id)
+
+        if not claimed:
+            return []
+
+        return list(cls
+                    .select(cls, Job)
+                    .join(Job)
+                    .where(cls.id.in_(claimed))
+                    .order_by(cls.priority.desc(), cls.id))
+
+    @classmethod
+    def renew(cls, worker: str, ids: List[int], lease: int) -> int:
+        ''' Extends the lease on entries still held by `worker`.
+        '''
+
+        if not ids:
+            return 0
+
+        return (cls
+                .update(lease_expires_at=datetime.now() + timedelta(seconds=lease))
+                .where((cls.id.in_(ids)) & (cls.worker == worker))
+                .execute())
+
+    @classmethod
+    def cancel(cls, job_ids: List[uuid.UUID]) -> List[uuid.UUID]:
+        ''' Cancels the entries of `job_ids`. Returns the ids of the
+            jobs which were still waiting for a worker, and so will
+            never run.
+        '''
+
+        if not job_ids:
+            return []
+
+        with cls._meta.database.atomic():
+            pending = [
+                entry.job_id for entry in (cls
+                                           .select(cls.job)
+                                           .where(cls.job.in_(job_ids) &
+                                                  (cls.state == STATE_PENDING)))
+            ]
+            if pending:
+                cls.delete().where(cls.job.in_(pending) & (cls.state == STATE_PENDING)).execute()
+
+            (cls
+             .update(state=STATE_CANCELLED)
+             .where(cls.job.in_(job_ids) & (cls.state == STATE_CLAIMED))
+             .execute())
+
+        return pending
+
+    @classmethod
+    def cancelled(cls, worker: str, ids: List[int]) -> List[uuid.UUID]:
+        ''' Returns the jobs of the entries out of `ids`, held by
+            `worker`, which were cancelled.
+        '''
+
+        if not ids:
+            return []
+
+        return [
+            entry.job_id for entry in (cls
+                                       .select(cls.job)
+                                       .where((cls.id.in_(ids)) &
+                                              (cls.worker == worker) &
+                                              (cls.state == STATE_CANCELLED)))
+        ]
+
+    def finish(self) -> bool:
+        ''' Removes this entry once its job has finished, unless the
+            entry was claimed again since this claim, after its lease
+            expired. Returns whether the entry was removed.
+        '''
+
+        cls = type(self)
+        return bool(cls
+                    .delete()
+                    .where(
+                        (cls.id == self.id) &
+                        (cls.worker == self.worker) &
+                        (cls.lease_token == self.lease_token)
+                    )
+                    .execute())
@@ -1,16 +1,27 @@
 # -*- coding: utf-8 -*-
 
-import codecs
+import logging
+import threading
+import time
+from typing import (
+    Dict,
+    Iterable,
+    List,
+)
 
+import peewee
 from flask import json
 from peewee import (
     AutoField,
     BlobField,
+    IntegerField,
     TextField,
 )
 
 from tubedlapi.model import BaseModel
 
+log = logging.getLogger(__name__)
+
 
 class Profile(BaseModel):
 
@@ -23,10 +34,30 @@ class Profile(BaseModel):
 
         return Profile(**json.loads(data))
 
+    @staticmethod
+    def decode_options(data: bytes) -> dict:
+        ''' Decodes stored profile options, which must be an object.
+        '''
+
+        options = json.loads(data)
+        if not isinstance(options, dict):
+            raise ValueError('profile options must be an object')
+
+        return options
+
     @property
     def options_dict(self) -> dict:
+        ''' The decoded options. They are decoded once for as long as
+            `options` is unchanged, and shared by every caller, so they
+            must not be modified.
+        '''
 
-        return json.loads(self.options)
+        cached = self.__dict__.get('_options_cache')
+        if cached is None or cached[0] is not self.options:
+            cached = (self.options, self.decode_options(self.options))
+            self._options_cache = cached
+
+        return cached[1]
 
     def to_dict(self) -> dict:
 
@@ -39,3 +70,243 @@ class Profile(BaseModel):
     def to_json(self) -> bytes:
 
         return json.dumps(self.to_dict())
+
+
+class ProfileVersion(BaseModel):
+    ''' A counter which is bumped whenever a profile is created or
+        deleted, so processes caching profiles can tell when their
+        copies are stale.
+    '''
+
+    ROW = 1
+
+    id = IntegerField(primary_key=True)
+    version = IntegerField(default=0)
+
+    class Meta:
+        table_name = 'profile_version'
+
+    @classmethod
+    def current(cls) -> int:
+
+        return cls.select(cls.version).where(cls.id == cls.ROW).scalar() or 0
+
+    @classmethod
+    def bump(cls) -> int:
+        ''' Increments the counter and returns its new value.
+        '''
+
+        with cls._meta.database.atomic():
+            bumped = cls.update(version=cls.version + 1).where(cls.id == cls.ROW).execute()
+            if not bumped:
+                try:
+                    with cls._meta.database.atomic():
+                        cls.create(id=cls.ROW, version=1)
+                except peewee.IntegrityError:
+                    # Created by another process in the meantime
+                    cls.update(version=cls.version + 1).where(cls.id == cls.ROW).execute()
+
+            return cls.current()
+
+
+class ProfileCache(object):
+    ''' Profiles, with their options decoded and validated, held in
+        process by name and by id.
+
+        The cache is emptied when `invalidate` is called, and when the
+        `ProfileVersion` counter was bumped by another process. The
+        counter is read at most once every `check_interval` seconds,
+        so changes made elsewhere show up within that time.
+    '''
+
+    def __init__(self, check_interval: float=5.0) -> None:
+
+        self.check_interval = check_interval
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        self._by_name: Dict[str, Profile] = {}
+        self._by_id: Dict[int, Profile] = {}
+        self._complete = False
+        self._generation = 0
+        self._version: int = None
+        self._checked_at: float = None
+        self._lock = threading.Lock()
+
+    def get(self, name: str=None, id: int=None) -> Profile:
+        ''' Returns the profile with `name` (or `id`). Raises
+            `Profile.DoesNotExist` if there is none.
+        '''
+
+        self._check()
+
+        with self._lock:
+            if name is not None:
+                profile = self._by_name.get(name)
+            else:
+                profile = self._by_id.get(id)
+
+            if profile is not None:
+                self.hits += 1
+                return profile
+
+            self.misses += 1
+            generation = self._generation
+
+        if name is not None:
+            profile = Profile.get(Profile.name == name)
+        else:
+            profile = Profile.get(Profile.id == id)
+
+        self._add([profile], generation)
+        return profile
+
+    def get_many(self, names: Iterable[str]) -> Dict[str, Profile]:
+        ''' Returns the profiles that exist out of `names`, by name,
+            loading any that are not cached with a single query.
+        '''
+
+        self._check()
+
+        found = {}
+        missing = []
+        with self._lock:
+            for name in set(names):
+                profile = self._by_name.get(name)
+                if profile is None:
+                    missing.append(name)
+                else:
+                    found[name] = profile
+
+            self.hits += len(found)
+            self.misses += len(missing)
+            generation = self._generation
+
+        if missing:
+            loaded = list(Profile.select().where(Profile.name.in_(missing)))
+            self._add(loaded, generation)
+            found.update((profile.name, profile) for profile in loaded)
+
+        return found
+
+    def all(self) -> List[Profile]:
+        ''' Returns every profile, ordered by id.
+        '''
+
+        self._check()
+
+        with self._lock:
+            if self._complete:
+                self.hits += 1
+                return sorted(self._by_id.values(), key=lambda profile: profile.id)
+
+            self.misses += 1
+            generation = self._generation
+
+        profiles = list(Profile.select().order_by(Profile.id))
+        if self._add(profiles, generation):
+            with self._lock:
+                if self._generation == generation:
+                    self._complete = True
+
+        return profiles
+
+    def invalidate(self) -> None:
+        ''' Empties the cache here, and in every other process once
+            it next checks the version counter.
+        '''
+
+        version = ProfileVersion.bump()
+        with self._lock:
+            self._clear()
+            self._version = version
+            self._checked_at = time.monotonic()
+
+    def _add(self, profiles: List[Profile], generation: int) -> bool:
+        ''' Caches `profiles`, unless the cache was emptied since they
+            were loaded. Profiles with invalid options are not cached.
+        '''
+
+        valid = []
+        for profile in profiles:
+            try:
+                profile.options_dict
+            except ValueError:
+                log.warning('profile %s has invalid options, not caching it', profile.name)
+                continue
+
+            valid.append(profile)
+
+        with self._lock:
+            if self._generation != generation:
+                return False
+
+            for profile in valid:
+                self._by_name[profile.name] = profile
+                self._by_id[profile.id] = profile
+
+        return len(valid) == len(profiles)
+
+    def _clear(self) -> None:
+
+        self._by_name.clear()
+        self._by_id.clear()
+        self._complete = False
+        self._generation += 1
+        self.invalidations += 1
+
+    def _check(self) -> None:
+
+        now = time.monotonic()
+        checked_at = self._checked_at
+        if checked_at is not None and now - checked_at < self.check_interval:
+            return
+
+        version = ProfileVersion.current()
+        with self._lock:
+            self._checked_at = now
+            if version != self._version:
+                if self._version is not None:
+                    log.debug('profiles changed in another process, emptying the cache')
+                    self._clear()
+
+                self._version = version
+
+    def __len__(self) -> int:
+
+        return len(self._by_id)
+
+    def stats(self) -> dict:
+
+        return {
+            'size': len(self),
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'version': self._version,
+        }
+
+
+def _profile_cache() -> ProfileCache:
+
+    # Imported here, as the application imports this module while
+    # it registers its components
+    from tubedlapi.app import registry
+
+    return registry[ProfileCache]
+
+
+def find_profile(name: str) -> Profile:
+    ''' Looks up a profile by name through the profile cache.
+        Raises `Profile.DoesNotExist` if there is none.
+    '''
+
+    return _profile_cache().get(name=name)
+
+
+def find_profiles(names: Iterable[str]) -> Dict[str, Profile]:
+    ''' Looks up the profiles out of `names` that exist, by name.
+    '''
+
+    return _profile_cache().get_many(names)
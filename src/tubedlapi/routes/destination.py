@@ -12,7 +12,10 @@ from flask import (
 )
 from flask.json import jsonify
 
+from tubedlapi.app import inject
 from tubedlapi.model.destination import Destination
+from tubedlapi.model.fields import unseal_rows
+from tubedlapi.util.fspool import FSPool
 
 blueprint = Blueprint(
     'destination',
@@ -22,6 +25,12 @@ blueprint = Blueprint(
 log = logging.getLogger(__name__)
 
 
+@inject
+def discard_connections(pool: FSPool, dest: Destination) -> None:
+
+    pool.discard(dest.id)
+
+
 @blueprint.route('/', methods=['GET'])
 def list_destinations() -> Response:
     ''' GET /destinations/
@@ -64,7 +73,8 @@ def list_destinations() -> Response:
               ]
     '''
 
-    return jsonify([d.to_dict() for d in Destination.select()])
+    destinations = unseal_rows(Destination.select(), Destination.url)
+    return jsonify([d.to_dict() for d in destinations])
 
 
 @blueprint.route('/', methods=['POST'])
@@ -207,6 +217,7 @@ def delete_destination(name) -> Response:
         res = Destination.get(name=name)
         last_state = res.to_dict()
         res.delete_instance()
+        discard_connections(res)
 
         return jsonify({
             'message': 'deleted',
@@ -1,18 +1,38 @@
 # -*- coding: utf-8 -*-
 
+import base64
 import logging
+import uuid
+from datetime import datetime
 from http import HTTPStatus as status
+from typing import Tuple
 
 from flask import (
     Blueprint,
+    Response,
     json,
     request,
+    stream_with_context,
 )
 from flask.json import jsonify
 
-from tubedlapi.exec import stage
+from tubedlapi.app import inject
+from tubedlapi.components.settings import Settings
+from tubedlapi.exec import (
+    events,
+    stage,
+)
 from tubedlapi.model.job import Job
-from tubedlapi.model.profile import Profile
+from tubedlapi.model.profile import (
+    Profile,
+    find_profile,
+    find_profiles,
+)
+from tubedlapi.util.scheduler import (
+    PRIORITY_LOW,
+    PRIORITY_NORMAL,
+    parse_priority,
+)
 
 log = logging.getLogger(__name__)
 blueprint = Blueprint(
@@ -22,17 +42,165 @@ blueprint = Blueprint(
 )
 
 
+CURSOR_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+TIME_FORMATS = (
+    CURSOR_TIME_FORMAT,
+    '%Y-%m-%dT%H:%M:%S',
+    '%Y-%m-%d',
+)
+PAGE_SIZE_DEFAULT = 50
+PAGE_SIZE_MAX = 500
+BATCH_SIZE_MAX = 10000
+
+
+@inject
+def client_id(settings: Settings) -> str:
+    ''' Identifies the API client making the current request, by the
+        `SCHEDULER_CLIENT_HEADER` header or else its address.
+    '''
+
+    return request.headers.get(settings.SCHEDULER_CLIENT_HEADER) or request.remote_addr or ''
+
+
+def _encode_cursor(job: Job) -> str:
+
+    value = '{}|{}'.format(job.created_at.strftime(CURSOR_TIME_FORMAT), job.id.hex)
+    return base64.urlsafe_b64encode(value.encode('utf-8')).decode('utf-8')
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+
+    value = base64.urlsafe_b64decode(cursor.encode('utf-8')).decode('utf-8')
+    created_at, _, job_id = value.partition('|')
+
+    return datetime.strptime(created_at, CURSOR_TIME_FORMAT), uuid.UUID(job_id)
+
+
+def _parse_time(value: str) -> datetime:
+
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+
+    try:
+        return datetime.fromtimestamp(float(value))
+    except (OverflowError, OSError) as e:
+        # Out of range for the platform, such as `1e20` or `inf`
+        raise ValueError(f'timestamp out of range: {value}') from e
+
+
+@blueprint.route('/', methods=['GET'])
+def list_jobs():
+    ''' GET /jobs/
+
+        Returns a page of jobs, newest first. Pass `next_cursor` from
+        the response as `cursor` to fetch the following page.
+        ---
+        tags:
+          - Jobs
+        parameters:
+          - name: status
+            in: query
+            type: string
+            description: Comma-separated list of statuses to include
+          - name: since
+            in: query
+            type: string
+            description: Only jobs created at or after this time (ISO 8601 or unix time)
+          - name: until
+            in: query
+            type: string
+            description: Only jobs created before this time (ISO 8601 or unix time)
+          - name: limit
+            in: query
+            type: integer
+            description: Page size, at most 500
+          - name: cursor
+            in: query
+            type: string
+            description: Cursor from the previous page
+        responses:
+          200:
+            description: a page of jobs
+            examples:
+              {
+                  "jobs": [
+                      {
+                          "id": "7a3c5ae0-2b8e-4b8e-9d47-9f6b2b0f8f8a",
+                          "created_at": "Sat, 17 Mar 2018 18:04:01 GMT",
+                          "status": "queued",
+                          "meta": {
+                              "url": "https://youtu.be/dQw4w9WgXcQ",
+                              "profile": "audio"
+                          }
+                      }
+                  ],
+                  "next_cursor": "MjAxOC0wMy0xN1QxODowNDowMS4wMDAwMDB8N2EzYzVhZTA"
+              }
+          400:
+            description: Malformed query parameters
+            schema:
+              properties:
+                message:
+                  type: string
+    '''
+
+    try:
+        limit = int(request.args.get('limit', PAGE_SIZE_DEFAULT))
+        limit = max(1, min(limit, PAGE_SIZE_MAX))
+        since = request.args.get('since')
+        until = request.args.get('until')
+        cursor = request.args.get('cursor')
+
+        query = Job.select_page(
+            limit + 1,
+            statuses=[s for s in request.args.get('status', '').split(',') if s],
+            since=_parse_time(since) if since else None,
+            until=_parse_time(until) if until else None,
+            after=_decode_cursor(cursor) if cursor else None,
+        )
+    except ValueError as e:
+        return jsonify({
+            'message': f'malformed query: {e}',
+            'query': request.args.to_dict(),
+        }), status.BAD_REQUEST
+
+    jobs = list(query)
+    next_cursor = None
+    if len(jobs) > limit:
+        jobs = jobs[:limit]
+        next_cursor = _encode_cursor(jobs[-1])
+
+    return jsonify({
+        'jobs': [job.to_dict(sections=('progress',)) for job in jobs],
+        'next_cursor': next_cursor,
+    })
+
+
 @blueprint.route('/', methods=['POST'])
 def create_job():
     ''' POST /job/
 
-        Creates a new job from a JSON payload.
+        Creates a new job from a JSON payload. `priority` is one of
+        `low`, `normal` (the default) or `high`, or an integer.
     '''
 
     payload = request.get_json()
     url = payload.get('url')
     profile = payload.get('profile')
 
+    try:
+        priority = parse_priority(payload.pop('priority', None), PRIORITY_NORMAL)
+    except ValueError as e:
+        return jsonify({
+            'message': str(e),
+            'request': {
+                'body': payload,
+            },
+        }), status.BAD_REQUEST
+
     if not url or not profile:
         return jsonify({
             'message': 'body must contain `url` and `profile`',
@@ -42,7 +210,7 @@ def create_job():
         }), status.BAD_REQUEST
 
     try:
-        profile = Profile.get(name=profile)
+        profile = find_profile(profile)
     except Profile.DoesNotExist:
         return jsonify({
             'message': 'profile not found',
@@ -54,22 +222,247 @@ def create_job():
     # TODO: Do validation of `destinations` list
     # TODO: Make sure each destination is included only once (collapse mult)
 
+    payload['client'] = client_id()
+
     job_record = Job.create(
         status='queued',
-        meta=json.dumps(payload),
+        priority=priority,
+        meta=payload,
     )
 
-    stage.job_begin_fetch(job_record, profile)
+    stage.job_submit(job_record, profile)
 
     return job_record.to_json()
 
 
+@blueprint.route('/batch', methods=['POST'])
+def create_jobs():
+    ''' POST /jobs/batch
+
+        Creates jobs from a JSON list of job payloads, in one transaction.
+        Batch jobs default to `low` priority, so they fill idle capacity
+        without delaying jobs submitted one at a time.
+        ---
+        tags:
+          - Jobs
+        parameters:
+          - name: body
+            in: body
+            required: true
+            schema:
+              type: array
+              items:
+                properties:
+                  url:
+                    type: string
+                  profile:
+                    type: string
+                  destinations:
+                    type: array
+                    items:
+                      type: string
+                  priority:
+                    type: string
+                    description: low (default), normal, high, or an integer
+        responses:
+          200:
+            description: |
+              The id of each created job, or the reason it was not
+              created, by position in the request
+            examples:
+              {
+                  "jobs": [
+                      {"index": 0, "id": "7a3c5ae0-2b8e-4b8e-9d47-9f6b2b0f8f8a"},
+                      {"index": 1, "error": "profile not found: video"}
+                  ],
+                  "created": 1,
+                  "failed": 1
+              }
+          400:
+            description: The body is not a list, or is too long
+            schema:
+              properties:
+                message:
+                  type: string
+    '''
+
+    payload = request.get_json()
+    if not isinstance(payload, list):
+        return jsonify({
+            'message': 'body must be a list of jobs',
+        }), status.BAD_REQUEST
+
+    if len(payload) > BATCH_SIZE_MAX:
+        return jsonify({
+            'message': f'at most {BATCH_SIZE_MAX} jobs may be submitted at once',
+        }), status.BAD_REQUEST
+
+    # Resolve every profile named in the batch at once
+    names = {
+        item.get('profile') for item in payload
+        if isinstance(item, dict) and isinstance(item.get('profile'), str)
+    }
+    profiles = find_profiles(names) if names else {}
+
+    client = client_id()
+
+    results = []
+    accepted = []
+    priorities = []
+    for index, item in enumerate(payload):
+        error = None
+        if not isinstance(item, dict) or not item.get('url') or not item.get('profile'):
+            error = 'job must contain `url` and `profile`'
+        elif not isinstance(item['profile'], str):
+            error = '`profile` must be a string'
+        elif not isinstance(item.get('destinations', []), list):
+            error = '`destinations` must be a list'
+        elif item['profile'] not in profiles:
+            error = f'profile not found: {item["profile"]}'
+        else:
+            try:
+                priority = parse_priority(item.pop('priority', None), PRIORITY_LOW)
+            except ValueError as e:
+                error = str(e)
+
+        if error:
+            results.append({'index': index, 'error': error})
+        else:
+            item['client'] = client
+            results.append({'index': index})
+            accepted.append((index, item))
+            priorities.append(priority)
+
+    jobs = Job.create_many((item for _, item in accepted), priorities=priorities)
+    for (index, item), job in zip(accepted, jobs):
+        results[index]['id'] = job.id
+
+    stage.job_submit_many([
+        (job, profiles[item['profile']])
+        for (_, item), job in zip(accepted, jobs)
+    ])
+
+    return jsonify({
+        'jobs': results,
+        'created': len(jobs),
+        'failed': len(results) - len(jobs),
+    })
+
+
 @blueprint.route('/<uuid:job_id>')
 def show_job(job_id: str):
 
     return Job.get(id=job_id).to_json()
 
 
+@blueprint.route('/<uuid:job_id>/events')
+def job_events(job_id: uuid.UUID):
+    ''' GET /jobs/<job_id>/events
+
+        Streams status changes and download progress for a job as
+        server-sent events, until the job pipeline has finished.
+        ---
+        tags:
+          - Jobs
+        produces:
+          - text/event-stream
+        parameters:
+          - name: job_id
+            in: path
+            type: string
+            required: true
+        responses:
+          200:
+            description: |
+              A stream of `status` events, carrying the whole job, and
+              `progress` events, carrying `meta.progress`. The first event
+              is the current status of the job. The stream closes after
+              an `end` event.
+          404:
+            description: Job does not exist
+            schema:
+              properties:
+                message:
+                  type: string
+    '''
+
+    # Subscribe before loading the job, so nothing published
+    # between the snapshot and the subscription is missed.
+    subscription = events.subscribe(job_id)
+
+    try:
+        job = Job.get(id=job_id)
+    except Job.DoesNotExist:
+        subscription.close()
+        return jsonify({
+            'message': 'job not found',
+            'query': {
+                'id': job_id,
+            },
+        }), status.NOT_FOUND
+
+    return Response(
+        stream_with_context(events.stream(subscription, job)),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no',
+        },
+    )
+
+
+@blueprint.route('/<uuid:job_id>', methods=['DELETE'])
+def cancel_job(job_id: uuid.UUID):
+    ''' DELETE /jobs/<job_id>
+
+        Cancels a job, and the unfinished children of a playlist job.
+        A running download or upload stops within seconds, and partial
+        downloads are removed. The job is kept, with status `cancelled`.
+        ---
+        tags:
+          - Jobs
+        parameters:
+          - name: job_id
+            in: path
+            type: string
+            required: true
+        responses:
+          200:
+            description: the cancelled job
+          404:
+            description: Job does not exist
+            schema:
+              properties:
+                message:
+                  type: string
+          409:
+            description: Job has already finished
+            schema:
+              properties:
+                message:
+                  type: string
+    '''
+
+    try:
+        job = Job.get(id=job_id)
+    except Job.DoesNotExist:
+        return jsonify({
+            'message': 'job not found',
+            'query': {
+                'id': job_id,
+            },
+        }), status.NOT_FOUND
+
+    if not stage.job_cancel(job):
+        job = Job.get(id=job_id)
+        return jsonify({
+            'message': f'job has already finished as `{job.status}`',
+            'job': job.to_dict(sections=()),
+        }), status.CONFLICT
+
+    return Job.get(id=job_id).to_json()
+
+
 @blueprint.route('/<uuid:job_id>', methods=['PUT'])
 def update_job(job_id: str):
 
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+import logging
+from http import HTTPStatus as status
+
+from flask import (
+    Blueprint,
+    Response,
+)
+
+from tubedlapi.app import inject
+from tubedlapi.util.async import JobExecutor
+from tubedlapi.util.metrics import (
+    CONTENT_TYPE,
+    Metrics,
+)
+
+blueprint = Blueprint(
+    'metrics',
+    __name__,
+)
+log = logging.getLogger(__name__)
+
+
+@inject
+def render_metrics(metrics: Metrics, executor: JobExecutor) -> str:
+
+    if not metrics.enabled:
+        return None
+
+    return metrics.render(executor.stats())
+
+
+@blueprint.route('/metrics', methods=['GET'])
+def show_metrics() -> Response:
+    ''' GET /metrics
+
+        Returns service metrics in the Prometheus text format: pipeline
+        pool usage, time spent in each job status, bytes downloaded and
+        uploaded, upload latency and errors by destination, database
+        query timings by route and encryption timings.
+        ---
+        tags:
+          - Status
+        produces:
+          - text/plain
+        parameters: []
+        responses:
+          200:
+            description: metrics in the Prometheus text exposition format
+          404:
+            description: metrics are disabled (`METRICS=false`)
+    '''
+
+    text = render_metrics()
+    if text is None:
+        return Response('metrics are disabled\n', status=status.NOT_FOUND)
+
+    return Response(text, content_type=CONTENT_TYPE)
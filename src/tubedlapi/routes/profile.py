@@ -2,6 +2,7 @@
 
 import logging
 from http import HTTPStatus as status
+from typing import List
 from urllib.parse import unquote_plus
 
 import peewee
@@ -13,7 +14,13 @@ from flask import (
 )
 from flask.json import jsonify
 
-from tubedlapi.model.profile import Profile
+from tubedlapi.app import inject
+from tubedlapi.model.profile import (
+    Profile,
+    ProfileCache,
+    find_profile,
+)
+from tubedlapi.util.dlpool import YoutubeDLPool
 
 blueprint = Blueprint(
     'profile',
@@ -23,10 +30,28 @@ blueprint = Blueprint(
 log = logging.getLogger(__name__)
 
 
+@inject
+def discard_downloaders(pool: YoutubeDLPool, profile: Profile) -> None:
+
+    pool.invalidate(profile.id)
+
+
+@inject
+def invalidate_profiles(profiles: ProfileCache) -> None:
+
+    profiles.invalidate()
+
+
+@inject
+def all_profiles(profiles: ProfileCache) -> List[Profile]:
+
+    return profiles.all()
+
+
 @blueprint.route('/', methods=['GET'])
 def list_profiles() -> Response:
 
-    return jsonify([p.to_dict() for p in Profile.select()])
+    return jsonify([p.to_dict() for p in all_profiles()])
 
 
 @blueprint.route('/<string:name>', methods=['GET'])
@@ -35,7 +60,7 @@ def show_profile(name: str) -> Response:
     name = unquote_plus(name)
 
     try:
-        return jsonify(Profile.get(name=name).to_dict())
+        return jsonify(find_profile(name).to_dict())
     except Profile.DoesNotExist:
         return jsonify({
             'message': 'not found',
@@ -51,15 +76,24 @@ def create_profile() -> Response:
     payload = request.get_json()
     options = payload.get('options', {})
 
-    if isinstance(options, dict):
-        payload.update({
-            'options': bytes(json.dumps(options), 'utf-8'),
-        })
+    if not isinstance(options, dict):
+        return jsonify({
+            'message': '`options` must be an object',
+        }), status.BAD_REQUEST
+
+    payload.update({
+        'options': bytes(json.dumps(options), 'utf-8'),
+    })
 
     # TODO: Do not allow overwriting of profiles
     new_profile = Profile(**payload)
     try:
         new_profile.save()
+        invalidate_profiles()
+
+        # Downloaders for the new profile are created in the background
+        from tubedlapi.exec.youtubedl import prewarm_downloaders
+        prewarm_downloaders([new_profile])
 
         return jsonify({
             'message': 'success',
@@ -80,6 +114,8 @@ def delete_profile(name: str) -> Response:
         res = Profile.get(name=name)
         last_state = res.to_dict()
         res.delete_instance()
+        invalidate_profiles()
+        discard_downloaders(res)
 
         return jsonify({
             'message': 'deleted',
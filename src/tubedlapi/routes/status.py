@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+
+import logging
+
+from flask import (
+    Blueprint,
+    Response,
+)
+from flask.json import jsonify
+
+from tubedlapi.app import inject
+from tubedlapi.model.profile import ProfileCache
+from tubedlapi.util.async import JobExecutor
+from tubedlapi.util.cancel import CancelRegistry
+from tubedlapi.util.crypto import PlaintextCache
+from tubedlapi.util.dlpool import YoutubeDLPool
+from tubedlapi.util.fspool import FSPool
+from tubedlapi.util.infocache import InfoCache
+from tubedlapi.util.procpool import RelayProcessPool
+from tubedlapi.util.ratelimit import FetchLimits
+from tubedlapi.util.timing import PhaseTimer
+
+blueprint = Blueprint(
+    'status',
+    __name__,
+    url_prefix='/status',
+)
+log = logging.getLogger(__name__)
+
+
+@inject
+def executor_stats(executor: JobExecutor, procs: RelayProcessPool,
+                   cancels: CancelRegistry, limits: FetchLimits) -> dict:
+
+    stats = executor.stats()
+    stats['cancellations'] = cancels.stats()
+    if limits.enabled:
+        stats['fetch']['limits'] = limits.stats()
+    if procs.started:
+        stats['fetch_processes'] = procs.stats()
+
+    return stats
+
+
+@inject
+def fs_pool_stats(pool: FSPool) -> dict:
+
+    return pool.stats()
+
+
+@inject
+def cache_stats(info: InfoCache, plaintext: PlaintextCache, downloaders: YoutubeDLPool,
+                profiles: ProfileCache) -> dict:
+
+    return {
+        'downloaders': downloaders.stats(),
+        'info': info.stats(),
+        'plaintext': plaintext.stats(),
+        'profiles': profiles.stats(),
+    }
+
+
+@inject
+def startup_report(timer: PhaseTimer) -> dict:
+
+    return timer.report()
+
+
+@blueprint.route('/executor', methods=['GET'])
+def show_executor() -> Response:
+    ''' GET /status/executor
+
+        Returns queue depth and utilization of each pipeline stage pool,
+        and of the fetch processes when `FETCH_MODE=process`, along with
+        counts of cancelled jobs. With `FETCH_LIMITS`, the fetch stats
+        include each limit's running and started fetches.
+        ---
+        tags:
+          - Status
+        parameters: []
+        responses:
+          200:
+            description: stats for each pipeline stage pool
+            examples:
+              {
+                  "fetch": {
+                      "max_workers": 4,
+                      "queued": 2,
+                      "active": 4,
+                      "completed": 120,
+                      "failed": 3,
+                      "utilization": 1.0,
+                      "limits": {
+                          "host:youtube.com": {
+                              "concurrency": 2,
+                              "rate": 0.5,
+                              "active": 2,
+                              "started": 31,
+                              "delayed": 12
+                          }
+                      }
+                  },
+                  "cancellations": {
+                      "pending": 1,
+                      "cancelled": 7
+                  }
+              }
+    '''
+
+    return jsonify(executor_stats())
+
+
+@blueprint.route('/destinations', methods=['GET'])
+def show_destinations() -> Response:
+    ''' GET /status/destinations
+
+        Returns pooled connection counts for each destination, by id.
+        ---
+        tags:
+          - Status
+        parameters: []
+        responses:
+          200:
+            description: pooled connections for each destination
+            examples:
+              {
+                  "1": {
+                      "idle": 2,
+                      "in_use": 1,
+                      "opened": 3
+                  }
+              }
+    '''
+
+    return jsonify(fs_pool_stats())
+
+
+@blueprint.route('/caches', methods=['GET'])
+def show_caches() -> Response:
+    ''' GET /status/caches
+
+        Returns size and hit/miss counters of the extractor info
+        cache, the decrypted plaintext cache and the profile cache,
+        and reuse counters of the pooled `YoutubeDL` instances, by
+        profile id.
+        ---
+        tags:
+          - Status
+        parameters: []
+        responses:
+          200:
+            description: stats for each cache
+            examples:
+              {
+                  "downloaders": {
+                      "created": 4,
+                      "reused": 48,
+                      "idle": {
+                          "1": 4
+                      }
+                  },
+                  "info": {
+                      "backend": "memory",
+                      "size": 12,
+                      "maxsize": 256,
+                      "ttl": 1800.0,
+                      "hits": 40,
+                      "misses": 12,
+                      "expired": 0
+                  },
+                  "plaintext": {
+                      "size": 3,
+                      "maxsize": 1024,
+                      "hits": 97,
+                      "misses": 3
+                  },
+                  "profiles": {
+                      "size": 2,
+                      "hits": 130,
+                      "misses": 2,
+                      "invalidations": 1,
+                      "version": 3
+                  }
+              }
+    '''
+
+    return jsonify(cache_stats())
+
+
+@blueprint.route('/startup', methods=['GET'])
+def show_startup() -> Response:
+    ''' GET /status/startup
+
+        Returns how long each phase of this process' startup took,
+        in milliseconds.
+        ---
+        tags:
+          - Status
+        parameters: []
+        responses:
+          200:
+            description: startup phase durations
+            examples:
+              {
+                  "phases": {
+                      "routes": 210.4,
+                      "settings": 1.2,
+                      "crypto": 48.9,
+                      "database": 35.1,
+                      "app": 3.3
+                  },
+                  "total": 298.9
+              }
+    '''
+
+    return jsonify(startup_report())
@@ -2,20 +2,133 @@
 
 import asyncio
 import functools
+import threading
 import typing
 from concurrent.futures import (
     Future,
     ThreadPoolExecutor,
 )
+from contextlib import contextmanager
 
 from diecast.component import Component
 
+from tubedlapi.util.ratelimit import Limiter
+from tubedlapi.util.scheduler import FairScheduler
+
+STAGE_FETCH = 'fetch'
+STAGE_UPLOAD = 'upload'
+STAGE_POSTPROCESS = 'postprocess'
+
+STAGES = (
+    STAGE_FETCH,
+    STAGE_UPLOAD,
+    STAGE_POSTPROCESS,
+)
+
+
+@contextmanager
+def _no_context() -> typing.Iterator[None]:
+
+    yield
+
+
+class StagePool(object):
+    ''' Bounded thread pool for a single pipeline stage which keeps
+        track of its queue depth and utilization.
+
+        Each task runs inside `task_context()`, if given, such as a
+        scope that releases the task's database connection.
+    '''
+
+    def __init__(self, name: str, max_workers: int,
+                 task_context: typing.Callable[[], typing.ContextManager]=None) -> None:
+
+        self.name = name
+        self.max_workers = max_workers
+        self.task_context = task_context or _no_context
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix=f'tubedlapi-{name}',
+        )
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+
+        return self._pool
+
+    def submit(self, func: typing.Callable, *args, **kw) -> Future:
+
+        with self._lock:
+            self.queued += 1
+
+        fut = self._pool.submit(self._run, func, args, kw)
+        fut.add_done_callback(self._discard_cancelled)
+
+        return fut
+
+    def _run(self, func: typing.Callable, args: tuple, kw: dict) -> typing.Any:
+
+        with self._lock:
+            self.queued -= 1
+            self.active += 1
+
+        try:
+            with self.task_context():
+                return func(*args, **kw)
+        except BaseException:
+            with self._lock:
+                self.failed += 1
+            raise
+        finally:
+            with self._lock:
+                self.active -= 1
+                self.completed += 1
+
+    def _discard_cancelled(self, fut: Future) -> None:
+
+        if fut.cancelled():
+            with self._lock:
+                self.queued -= 1
+
+    def stats(self) -> dict:
+
+        with self._lock:
+            return {
+                'max_workers': self.max_workers,
+                'queued': self.queued,
+                'active': self.active,
+                'completed': self.completed,
+                'failed': self.failed,
+                'utilization': self.active / self.max_workers,
+            }
+
+    def shutdown(self, wait: bool=True) -> None:
+
+        self._pool.shutdown(wait=wait)
+
 
 class JobExecutor(Component):
     ''' Executor utility class supporting futures and coroutines.
         Adapted from https://gist.github.com/s0hvaperuna/48f07b8a2183fcf3f9364536f54814d5
+
+        Each pipeline stage gets its own bounded pool, so work from
+        one stage can never starve another. Tasks must never block
+        waiting on tasks in their own stage -- chain futures with
+        `gather_futures` and done callbacks instead.
+
+        Fetches go through a `FairScheduler` in front of the fetch
+        pool, configured by `scheduling`, which orders them by priority
+        and shares the pool fairly between tenants.
     '''
 
+    pools: typing.Dict[str, StagePool] = None
+    scheduler: FairScheduler = None
     thread_pool: ThreadPoolExecutor = None
     loop: asyncio.AbstractEventLoop = None
 
@@ -24,14 +137,43 @@ class JobExecutor(Component):
 
         return JobExecutor()
 
-    def __init__(self) -> None:
+    def __init__(self, limits: typing.Dict[str, int]=None,
+                 task_context: typing.Callable[[], typing.ContextManager]=None,
+                 scheduling: typing.Dict[str, typing.Any]=None) -> None:
+
+        limits = limits or {}
 
-        self.thread_pool = ThreadPoolExecutor(thread_name_prefix='tubedlapi')
+        self.pools = {
+            stage: StagePool(stage, limits.get(stage) or 4, task_context=task_context)
+            for stage in STAGES
+        }
+        self.scheduler = FairScheduler(self.pools[STAGE_FETCH], **(scheduling or {}))
+        self.thread_pool = self.pools[STAGE_FETCH].executor
         self.loop = asyncio.get_event_loop()
 
-    def execute_future(self, func: typing.Callable, *args, **kw) -> Future:
+    def execute_scheduled(self, tenant: str, priority: int, limiters: typing.List[Limiter],
+                          func: typing.Callable, *args, **kw) -> Future:
+        ''' Queues `func` for the fetch pool through the scheduler, for
+            `tenant` at `priority`, to start once `limiters` allow it.
+        '''
+
+        return self.scheduler.submit(tenant, priority, limiters, func, *args, **kw)
 
-        return self.thread_pool.submit(func, *args, **kw)
+    def execute_stage(self, stage: str, func: typing.Callable, *args, **kw) -> Future:
+        ''' Submits `func` to the pool for `stage`.
+        '''
+
+        return self.pools[stage].submit(func, *args, **kw)
+
+    def stats(self) -> typing.Dict[str, dict]:
+
+        stats = {stage: pool.stats() for stage, pool in self.pools.items()}
+
+        scheduled = self.scheduler.stats()
+        stats[STAGE_FETCH]['queued'] += scheduled['queued']
+        stats[STAGE_FETCH]['scheduler'] = scheduled
+
+        return stats
 
     async def execute_async(self, func: typing.Callable, *args, err: typing.Callable=None, **kw):
 
@@ -48,3 +190,41 @@ class JobExecutor(Component):
                 pass
             else:
                 self.loop.call_soon_threadsafe(err, e)
+
+
+def gather_futures(futs: typing.List[Future],
+                   combine: typing.Callable[[typing.List[Future]], typing.Any]) -> Future:
+    ''' Returns a future which resolves with `combine(futs)` once
+        every future in `futs` is done.
+
+        No thread is held while waiting; `combine` runs in whichever
+        thread completes the last future.
+    '''
+
+    result: Future = Future()
+    remaining = [len(futs)]
+    lock = threading.Lock()
+
+    def _resolve() -> None:
+
+        try:
+            result.set_result(combine(futs))
+        except Exception as e:
+            result.set_exception(e)
+
+    def _done(fut: Future) -> None:
+
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+
+        if last:
+            _resolve()
+
+    if not futs:
+        _resolve()
+
+    for fut in futs:
+        fut.add_done_callback(_done)
+
+    return result
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+import threading
+from collections import OrderedDict
+from typing import (
+    Any,
+    Hashable,
+)
+
+
+class LRUCache(object):
+    ''' Thread-safe mapping that holds at most `maxsize` entries,
+        evicting the least recently used entry first.
+
+        A `maxsize` of zero or less disables the cache entirely.
+    '''
+
+    def __init__(self, maxsize: int=128) -> None:
+
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+
+        return key in self._data
+
+    def get(self, key: Hashable, default: Any=None) -> Any:
+        ''' Returns the value stored for `key` and marks it as
+            recently used, or `default` if it is not cached.
+        '''
+
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        ''' Stores `value` for `key`, evicting the oldest entries
+            if the cache is full.
+        '''
+
+        if self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any=None) -> Any:
+
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self) -> None:
+
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+
+        return {
+            'size': len(self._data),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
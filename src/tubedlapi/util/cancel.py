@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+from typing import (
+    Callable,
+    Hashable,
+    List,
+)
+
+from tubedlapi.util.cache import LRUCache
+
+log = logging.getLogger(__name__)
+
+
+class JobCancelled(Exception):
+    ''' Raised inside a running job once it was cancelled, to unwind
+        whatever it is doing.
+    '''
+
+
+class CancelRegistry(object):
+    ''' Cancellation flags for the jobs running in this process.
+
+        Running work polls `check` at convenient points (download
+        progress, upload chunks, stage starts), which raises
+        `JobCancelled` once the job was cancelled. Listeners are told
+        about each cancellation, so work running outside this process
+        can be flagged as well.
+
+        Jobs may also be cancelled through another process, such as
+        another API worker. For jobs not flagged here, `lookup` is asked
+        whether the job was cancelled, at most once per `lookup_interval`
+        seconds per job, and the job is flagged if it was.
+
+        At most `maxsize` flags are kept, so flags for jobs which had
+        already finished are dropped eventually.
+    '''
+
+    def __init__(self, maxsize: int=10000, lookup: Callable[[Hashable], bool]=None,
+                 lookup_interval: float=2.0) -> None:
+
+        self.lookup = lookup
+        self.lookup_interval = lookup_interval
+        self._flags = LRUCache(maxsize=maxsize)
+        self._looked_up = LRUCache(maxsize=maxsize)
+        self._listeners: List[Callable[[Hashable], None]] = []
+        self._lock = threading.Lock()
+        self.cancelled = 0
+        self.lookups = 0
+
+    def add_listener(self, listener: Callable[[Hashable], None]) -> None:
+
+        self._listeners.append(listener)
+
+    def cancel(self, job_id: Hashable) -> None:
+
+        if job_id in self._flags:
+            return
+
+        self._flags.put(job_id, True)
+        with self._lock:
+            self.cancelled += 1
+
+        log.info('job %s cancelled', job_id)
+
+        for listener in self._listeners:
+            try:
+                listener(job_id)
+            except Exception:
+                log.exception('cancellation listener failed for job %s', job_id)
+
+    def is_cancelled(self, job_id: Hashable, fresh: bool=False) -> bool:
+        ''' Whether `job_id` was cancelled. With `fresh`, `lookup` is
+            asked right away, rather than once per `lookup_interval`.
+        '''
+
+        if job_id in self._flags:
+            return True
+
+        if self.lookup is None:
+            return False
+
+        now = time.monotonic()
+        last = self._looked_up.get(job_id)
+        if not fresh and last is not None and now - last < self.lookup_interval:
+            return False
+
+        self._looked_up.put(job_id, now)
+        with self._lock:
+            self.lookups += 1
+
+        try:
+            cancelled = self.lookup(job_id)
+        except Exception:
+            log.exception('could not look up cancellation of job %s', job_id)
+            return False
+
+        if cancelled:
+            self.cancel(job_id)
+
+        return bool(cancelled)
+
+    def check(self, job_id: Hashable) -> None:
+        ''' Raises `JobCancelled` if `job_id` was cancelled.
+        '''
+
+        if self.is_cancelled(job_id):
+            raise JobCancelled(f'job {job_id} was cancelled')
+
+    def discard(self, job_id: Hashable) -> None:
+
+        self._flags.pop(job_id)
+        self._looked_up.pop(job_id)
+
+    def stats(self) -> dict:
+
+        return {
+            'pending': len(self._flags),
+            'cancelled': self.cancelled,
+            'lookups': self.lookups,
+        }
@@ -1,7 +1,16 @@
 # -*- coding: utf-8 -*-
 
 import base64
+import hashlib
 import os
+import threading
+import time
+from typing import (
+    Callable,
+    Dict,
+    List,
+    Tuple,
+)
 
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.ciphers.aead import ChaCha20Poly1305
@@ -9,6 +18,88 @@ from cryptography.hazmat.primitives.constant_time import bytes_eq
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.backends import default_backend
 
+from tubedlapi.util.cache import LRUCache
+
+
+def make_kdf(salt: bytes, iterations: int=10000) -> PBKDF2HMAC:
+    ''' Creates a KDF that can be used for derivation or
+        verification.
+
+        Raises `ValueError` if salt is not set.
+        Raises `ValueError` if salt is not 16 bytes in length.
+    '''
+
+    if not salt:
+        raise ValueError('Salt must be set')
+
+    if len(salt) != 16:
+        raise ValueError('Salt must be 16 bytes in length')
+
+    return PBKDF2HMAC(
+        algorithm=hashes.SHA512(),
+        length=32,
+        salt=salt,
+        iterations=iterations,
+        backend=default_backend(),
+    )
+
+
+class Keyring(object):
+    ''' Process-wide cache of keys stretched with PBKDF2HMAC.
+
+        Deriving a key is deliberately expensive, so each
+        (secret, salt, iterations) triple is only stretched once
+        and the derived key is handed out on every later request.
+    '''
+
+    def __init__(self) -> None:
+
+        self._keys: Dict[Tuple[bytes, bytes, int], bytes] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+
+        return len(self._keys)
+
+    def derive(self, secret: bytes, salt: bytes, iterations: int=10000) -> bytes:
+        ''' Returns the key for `secret` stretched with `salt`,
+            deriving and remembering it on first use.
+        '''
+
+        ident = (secret, salt, iterations)
+        key = self._keys.get(ident)
+        if key is not None:
+            return key
+
+        with self._lock:
+            key = self._keys.get(ident)
+            if key is None:
+                key = make_kdf(salt, iterations=iterations).derive(secret)
+                self._keys[ident] = key
+
+        return key
+
+    def clear(self) -> None:
+        ''' Forgets all derived keys.
+        '''
+
+        with self._lock:
+            self._keys.clear()
+
+
+default_keyring = Keyring()
+
+
+class PlaintextCache(LRUCache):
+    ''' Bounded cache of decrypted message plaintexts, keyed by
+        a digest of the encrypted message.
+    '''
+
+    @staticmethod
+    def digest(message: bytes) -> bytes:
+
+        return hashlib.sha256(message).digest()
+
 
 class CryptoProvider(object):
     ''' CryptoProvider provides an encryption layer for data blobs.
@@ -21,6 +112,7 @@ class CryptoProvider(object):
 
     key: bytes = None
     salt: bytes = None
+    keys: List[Tuple[bytes, bytes]] = None
 
     @classmethod
     def extract_salt_from_message(cls, message: bytes) -> bytes:
@@ -31,7 +123,9 @@ class CryptoProvider(object):
         _, salt, _ = message.split(b'$')
         return salt
 
-    def __init__(self, secret: bytes, iterations: int=10000, salt: bytes=None) -> None:
+    def __init__(self, secret: bytes, iterations: int=10000, salt: bytes=None,
+                 previous_salts: List[bytes]=None, keyring: Keyring=None,
+                 observer: Callable[[str, float], None]=None) -> None:
         ''' Creates a CryptoProvider.
 
             Initializes the key which will be utilized in all
@@ -41,14 +135,33 @@ class CryptoProvider(object):
             expects a key with a length of 32 bytes.
 
             Key salt is stored on the class and written into the blob.
+
+            Keys for `previous_salts` are only used for decryption, so
+            messages written before a salt rotation can still be read.
+            Derived keys are shared through `keyring`, which defaults
+            to the process-wide keyring.
+
+            `observer` is called with the operation (`encrypt` or
+            `decrypt`) and duration of every encryption and decryption.
         '''
 
+        keyring = keyring or default_keyring
+        self.observer = observer
+
         self.salt = salt or os.urandom(16)
         if len(self.salt) != 16:
             raise ValueError('Salt must be 16 bytes in length')
 
-        kdf = self._make_kdf(iterations=iterations)
-        self.key = kdf.derive(secret)
+        self.key = keyring.derive(secret, self.salt, iterations=iterations)
+        self.keys = [(self.salt, self.key)]
+
+        for old_salt in previous_salts or []:
+            if bytes_eq(old_salt, self.salt):
+                continue
+
+            self.keys.append(
+                (old_salt, keyring.derive(secret, old_salt, iterations=iterations)),
+            )
 
     def _make_kdf(self, iterations: int=10000) -> PBKDF2HMAC:
         ''' Creates a KDF that can be used for derivation or
@@ -59,19 +172,7 @@ class CryptoProvider(object):
             Raises `ValueError` if salt is not 16 bytes in length.
         '''
 
-        if not self.salt:
-            raise ValueError('Salt must be set')
-
-        if len(self.salt) != 16:
-            raise ValueError('Salt must be 16 bytes in length')
-
-        return PBKDF2HMAC(
-            algorithm=hashes.SHA512(),
-            length=32,
-            salt=self.salt,
-            iterations=iterations,
-            backend=default_backend(),
-        )
+        return make_kdf(self.salt, iterations=iterations)
 
     def encrypt_blob(self, blob: bytes) -> bytes:
         ''' Encrypts `blob` with ChaCha20Poly1305.
@@ -89,24 +190,30 @@ class CryptoProvider(object):
         if len(self.key) != 32:
             raise ValueError('Key must be 32 bytes in length')
 
+        start = time.perf_counter()
+
         nonce = os.urandom(12)
         algo = ChaCha20Poly1305(self.key)
 
         enc_blob = algo.encrypt(nonce, blob, None)
 
-        return b'$'.join([
+        message = b'$'.join([
             base64.b64encode(nonce),
             base64.b64encode(self.salt),
             base64.b64encode(enc_blob),
         ])
 
+        self._observe('encrypt', start)
+        return message
+
     def decrypt_message(self, message: bytes) -> bytes:
         ''' Disassembles and decrypts a message with the following form
 
                 {base64'd nonce}${base64'd salt}${base64'd blob}
 
             Expects `self.key` to be a 32-byte value.
-            Expects the message-encoded `salt` to equal `self.salt`.
+            Expects the message-encoded `salt` to be `self.salt` or
+            one of the previous salts.
 
             Returns the decrypted blob.
         '''
@@ -125,10 +232,11 @@ class CryptoProvider(object):
         return self.decrypt_blob(nonce, salt, blob)
 
     def decrypt_blob(self, nonce: bytes, salt: bytes, enc_blob: bytes) -> bytes:
-        ''' Decrypts `enc_blob` using nonce and the initialized key.
+        ''' Decrypts `enc_blob` using nonce and the key derived
+            with `salt`.
 
-            Expects `self.key` to be a 32-byte value.
-            Expects the message-encoded `salt` to equal `self.salt`.
+            Expects the message-encoded `salt` to be `self.salt` or
+            one of the previous salts.
 
             Returns the decrypted blob.
         '''
@@ -136,8 +244,19 @@ class CryptoProvider(object):
         if not self.salt:
             raise ValueError('Salt must be set')
 
-        if not bytes_eq(salt, self.salt):
-            raise ValueError('Salts do not match.')
+        start = time.perf_counter()
 
-        algo = ChaCha20Poly1305(self.key)
-        return algo.decrypt(nonce, enc_blob, None)
+        for known_salt, key in self.keys:
+            if bytes_eq(salt, known_salt):
+                algo = ChaCha20Poly1305(key)
+                blob = algo.decrypt(nonce, enc_blob, None)
+
+                self._observe('decrypt', start)
+                return blob
+
+        raise ValueError('Salts do not match.')
+
+    def _observe(self, operation: str, start: float) -> None:
+
+        if self.observer is not None:
+            self.observer(operation, time.perf_counter() - start)
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from importlib import import_module
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Hashable,
+    Iterator,
+    List,
+    TYPE_CHECKING,
+)
+
+if TYPE_CHECKING:
+    import youtube_dl  # noqa: F401
+
+log = logging.getLogger(__name__)
+
+
+def load_extractor(path: str) -> type:
+    ''' Imports an extractor class from a `package.module:ClassName` path.
+    '''
+
+    module, _, name = path.partition(':')
+    if not module or not name:
+        raise ValueError(f'extractor must be given as `module:ClassName`, got `{path}`')
+
+    return getattr(import_module(module), name)
+
+
+class _Instance(object):
+    ''' A pooled `YoutubeDL` along with the state it was created
+        with, which is restored whenever it is returned.
+    '''
+
+    def __init__(self, dl: 'youtube_dl.YoutubeDL') -> None:
+
+        self.dl = dl
+        self.params = dict(dl.params)
+        self.pps = list(dl._pps)
+
+    def prepare(self, params: dict, progress_hooks: List[Callable],
+                postprocessors: List[Any]) -> 'youtube_dl.YoutubeDL':
+
+        self.dl.params.update(params)
+        self.dl._progress_hooks = list(progress_hooks)
+        for pp in postprocessors:
+            self.dl.add_post_processor(pp)
+
+        return self.dl
+
+    def reset(self) -> None:
+
+        dl = self.dl
+
+        # Same as leaving the `YoutubeDL` context: saves the cookie file
+        dl.__exit__(None, None, None)
+
+        dl.params.clear()
+        dl.params.update(self.params)
+        dl._pps[:] = self.pps
+        dl._progress_hooks = []
+        dl._download_retcode = 0
+        dl._num_downloads = 0
+
+
+class YoutubeDLPool(object):
+    ''' Keeps initialized `YoutubeDL` instances for reuse, by key.
+
+        Creating a `YoutubeDL` parses its options, instantiates the
+        extractor list and sets up an opener and cookie jar. Pooled
+        instances keep all of that, along with the extractor instances
+        (and their caches) they created while running.
+
+        Each key holds instances for one set of options, identified by
+        `version`; checking out with another version drops the idle
+        instances of the old one. At most `max_idle` instances are kept
+        per key.
+
+        Extractor classes named in `extractors` (as `module:ClassName`)
+        are added to every instance, ahead of youtube-dl's own.
+    '''
+
+    def __init__(self, max_idle: int=4,
+                 factory: Callable[[dict], 'youtube_dl.YoutubeDL']=None,
+                 extractors: List[str]=None) -> None:
+
+        self.max_idle = max_idle
+        self.factory = factory
+        self.extractors = list(extractors or [])
+        self.created = 0
+        self.reused = 0
+
+        self._idle: Dict[Hashable, Deque[_Instance]] = {}
+        self._versions: Dict[Hashable, Hashable] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def checkout(self, key: Hashable, version: Hashable, options: dict,
+                 params: dict=None, progress_hooks: List[Callable]=None,
+                 postprocessors: List[Any]=None) -> Iterator['youtube_dl.YoutubeDL']:
+        ''' Checks out a `YoutubeDL` created with `options`, with the
+            per-job `params`, `progress_hooks` and `postprocessors`
+            swapped in. They are removed again when it is returned.
+
+            Instances are not returned to the pool if the block raises.
+        '''
+
+        instance = self._take(key, version)
+        if instance is None:
+            instance = _Instance(self._create(options))
+            with self._lock:
+                self.created += 1
+
+        dl = instance.prepare(params or {}, progress_hooks or [], postprocessors or [])
+
+        try:
+            yield dl
+        except BaseException:
+            instance.reset()
+            raise
+
+        instance.reset()
+        self._give(key, version, instance)
+
+    def _create(self, options: dict) -> 'youtube_dl.YoutubeDL':
+
+        factory = self.factory
+        if factory is None:
+            # Imported on first use, as youtube-dl is slow to import
+            from youtube_dl import YoutubeDL as factory
+
+        dl = factory(dict(options))
+        for path in self.extractors:
+            dl.add_info_extractor(load_extractor(path)())
+            # Ahead of youtube-dl's extractors, which end with one
+            # matching every url
+            dl._ies.insert(0, dl._ies.pop())
+
+        return dl
+
+    def _take(self, key: Hashable, version: Hashable) -> _Instance:
+
+        with self._lock:
+            if self._versions.get(key) != version:
+                self._idle.pop(key, None)
+                self._versions[key] = version
+                return None
+
+            idle = self._idle.get(key)
+            if not idle:
+                return None
+
+            self.reused += 1
+            return idle.pop()
+
+    def _give(self, key: Hashable, version: Hashable, instance: _Instance) -> None:
+
+        with self._lock:
+            if self._versions.get(key) != version:
+                return
+
+            idle = self._idle.setdefault(key, deque())
+            if len(idle) < self.max_idle:
+                idle.append(instance)
+
+    def prewarm(self, key: Hashable, version: Hashable, options: dict, count: int=1) -> int:
+        ''' Creates idle instances for `key` ahead of its first
+            checkout, until it has `count` (at most `max_idle`).
+            Returns how many were created.
+        '''
+
+        with self._lock:
+            if self._versions.get(key) != version:
+                self._idle.pop(key, None)
+                self._versions[key] = version
+
+            missing = min(count, self.max_idle) - len(self._idle.get(key) or ())
+
+        created = 0
+        for _ in range(missing):
+            self._give(key, version, _Instance(self._create(options)))
+            created += 1
+
+        with self._lock:
+            self.created += created
+
+        return created
+
+    def invalidate(self, key: Hashable) -> None:
+        ''' Drops every idle instance for `key`. Instances checked
+            out right now are dropped when they are returned.
+        '''
+
+        with self._lock:
+            self._idle.pop(key, None)
+            self._versions.pop(key, None)
+
+    def clear(self) -> None:
+
+        with self._lock:
+            self._idle.clear()
+            self._versions.clear()
+
+    def stats(self) -> dict:
+
+        with self._lock:
+            return {
+                'created': self.created,
+                'reused': self.reused,
+                'idle': {str(key): len(idle) for key, idle in self._idle.items()},
+            }
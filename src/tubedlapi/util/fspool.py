@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Hashable,
+    Iterator,
+    Set,
+    Tuple,
+)
+
+import fs
+from fs.base import FS
+
+log = logging.getLogger(__name__)
+
+
+class _Pool(object):
+    ''' Open filesystem handles for a single URL.
+
+        At most `max_connections` slots are held at once, by checked
+        out handles or by callers about to check one out. Further
+        callers wait in line, without holding a thread if they use
+        `reserve`.
+    '''
+
+    def __init__(self, url: str, max_connections: int, idle_timeout: float,
+                 check_interval: float) -> None:
+
+        self.url = url
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+        self.in_use = 0
+        self.reserved = 0
+        self.opened = 0
+        self.closed = False
+
+        self._idle: Deque[Tuple[FS, float]] = deque()
+        self._current: Set[FS] = set()
+        self._waiters: Deque[Callable[[], None]] = deque()
+        self._lock = threading.Lock()
+
+    def reserve(self, callback: Callable[[], None]) -> None:
+        ''' Calls `callback` once a slot is free, right away if one is.
+            The slot is held for the caller until it is given back by
+            `release` or `free`.
+        '''
+
+        with self._lock:
+            if self.reserved >= self.max_connections:
+                self._waiters.append(callback)
+                return
+
+            self.reserved += 1
+
+        self._granted(callback)
+
+    def acquire(self) -> FS:
+        ''' Waits for a slot and checks out a handle.
+        '''
+
+        ready = threading.Event()
+        self.reserve(ready.set)
+        ready.wait()
+
+        return self.checkout()
+
+    def checkout(self) -> FS:
+        ''' Checks out a handle with a slot reserved by the caller.
+        '''
+
+        try:
+            handle = self._take_idle()
+            if handle is None:
+                handle = fs.open_fs(self.url)
+                with self._lock:
+                    self.opened += 1
+                    self._current.add(handle)
+        except Exception:
+            self.free()
+            raise
+
+        with self._lock:
+            self.in_use += 1
+
+        return handle
+
+    def release(self, handle: FS, discard: bool=False) -> None:
+
+        with self._lock:
+            self.in_use -= 1
+            # Handles opened for a previous url are not kept
+            if not discard and not self.closed and handle in self._current:
+                self._idle.append((handle, time.monotonic()))
+                handle = None
+            else:
+                self._current.discard(handle)
+
+        if handle is not None:
+            _close(handle)
+
+        self.free()
+
+    def free(self) -> None:
+        ''' Gives back a slot, to the next caller in line if any.
+        '''
+
+        with self._lock:
+            if not self._waiters:
+                self.reserved -= 1
+                return
+
+            callback = self._waiters.popleft()
+
+        self._granted(callback)
+
+    def _granted(self, callback: Callable[[], None]) -> None:
+
+        try:
+            callback()
+        except Exception:
+            log.exception('error handing a connection slot for %s to %r', self.url, callback)
+            self.free()
+
+    def retarget(self, url: str) -> None:
+        ''' Switches to `url`, closing idle handles. Handles checked out
+            now are closed when they are returned. Slots, and callers
+            waiting for one, carry over.
+        '''
+
+        with self._lock:
+            self.url = url
+            stale = [handle for handle, _ in self._idle]
+            self._idle.clear()
+            self._current.clear()
+
+        for handle in stale:
+            _close(handle)
+
+    def _take_idle(self) -> FS:
+        ''' Returns the most recently used idle handle which is still
+            healthy, closing any stale handles found along the way.
+        '''
+
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+
+                handle, last_used = self._idle.pop()
+
+            idle_for = time.monotonic() - last_used
+            stale = idle_for > self.idle_timeout or handle.isclosed()
+            if stale or (idle_for > self.check_interval and not _healthy(handle)):
+                self._forget(handle)
+                continue
+
+            return handle
+
+    def evict(self) -> int:
+        ''' Closes handles which have been idle longer than `idle_timeout`.
+        '''
+
+        now = time.monotonic()
+        stale = []
+        with self._lock:
+            # Oldest handles are on the left.
+            while self._idle and now - self._idle[0][1] > self.idle_timeout:
+                stale.append(self._idle.popleft()[0])
+
+        for handle in stale:
+            self._forget(handle)
+
+        return len(stale)
+
+    def _forget(self, handle: FS) -> None:
+
+        with self._lock:
+            self._current.discard(handle)
+
+        _close(handle)
+
+    def close(self) -> None:
+
+        with self._lock:
+            self.closed = True
+            stale = [handle for handle, _ in self._idle]
+            self._idle.clear()
+            self._current.clear()
+
+        for handle in stale:
+            _close(handle)
+
+    def stats(self) -> dict:
+
+        with self._lock:
+            return {
+                'idle': len(self._idle),
+                'in_use': self.in_use,
+                'opened': self.opened,
+                'waiting': len(self._waiters),
+            }
+
+
+class FSPool(object):
+    ''' Pool of warm filesystem handles, keyed by destination.
+
+        Handles are reused between uploads instead of connecting and
+        authenticating for every file. Idle handles are closed after
+        `idle_timeout` seconds and health-checked before reuse once
+        they have been idle for `check_interval` seconds.
+    '''
+
+    def __init__(self, max_connections: int=4, idle_timeout: float=300.0,
+                 check_interval: float=30.0) -> None:
+
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.check_interval = check_interval
+
+        self._pools: Dict[Hashable, _Pool] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def _pool_for(self, key: Hashable, url: str) -> _Pool:
+
+        with self._lock:
+            pool = self._pools.get(key)
+            if pool is None:
+                pool = _Pool(url, self.max_connections, self.idle_timeout, self.check_interval)
+                self._pools[key] = pool
+                return pool
+
+        # The destination keeps its slots when its url changes, so
+        # uploads still running on the old url count against the cap
+        if pool.url != url:
+            pool.retarget(url)
+
+        return pool
+
+    @contextmanager
+    def connection(self, key: Hashable, url: str) -> Iterator[FS]:
+        ''' Checks out a filesystem handle for `url`. The handle is
+            returned to the pool afterwards, or closed if the block
+            raised, since the connection may be in a broken state.
+        '''
+
+        self.sweep()
+
+        pool = self._pool_for(key, url)
+        handle = pool.acquire()
+        with _checked_out(pool, handle):
+            yield handle
+
+    def submit(self, key: Hashable, url: str, submit: Callable[..., Future],
+               func: Callable[..., Any], *args, **kw) -> Future:
+        ''' Calls `func(handle, *args, **kw)` with a filesystem handle
+            for `url` checked out, through `submit` (an executor's
+            `submit`, say) once a handle for `key` is free. The handle
+            is returned as by `connection`.
+
+            Calls waiting for a busy destination queue up here rather
+            than blocking threads of the executor, so calls for other
+            destinations go ahead. Returns a future of the result.
+        '''
+
+        self.sweep()
+
+        pool = self._pool_for(key, url)
+        result: Future = Future()
+
+        def run() -> Any:
+
+            handle = pool.checkout()
+            with _checked_out(pool, handle):
+                return func(handle, *args, **kw)
+
+        def done(fut: Future) -> None:
+
+            if fut.cancelled():
+                # Cancelled before it ran, so the slot was never used
+                pool.free()
+                result.cancel()
+                result.set_running_or_notify_cancel()
+            elif fut.exception() is not None:
+                result.set_exception(fut.exception())
+            else:
+                result.set_result(fut.result())
+
+        def start() -> None:
+
+            try:
+                fut = submit(run)
+            except Exception as e:
+                pool.free()
+                result.set_exception(e)
+                return
+
+            fut.add_done_callback(done)
+
+        pool.reserve(start)
+
+        return result
+
+    def discard(self, key: Hashable) -> None:
+        ''' Closes all handles for `key`, those checked out now when
+            they are returned.
+        '''
+
+        with self._lock:
+            pool = self._pools.get(key)
+
+        if pool is not None:
+            pool.retarget(pool.url)
+
+    def sweep(self) -> None:
+        ''' Evicts idle handles from every pool, at most once
+            per `check_interval`.
+        '''
+
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sweep < self.check_interval:
+                return
+
+            self._last_sweep = now
+            pools = list(self._pools.values())
+
+        for pool in pools:
+            pool.evict()
+
+    def close(self) -> None:
+
+        with self._lock:
+            pools = list(self._pools.values())
+            self._pools.clear()
+
+        for pool in pools:
+            pool.close()
+
+    def stats(self) -> dict:
+
+        with self._lock:
+            pools = dict(self._pools)
+
+        return {str(key): pool.stats() for key, pool in pools.items()}
+
+
+@contextmanager
+def _checked_out(pool: _Pool, handle: FS) -> Iterator[FS]:
+    ''' Returns `handle` to `pool` after the block, or closes it if
+        the block raised, since the connection may be in a broken state.
+    '''
+
+    try:
+        yield handle
+    except BaseException:
+        pool.release(handle, discard=True)
+        raise
+    else:
+        pool.release(handle)
+
+
+def _healthy(handle: FS) -> bool:
+
+    try:
+        handle.getinfo('/')
+        return True
+    except Exception:
+        log.debug('discarding unhealthy filesystem handle %r', handle, exc_info=True)
+        return False
+
+
+def _close(handle: FS) -> None:
+
+    try:
+        handle.close()
+    except Exception:
+        log.debug('error closing filesystem handle %r', handle, exc_info=True)
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from urllib.parse import (
+    parse_qsl,
+    urlencode,
+    urlsplit,
+    urlunsplit,
+)
+
+from tubedlapi.util.cache import LRUCache
+
+log = logging.getLogger(__name__)
+
+
+def normalize_url(url: str) -> str:
+    ''' Normalizes `url` for use in a cache key: the scheme and host are
+        lowercased, query parameters are sorted and the fragment dropped.
+    '''
+
+    parts = urlsplit(url.strip())
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path, query, ''))
+
+
+class InfoCache(object):
+    ''' Caches extracted youtube-dl info dicts for `ttl` seconds.
+
+        Entries are stored serialized, so every `get` returns a fresh
+        copy which youtube-dl is free to modify. Info dicts which can
+        not be serialized are not cached.
+    '''
+
+    backend = 'none'
+
+    def __init__(self, maxsize: int=256, ttl: float=1800.0) -> None:
+
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    @staticmethod
+    def make_key(url: str, options: dict, ie_key: str=None) -> str:
+        ''' Builds a cache key from the normalized `url`, the extractor
+            key and a hash of the profile `options`.
+        '''
+
+        digest = hashlib.sha256()
+        digest.update(normalize_url(url).encode('utf-8'))
+        digest.update(b'\0')
+        digest.update((ie_key or '').encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(json.dumps(options, sort_keys=True, default=repr).encode('utf-8'))
+
+        return digest.hexdigest()
+
+    def get(self, key: str) -> dict:
+
+        blob = self._load(key)
+        if blob is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return json.loads(blob)
+
+    def put(self, key: str, info: dict) -> bool:
+
+        if self.maxsize <= 0:
+            return False
+
+        try:
+            blob = json.dumps(info)
+        except (TypeError, ValueError):
+            log.debug('info for %s is not serializable, not caching it', key)
+            return False
+
+        self._store(key, blob)
+        return True
+
+    def discard(self, key: str) -> None:
+
+        self._remove(key)
+
+    def _load(self, key: str) -> str:
+
+        return None
+
+    def _store(self, key: str, blob: str) -> None:
+
+        pass
+
+    def _remove(self, key: str) -> None:
+
+        pass
+
+    def __len__(self) -> int:
+
+        return 0
+
+    def stats(self) -> dict:
+
+        return {
+            'backend': self.backend,
+            'size': len(self),
+            'maxsize': self.maxsize,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'misses': self.misses,
+            'expired': self.expired,
+        }
+
+
+class MemoryInfoCache(InfoCache):
+    ''' Info cache held in a process-local LRU.
+    '''
+
+    backend = 'memory'
+
+    def __init__(self, maxsize: int=256, ttl: float=1800.0) -> None:
+
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self._entries = LRUCache(maxsize=maxsize)
+
+    def _load(self, key: str) -> str:
+
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, blob = entry
+        if expires_at < time.monotonic():
+            self._entries.pop(key)
+            self.expired += 1
+            return None
+
+        return blob
+
+    def _store(self, key: str, blob: str) -> None:
+
+        self._entries.put(key, (time.monotonic() + self.ttl, blob))
+
+    def _remove(self, key: str) -> None:
+
+        self._entries.pop(key)
+
+    def __len__(self) -> int:
+
+        return len(self._entries)
+
+
+def default_cache_path() -> str:
+    ''' The info cache directory of the current user, under
+        `$XDG_CACHE_HOME` or `~/.cache`.
+    '''
+
+    root = os.getenv('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+
+    return os.path.join(root, 'tubedlapi', 'info')
+
+
+class DiskInfoCache(InfoCache):
+    ''' Info cache stored as one file per entry under `path`, shared
+        by every process using the same directory. Files older than
+        `ttl` are expired, and the oldest files are removed once there
+        are more than `maxsize`.
+
+        `path` defaults to a directory of the current user, readable
+        only by them, rather than a shared temporary directory where
+        other users could plant entries.
+    '''
+
+    backend = 'disk'
+
+    def __init__(self, path: str=None, maxsize: int=256, ttl: float=1800.0) -> None:
+
+        super().__init__(maxsize=maxsize, ttl=ttl)
+        self.path = path or default_cache_path()
+        self._lock = threading.Lock()
+
+        os.makedirs(self.path, mode=0o700, exist_ok=True)
+
+    def _filename(self, key: str) -> str:
+
+        return os.path.join(self.path, f'{key}.json')
+
+    def _load(self, key: str) -> str:
+
+        filename = self._filename(key)
+        try:
+            if os.path.getmtime(filename) + self.ttl < time.time():
+                self.expired += 1
+                os.remove(filename)
+                return None
+
+            with open(filename, 'r', encoding='utf-8') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _store(self, key: str, blob: str) -> None:
+
+        # Written to a temporary file first, so readers never
+        # see a partially written entry.
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(blob)
+
+            os.replace(tmp, self._filename(key))
+        except OSError:
+            log.exception('could not write info cache entry %s', key)
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            return
+
+        self._prune()
+
+    def _remove(self, key: str) -> None:
+
+        try:
+            os.remove(self._filename(key))
+        except OSError:
+            pass
+
+    def _entries(self) -> list:
+
+        return [
+            entry for entry in os.scandir(self.path)
+            if entry.is_file() and entry.name.endswith('.json')
+        ]
+
+    def _prune(self) -> None:
+
+        with self._lock:
+            entries = self._entries()
+            if len(entries) <= self.maxsize:
+                return
+
+            entries.sort(key=lambda entry: entry.stat().st_mtime)
+            for entry in entries[:len(entries) - self.maxsize]:
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
+
+    def __len__(self) -> int:
+
+        return len(self._entries())
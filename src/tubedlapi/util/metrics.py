@@ -0,0 +1,440 @@
+# -*- coding: utf-8 -*-
+
+import bisect
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from http.server import (
+    BaseHTTPRequestHandler,
+    HTTPServer,
+)
+from socketserver import ThreadingMixIn
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Tuple,
+)
+
+import flask
+
+from tubedlapi.util.cache import LRUCache
+
+log = logging.getLogger(__name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Buckets for anything measured in milliseconds or less
+FAST_BUCKETS = (
+    0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+)
+
+# Buckets for pipeline stages, which take from seconds to hours
+STAGE_BUCKETS = (
+    0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0,
+)
+
+Sample = Tuple[str, Tuple[Tuple[str, str], ...], float]
+
+
+def _format_value(value: float) -> str:
+
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class Metric(object):
+    ''' A named metric with one value (or set of values) for each
+        combination of label values it was updated with.
+    '''
+
+    type = 'untyped'
+
+    def __init__(self, name: str, help: str, labels: Iterable[str]=()) -> None:
+
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+
+        self._values: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+
+        if len(labels) != len(self.labels):
+            raise ValueError(f'{self.name} takes labels {self.labels}, got {tuple(labels)}')
+
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _label_pairs(self, key: tuple) -> Tuple[Tuple[str, str], ...]:
+
+        return tuple(zip(self.labels, key))
+
+    def samples(self) -> Iterator[Sample]:
+
+        with self._lock:
+            values = list(self._values.items())
+
+        for key, value in values:
+            yield self.name, self._label_pairs(key), value
+
+
+class Counter(Metric):
+
+    type = 'counter'
+
+    def inc(self, amount: float=1.0, **labels) -> None:
+
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Metric):
+
+    type = 'gauge'
+
+    def set(self, value: float, **labels) -> None:
+
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float=1.0, **labels) -> None:
+
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float=1.0, **labels) -> None:
+
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    ''' Counts observations into cumulative `buckets`, and keeps
+        their count and sum.
+    '''
+
+    type = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: Iterable[str]=(),
+                 buckets: Iterable[float]=FAST_BUCKETS) -> None:
+
+        super().__init__(name, help, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels) -> None:
+
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # Per-bucket counts (the last one past every bucket), sum
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+
+            entry[0][index] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self) -> Iterator[Sample]:
+
+        with self._lock:
+            values = [(key, (list(counts), total)) for key, (counts, total) in self._values.items()]
+
+        for key, (counts, total) in values:
+            pairs = self._label_pairs(key)
+
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                yield f'{self.name}_bucket', pairs + (('le', _format_value(bound)),), cumulative
+
+            cumulative += counts[-1]
+            yield f'{self.name}_bucket', pairs + (('le', '+Inf'),), cumulative
+            yield f'{self.name}_count', pairs, cumulative
+            yield f'{self.name}_sum', pairs, total
+
+
+class Registry(object):
+    ''' A set of metrics, rendered together in the Prometheus text
+        exposition format.
+    '''
+
+    def __init__(self) -> None:
+
+        self._metrics: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f'metric {metric.name} is already registered')
+
+            self._metrics[metric.name] = metric
+
+        return metric
+
+    def counter(self, name: str, help: str, labels: Iterable[str]=()) -> Counter:
+
+        return self.register(Counter(name, help, labels))
+
+    def gauge(self, name: str, help: str, labels: Iterable[str]=()) -> Gauge:
+
+        return self.register(Gauge(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Iterable[str]=(),
+                  buckets: Iterable[float]=FAST_BUCKETS) -> Histogram:
+
+        return self.register(Histogram(name, help, labels, buckets=buckets))
+
+    def render(self) -> str:
+
+        with self._lock:
+            metrics = list(self._metrics.values())
+
+        lines: List[str] = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {_escape(metric.help)}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+
+            for name, pairs, value in metric.samples():
+                if pairs:
+                    labels = ','.join(f'{label}="{_escape(val)}"' for label, val in pairs)
+                    lines.append(f'{name}{{{labels}}} {_format_value(value)}')
+                else:
+                    lines.append(f'{name} {_format_value(value)}')
+
+        lines.append('')
+        return '\n'.join(lines)
+
+
+class Metrics(object):
+    ''' The metrics exported by tubedlapi.
+
+        Updates only take a lock and a dictionary update, so they are
+        cheap enough to leave enabled. When `enabled` is false, every
+        update is skipped.
+    '''
+
+    def __init__(self, enabled: bool=True, registry: Registry=None,
+                 max_tracked_jobs: int=10000) -> None:
+
+        self.enabled = enabled
+        self.registry = registry = registry or Registry()
+
+        self.executor_queued = registry.gauge(
+            'tubedlapi_executor_queued_tasks',
+            'Tasks waiting for a thread, by pipeline stage',
+            ['stage'],
+        )
+        self.executor_active = registry.gauge(
+            'tubedlapi_executor_active_threads',
+            'Threads running a task, by pipeline stage',
+            ['stage'],
+        )
+        self.executor_max = registry.gauge(
+            'tubedlapi_executor_max_threads',
+            'Size of the thread pool, by pipeline stage',
+            ['stage'],
+        )
+        self.job_transitions = registry.counter(
+            'tubedlapi_job_transitions_total',
+            'Job status changes, by the status entered',
+            ['status'],
+        )
+        self.job_status_seconds = registry.histogram(
+            'tubedlapi_job_status_seconds',
+            'Time jobs spent in a status before moving on, by that status',
+            ['status'],
+            buckets=STAGE_BUCKETS,
+        )
+        self.job_seconds = registry.histogram(
+            'tubedlapi_job_seconds',
+            'Time from job creation until it completed or failed',
+            ['status'],
+            buckets=STAGE_BUCKETS,
+        )
+        self.downloaded_bytes = registry.counter(
+            'tubedlapi_downloaded_bytes_total',
+            'Bytes of media downloaded',
+        )
+        self.uploaded_bytes = registry.counter(
+            'tubedlapi_uploaded_bytes_total',
+            'Bytes uploaded, by destination',
+            ['destination'],
+        )
+        self.upload_seconds = registry.histogram(
+            'tubedlapi_upload_seconds',
+            'Time taken by successful uploads, by destination',
+            ['destination'],
+            buckets=STAGE_BUCKETS,
+        )
+        self.upload_errors = registry.counter(
+            'tubedlapi_upload_errors_total',
+            'Failed uploads, by destination',
+            ['destination'],
+        )
+        self.db_query_seconds = registry.histogram(
+            'tubedlapi_db_query_seconds',
+            'Time taken by database queries, by the route which ran them',
+            ['route'],
+        )
+        self.crypto_seconds = registry.histogram(
+            'tubedlapi_crypto_seconds',
+            'Time taken by blob encryption and decryption, by operation',
+            ['operation'],
+        )
+
+        # Status and time of the last status change of running jobs
+        self._job_statuses = LRUCache(maxsize=max_tracked_jobs)
+
+    def job_status(self, job_id: object, status: str, created_at: float,
+                   terminal: bool=False) -> None:
+        ''' Records that job `job_id` is now in `status`. Time spent in
+            the previous status (`queued` for a new job, since
+            `created_at`) is observed when the status changed.
+        '''
+
+        if not self.enabled:
+            return
+
+        now = time.time()
+        previous, since = self._job_statuses.pop(job_id) or ('queued', created_at)
+        if previous == status:
+            self._job_statuses.put(job_id, (previous, since))
+            return
+
+        if not terminal:
+            self._job_statuses.put(job_id, (status, now))
+
+        self.job_transitions.inc(status=status)
+        self.job_status_seconds.observe(now - since, status=previous)
+        if terminal:
+            self.job_seconds.observe(now - created_at, status=status)
+
+    def downloaded(self, size: int) -> None:
+
+        if self.enabled and size:
+            self.downloaded_bytes.inc(size)
+
+    @contextmanager
+    def upload(self, destination: str) -> Iterator[None]:
+        ''' Times an upload to `destination`, counting it as an
+            error if the block raises.
+        '''
+
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.upload_errors.inc(destination=destination)
+            raise
+
+        self.upload_seconds.observe(time.perf_counter() - start, destination=destination)
+
+    def uploaded(self, destination: str, size: int) -> None:
+
+        if self.enabled:
+            self.uploaded_bytes.inc(size, destination=destination)
+
+    def observe_query(self, seconds: float) -> None:
+        ''' Records a database query, labelled with the endpoint of
+            the current request, or `background` outside of one.
+        '''
+
+        if not self.enabled:
+            return
+
+        if flask.has_request_context():
+            route = flask.request.endpoint or 'unknown'
+        else:
+            route = 'background'
+
+        self.db_query_seconds.observe(seconds, route=route)
+
+    def observe_crypto(self, operation: str, seconds: float) -> None:
+
+        if not self.enabled:
+            return
+
+        self.crypto_seconds.observe(seconds, operation=operation)
+
+    def render(self, executor_stats: Dict[str, dict]=None) -> str:
+        ''' Renders every metric, with the executor gauges taken
+            from `JobExecutor.stats()`.
+        '''
+
+        for stage, pool in (executor_stats or {}).items():
+            self.executor_queued.set(pool['queued'], stage=stage)
+            self.executor_active.set(pool['active'], stage=stage)
+            self.executor_max.set(pool['max_workers'], stage=stage)
+
+        return self.registry.render()
+
+
+class _MetricsServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+
+def serve(render: Callable[[], str], host: str, port: int) -> HTTPServer:
+    ''' Serves `render()` at `/metrics` from a background thread, for
+        processes without an API of their own.
+    '''
+
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self) -> None:
+
+            if self.path.split('?', 1)[0] != '/metrics':
+                self.send_error(404)
+                return
+
+            body = render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args) -> None:
+
+            log.debug(format, *args)
+
+    server = _MetricsServer((host, port), Handler)
+    threading.Thread(
+        target=server.serve_forever,
+        name='tubedlapi-metrics',
+        daemon=True,
+    ).start()
+
+    log.info('serving metrics on %s:%d', host, port)
+    return server
@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import multiprocessing
+import signal
+import threading
+import uuid
+from collections import deque
+from concurrent.futures import (
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Set,
+    Tuple,
+)
+
+log = logging.getLogger(__name__)
+
+DONE = '__done__'
+
+
+class RemoteError(Exception):
+    ''' An exception raised by a function running in a worker process.
+        Carries the message of the original exception, which may not
+        survive pickling.
+    '''
+
+
+class RelayTimeout(Exception):
+    ''' The messages of a call were not all handled in time.
+    '''
+
+
+class Relay(object):
+    ''' Sends messages from a worker process back to the handlers
+        registered for the call in the parent process, and tells
+        whether the parent has cancelled the call.
+    '''
+
+    def __init__(self, queue: Any, call_id: str, cancelled: Any=None) -> None:
+
+        self.queue = queue
+        self.call_id = call_id
+        self._cancelled = cancelled
+
+    def send(self, kind: str, payload: Any=None) -> None:
+
+        self.queue.put((self.call_id, kind, payload))
+
+    def cancelled(self) -> bool:
+        ''' Whether the parent cancelled this call. Asks the manager
+            process, so callers should not poll this in a tight loop.
+        '''
+
+        return self._cancelled is not None and self._cancelled.get(self.call_id, False)
+
+
+def _ignore_interrupts() -> None:
+    ''' Leaves Ctrl-C to the parent process, which shuts the pool down.
+    '''
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+def _invoke(func: Callable, relay: Relay, args: tuple) -> Any:
+
+    _ignore_interrupts()
+
+    try:
+        return func(relay, *args)
+    except Exception as e:
+        raise RemoteError(str(e)) from None
+    finally:
+        relay.send(DONE)
+
+
+class _Call(object):
+    ''' A running call, with the messages received for it which have
+        not been handled yet.
+    '''
+
+    def __init__(self, call_id: str, handlers: Dict[str, Callable[[Any], None]]) -> None:
+
+        self.call_id = call_id
+        self.handlers = handlers
+        self.drained = threading.Event()
+        self.pending: Deque[Tuple[str, Any]] = deque()
+        # Whether a handler thread is working through `pending`
+        self.scheduled = False
+
+
+class RelayProcessPool(object):
+    ''' Runs functions in a pool of worker processes.
+
+        A function is called with a `Relay` as its first argument. The
+        messages it sends are handed to the handlers given for the call,
+        in order. Handlers run on a pool of `handler_threads` threads in
+        the parent, so a slow handler (hashing a finished download, say)
+        only holds up messages of its own call. `call` returns only after
+        every message of the call was handled. A running call can be
+        flagged with `cancel`, which the function polls through
+        `Relay.cancelled`.
+
+        Worker processes are forked by `start`, which should run before
+        the parent starts any threads of its own.
+    '''
+
+    def __init__(self, max_workers: int=4, drain_timeout: float=None,
+                 handler_threads: int=None) -> None:
+
+        self.max_workers = max_workers
+        self.drain_timeout = drain_timeout
+        self.handler_threads = handler_threads or max_workers
+        self.messages = 0
+
+        self._calls: Dict[str, _Call] = {}
+        self._cancelled_calls: Set[str] = set()
+        self._lock = threading.Lock()
+        self._pending_lock = threading.Lock()
+        self._manager = None
+        self._queue = None
+        self._cancelled = None
+        self._pool: ProcessPoolExecutor = None
+        self._handlers: ThreadPoolExecutor = None
+        self._listener: threading.Thread = None
+
+    @property
+    def started(self) -> bool:
+
+        return self._pool is not None
+
+    def start(self) -> None:
+
+        with self._lock:
+            if self._pool is not None:
+                return
+
+            self._manager = multiprocessing.Manager()
+            self._queue = self._manager.Queue()
+            self._cancelled = self._manager.dict()
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+            self._handlers = ThreadPoolExecutor(
+                max_workers=self.handler_threads,
+                thread_name_prefix='tubedlapi-relay-handler',
+            )
+
+            # Fork every worker process now, rather than on the first call
+            for fut in [self._pool.submit(_ignore_interrupts) for _ in range(self.max_workers)]:
+                fut.result()
+
+            self._listener = threading.Thread(
+                target=self._listen,
+                name='tubedlapi-relay',
+                daemon=True,
+            )
+            self._listener.start()
+
+        log.info('started %d fetch processes', self.max_workers)
+
+    def call(self, handlers: Dict[str, Callable[[Any], None]], func: Callable, *args,
+             call_id: str=None) -> Any:
+        ''' Runs `func(relay, *args)` in a worker process and returns its
+            result. `func` must be importable at module level, and its
+            arguments and result picklable.
+
+            `call_id` names the call for `cancel`, and must be unique
+            among running calls.
+
+            Raises `RelayTimeout` if the messages of the call were not all
+            handled within `drain_timeout` seconds of it returning, when
+            a timeout is set.
+        '''
+
+        self.start()
+
+        call_id = call_id or uuid.uuid4().hex
+        call = _Call(call_id, handlers)
+        self._calls[call_id] = call
+
+        try:
+            relay = Relay(self._queue, call_id, self._cancelled)
+            fut = self._pool.submit(_invoke, func, relay, args)
+            try:
+                result = fut.result()
+            except BaseException:
+                if not call.drained.wait(self.drain_timeout):
+                    log.warning('messages of failed call %s were not drained', call_id)
+                raise
+
+            # The caller goes on to use what the handlers stored
+            if not call.drained.wait(self.drain_timeout):
+                raise RelayTimeout(
+                    f'messages of call {call_id} were not handled '
+                    f'within {self.drain_timeout} seconds'
+                )
+
+            return result
+        finally:
+            self._calls.pop(call_id, None)
+
+            with self._lock:
+                cancelled = call_id in self._cancelled_calls
+                self._cancelled_calls.discard(call_id)
+
+            if cancelled:
+                self._cancelled.pop(call_id, None)
+
+    def cancel(self, call_id: str) -> bool:
+        ''' Flags the running call `call_id` as cancelled. Returns
+            whether there was such a call.
+        '''
+
+        with self._lock:
+            if self._pool is None or call_id not in self._calls:
+                return False
+
+            self._cancelled_calls.add(call_id)
+
+        self._cancelled[call_id] = True
+        return True
+
+    def _listen(self) -> None:
+
+        while True:
+            try:
+                call_id, kind, payload = self._queue.get()
+            except (EOFError, OSError):
+                # The manager process has gone away, we are shutting down.
+                return
+
+            self.messages += 1
+
+            call = self._calls.get(call_id)
+            if call is None:
+                continue
+
+            with self._pending_lock:
+                call.pending.append((kind, payload))
+                if call.scheduled:
+                    continue
+
+                call.scheduled = True
+
+            try:
+                self._handlers.submit(self._handle, call)
+            except RuntimeError:
+                # The handler threads were shut down
+                return
+
+    def _handle(self, call: _Call) -> None:
+        ''' Hands the pending messages of `call` to its handlers, in
+            order, until there are none left.
+        '''
+
+        while True:
+            with self._pending_lock:
+                if not call.pending:
+                    call.scheduled = False
+                    return
+
+                kind, payload = call.pending.popleft()
+
+            if kind == DONE:
+                call.drained.set()
+                continue
+
+            handler = call.handlers.get(kind)
+            if handler is None:
+                continue
+
+            try:
+                handler(payload)
+            except Exception:
+                log.exception('handling %s message of call %s failed', kind, call.call_id)
+
+    def shutdown(self, wait: bool=True) -> None:
+
+        with self._lock:
+            if self._pool is None:
+                return
+
+            self._pool.shutdown(wait=wait)
+            self._manager.shutdown()
+            self._handlers.shutdown(wait=wait)
+            self._pool = None
+
+    def stats(self) -> dict:
+
+        return {
+            'started': self.started,
+            'max_workers': self.max_workers,
+            'calls': len(self._calls),
+            'messages': self.messages,
+        }
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+
+import threading
+from collections import deque
+from typing import (
+    Any,
+    Deque,
+    Dict,
+    Hashable,
+    Set,
+)
+
+
+class Subscription(object):
+    ''' A subscriber's view of a single topic.
+
+        Holds at most `maxsize` undelivered events; when a slow
+        subscriber falls behind, the oldest events are dropped.
+    '''
+
+    def __init__(self, hub: 'PubSub', topic: Hashable, maxsize: int) -> None:
+
+        self.hub = hub
+        self.topic = topic
+        self.dropped = 0
+
+        self._events: Deque[Any] = deque(maxlen=maxsize)
+        self._cond = threading.Condition()
+
+    def put(self, event: Any) -> None:
+
+        with self._cond:
+            if len(self._events) == self._events.maxlen:
+                self.dropped += 1
+
+            self._events.append(event)
+            self._cond.notify()
+
+    def get(self, timeout: float=None) -> Any:
+        ''' Returns the next event, or None if no event
+            arrives within `timeout` seconds.
+        '''
+
+        with self._cond:
+            if not self._events:
+                self._cond.wait(timeout=timeout)
+
+            if not self._events:
+                return None
+
+            return self._events.popleft()
+
+    def close(self) -> None:
+
+        self.hub.unsubscribe(self)
+
+    def __enter__(self) -> 'Subscription':
+
+        return self
+
+    def __exit__(self, *exc) -> None:
+
+        self.close()
+
+
+class PubSub(object):
+    ''' In-process publish/subscribe hub.
+
+        Publishing never blocks and costs a dictionary lookup
+        when a topic has no subscribers.
+    '''
+
+    def __init__(self, maxsize: int=100) -> None:
+
+        self.maxsize = maxsize
+
+        self._topics: Dict[Hashable, Set[Subscription]] = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, topic: Hashable) -> Subscription:
+
+        subscription = Subscription(self, topic, self.maxsize)
+        with self._lock:
+            self._topics.setdefault(topic, set()).add(subscription)
+
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+
+        with self._lock:
+            subscribers = self._topics.get(subscription.topic)
+            if not subscribers:
+                return
+
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._topics[subscription.topic]
+
+    def has_subscribers(self, topic: Hashable) -> bool:
+
+        return bool(self._topics.get(topic))
+
+    def publish(self, topic: Hashable, event: Any) -> int:
+        ''' Delivers `event` to every subscriber of `topic`.
+            Returns the number of subscribers.
+        '''
+
+        subscribers = self._topics.get(topic)
+        if not subscribers:
+            return 0
+
+        with self._lock:
+            subscribers = list(subscribers)
+
+        for subscription in subscribers:
+            subscription.put(event)
+
+        return len(subscribers)
+
+    def stats(self) -> dict:
+
+        with self._lock:
+            return {
+                'topics': len(self._topics),
+                'subscribers': sum(len(s) for s in self._topics.values()),
+            }
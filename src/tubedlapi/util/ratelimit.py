@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Tuple,
+)
+
+log = logging.getLogger(__name__)
+
+# (concurrency, rate, burst); 0 means unlimited
+LimitSpec = Tuple[int, float, float]
+
+KEY_EXTRACTOR = 'extractor'
+KEY_HOST = 'host'
+WILDCARD = '*'
+
+
+def parse_limit(spec: Any) -> LimitSpec:
+    ''' Parses a limit given as `concurrency[/rate[/burst]]`, as an
+        object with those keys, or as a bare concurrency. `rate` is in
+        fetches per second and `burst` defaults to `max(1, rate)`.
+        Raises ValueError for anything else.
+    '''
+
+    if isinstance(spec, dict):
+        values = [spec.get('concurrency', 0), spec.get('rate', 0), spec.get('burst')]
+    elif isinstance(spec, (int, float)) and not isinstance(spec, bool):
+        values = [spec, 0, None]
+    elif isinstance(spec, str) and spec.count('/') <= 2:
+        values = (spec.split('/') + [None, None])[:3]
+    else:
+        raise ValueError(f'limit must be `concurrency[/rate[/burst]]`, got `{spec}`')
+
+    concurrency = int(values[0] or 0)
+    rate = float(values[1] or 0)
+    burst = float(values[2]) if values[2] else max(1.0, rate)
+    if concurrency < 0 or rate < 0 or burst < 1:
+        raise ValueError(f'limit values must be positive, got `{spec}`')
+
+    return concurrency, rate, burst
+
+
+class TokenBucket(object):
+    ''' Allows `rate` takes per second on average, and up to `burst`
+        at once after a quiet period.
+    '''
+
+    def __init__(self, rate: float, burst: float) -> None:
+
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait(self, now: float) -> float:
+        ''' Seconds until a token can be taken, 0 if one can be now.
+        '''
+
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+
+        self._refill(now)
+        self.tokens -= 1
+
+
+class Limiter(object):
+    ''' Limits fetches sharing `key` (a host or an extractor) to
+        `concurrency` at once and `rate` starts per second.
+
+        Not thread-safe on its own; `FairScheduler` only uses it while
+        holding its lock.
+    '''
+
+    def __init__(self, key: str, concurrency: int=0, rate: float=0.0,
+                 burst: float=1.0) -> None:
+
+        self.key = key
+        self.concurrency = concurrency
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.active = 0
+        self.started = 0
+        self.delayed = 0
+
+    def wait(self, now: float) -> float:
+        ''' Seconds until a fetch may start, 0 if one may start now, or
+            infinity while at the concurrency cap.
+        '''
+
+        if self.concurrency and self.active >= self.concurrency:
+            return math.inf
+
+        return self.bucket.wait(now) if self.bucket else 0.0
+
+    def acquire(self, now: float) -> None:
+
+        self.active += 1
+        self.started += 1
+        if self.bucket:
+            self.bucket.take(now)
+
+    def release(self) -> None:
+
+        self.active -= 1
+
+    def stats(self) -> dict:
+
+        return {
+            'concurrency': self.concurrency,
+            'rate': self.bucket.rate if self.bucket else 0.0,
+            'active': self.active,
+            'started': self.started,
+            'delayed': self.delayed,
+        }
+
+
+class FetchLimits(object):
+    ''' Finds the limiters a fetch must pass, by its host and extractor.
+
+        Limits are keyed `host:<domain>` or `extractor:<ie key>`. A host
+        limit covers its subdomains too, and `host:*` or `extractor:*`
+        sets a limit for each host or extractor without a limit of its
+        own. Profiles may add limits of their own, which only apply to
+        fetches of that profile.
+    '''
+
+    def __init__(self, specs: Dict[str, Any]=None, max_limiters: int=4096) -> None:
+
+        self.specs = self._parse_specs(specs or {}, 'settings')
+
+        self._limiters: Dict[str, Limiter] = {
+            key: Limiter(key, *spec)
+            for key, spec in self.specs.items()
+            if not key.endswith(f':{WILDCARD}')
+        }
+        self.max_limiters = max_limiters
+        self._dynamic: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _parse_specs(specs: Dict[str, Any], source: str) -> Dict[str, LimitSpec]:
+
+        parsed = {}
+        for key, spec in specs.items():
+            kind, _, name = key.strip().partition(':')
+            if kind not in (KEY_HOST, KEY_EXTRACTOR) or not name:
+                log.error('%s has a fetch limit for an unknown key: %s', source, key)
+                continue
+
+            try:
+                parsed[f'{kind}:{name.lower()}'] = parse_limit(spec)
+            except ValueError as e:
+                log.error('%s has a malformed fetch limit for %s: %s', source, key, e)
+
+        return parsed
+
+    @property
+    def enabled(self) -> bool:
+
+        return bool(self.specs)
+
+    @property
+    def by_extractor(self) -> bool:
+        ''' Whether any limit needs the extractor of a fetch.
+        '''
+
+        return any(key.startswith(f'{KEY_EXTRACTOR}:') for key in self.specs)
+
+    def limiters(self, host: str=None, extractor: str=None, profile_id: Any=None,
+                 profile_specs: Dict[str, Any]=None) -> List[Limiter]:
+        ''' Returns the limiters for a fetch from `host` with `extractor`,
+            including those from `profile_specs` of profile `profile_id`.
+        '''
+
+        keys = []
+        if host:
+            keys.append((KEY_HOST, host.lower()))
+        if extractor:
+            keys.append((KEY_EXTRACTOR, extractor.lower()))
+
+        with self._lock:
+            limiters = self._find(keys, self.specs, self._limiters, None)
+
+            if profile_specs:
+                specs = self._parse_specs(profile_specs, f'profile {profile_id}')
+                limiters.extend(self._find(keys, specs, None, profile_id))
+
+        return limiters
+
+    def _find(self, keys: Iterable[Tuple[str, str]], specs: Dict[str, LimitSpec],
+              static: Dict[str, Limiter], scope: Any) -> List[Limiter]:
+
+        found = []
+        for kind, name in keys:
+            candidates = [name]
+            if kind == KEY_HOST:
+                parts = name.split('.')
+                candidates = ['.'.join(parts[i:]) for i in range(len(parts) - 1)] or [name]
+
+            for candidate in candidates + [WILDCARD]:
+                spec_key = f'{kind}:{candidate}'
+                spec = specs.get(spec_key)
+                if spec is None:
+                    continue
+
+                # A wildcard limits each host or extractor on its own
+                key = f'{kind}:{name}' if candidate == WILDCARD else spec_key
+                if static is not None and candidate != WILDCARD:
+                    found.append(static[key])
+                else:
+                    found.append(self._dynamic_limiter(scope, key, spec))
+                break
+
+        return found
+
+    def _dynamic_limiter(self, scope: Any, key: str, spec: LimitSpec) -> Limiter:
+
+        cache_key = (scope, key, spec)
+        limiter = self._dynamic.get(cache_key)
+        if limiter is not None:
+            self._dynamic.move_to_end(cache_key)
+            return limiter
+
+        label = f'profile:{scope}/{key}' if scope is not None else key
+        limiter = self._dynamic[cache_key] = Limiter(label, *spec)
+
+        # Forget the least recently used limiters with nothing running
+        for old_key in list(self._dynamic)[:max(0, len(self._dynamic) - self.max_limiters)]:
+            if not self._dynamic[old_key].active:
+                del self._dynamic[old_key]
+
+        return limiter
+
+    def stats(self) -> Dict[str, dict]:
+
+        with self._lock:
+            limiters = list(self._limiters.values())
+            limiters.extend(
+                limiter for limiter in self._dynamic.values() if limiter.active
+            )
+
+        return {limiter.key: limiter.stats() for limiter in limiters}
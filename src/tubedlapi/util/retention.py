@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+from typing import List
+
+log = logging.getLogger(__name__)
+
+
+class ArtifactRetention(object):
+    ''' Retention limits of artifacts, applied by `sweep` at most
+        once per `interval` seconds.
+    '''
+
+    def __init__(self, max_age: float=0, max_size: int=0, interval: float=300.0) -> None:
+
+        self.max_age = max_age
+        self.max_size = max_size
+        self.interval = interval
+
+        self._lock = threading.Lock()
+        self._last_sweep: float = None
+
+    def sweep(self) -> List[str]:
+        ''' Forgets artifacts past the limits, and returns the
+            removed files.
+        '''
+
+        if not self.max_age and not self.max_size:
+            return []
+
+        now = time.monotonic()
+        with self._lock:
+            if self._last_sweep is not None and now - self._last_sweep < self.interval:
+                return []
+
+            self._last_sweep = now
+
+        from tubedlapi.model.artifact import Artifact
+
+        try:
+            # Files recorded since the last sweep may not be uploaded yet
+            return Artifact.sweep(self.max_age, self.max_size, min_idle=self.interval)
+        except Exception:
+            log.exception('could not sweep artifacts')
+            return []
@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+
+import itertools
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    List,
+    Tuple,
+)
+
+from tubedlapi.util.ratelimit import Limiter
+
+log = logging.getLogger(__name__)
+
+PRIORITY_LOW = -10
+PRIORITY_NORMAL = 0
+PRIORITY_HIGH = 10
+
+# How far into a tenant's queue to look for a task whose fetch limits
+# allow it to start, past tasks held back by their limits
+LIMIT_LOOKAHEAD = 64
+
+PRIORITIES = {
+    'low': PRIORITY_LOW,
+    'normal': PRIORITY_NORMAL,
+    'high': PRIORITY_HIGH,
+}
+
+
+def parse_priority(value: Any, default: int=PRIORITY_NORMAL) -> int:
+    ''' Resolves a priority given by name (`low`, `normal`, `high`)
+        or as an integer. Raises ValueError for anything else.
+    '''
+
+    if value is None:
+        return default
+
+    if isinstance(value, str) and value.lower() in PRIORITIES:
+        return PRIORITIES[value.lower()]
+
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+
+    raise ValueError(f'priority must be one of {", ".join(PRIORITIES)} or an integer')
+
+
+class _Task(object):
+
+    __slots__ = (
+        'func', 'args', 'kw', 'future', 'tenant', 'priority', 'limiters', 'tag', 'held_by',
+    )
+
+    def __init__(self, func: Callable, args: tuple, kw: dict, tenant: str,
+                 priority: int, limiters: List[Limiter]) -> None:
+
+        self.func = func
+        self.args = args
+        self.kw = kw
+        self.future: Future = Future()
+        self.tenant = tenant
+        self.priority = priority
+        self.limiters = limiters
+        self.tag: Tuple[float, int] = None
+        # Limiters which have held the task back, each counted once
+        self.held_by: List[Limiter] = []
+
+
+class FairScheduler(object):
+    ''' Queues tasks in front of a `StagePool`, and hands them to the
+        pool only as it has threads free, so the order in which work
+        starts is decided here rather than by the pool's FIFO queue.
+
+        Higher priorities always start first. Within a priority, tenants
+        (API clients or profiles) share the pool by weighted fair
+        queuing: each task is tagged with its tenant's virtual start
+        time, which advances by `1 / weight` per task, and the smallest
+        tag starts next. A tenant flooding the queue only delays its own
+        later tasks.
+
+        A tenant may hold at most `max_share` of the pool's threads, and
+        background work (negative priorities) at most `background_share`
+        of them, so some threads stay free for interactive work.
+
+        Tasks may also carry fetch limiters (see `util.ratelimit`); a
+        task held back by its limiters stays queued, without holding a
+        pool thread, while later tasks for other hosts go ahead. Tasks
+        held back only by a rate are retried once a token is due.
+    '''
+
+    def __init__(self, pool: Any, weights: Dict[str, float]=None, max_share: float=1.0,
+                 background_share: float=1.0) -> None:
+
+        self.pool = pool
+        self.weights = weights or {}
+        self.max_share = max_share
+        self.background_share = background_share
+
+        self.tenant_limit = max(1, math.floor(pool.max_workers * max_share))
+        self.background_limit = max(1, math.floor(pool.max_workers * background_share))
+
+        # priority -> tenant -> tasks, oldest first
+        self._queues: Dict[int, Dict[str, Deque[_Task]]] = {}
+        self._finish_tags: Dict[Tuple[int, str], float] = {}
+        self._virtual_time: Dict[int, float] = {}
+        self._running: Dict[str, int] = {}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._retry_at = math.inf
+        self._timer: threading.Timer = None
+        self._timer_at = math.inf
+
+        self.queued = 0
+        self.active = 0
+        self.active_background = 0
+        self.started = 0
+        self.limited = 0
+
+    def submit(self, tenant: str, priority: int, limiters: List[Limiter], func: Callable,
+               *args, **kw) -> Future:
+        ''' Queues `func(*args, **kw)` for `tenant` at `priority`, to start
+            once all of `limiters` allow it. The returned future can be
+            cancelled until the task starts.
+        '''
+
+        task = _Task(func, args, kw, tenant or '', priority, limiters or [])
+
+        with self._lock:
+            self._enqueue(task)
+
+        self._dispatch()
+
+        return task.future
+
+    def _enqueue(self, task: _Task) -> None:
+
+        key = (task.priority, task.tenant)
+        start = max(
+            self._virtual_time.get(task.priority, 0.0),
+            self._finish_tags.get(key, 0.0),
+        )
+        self._finish_tags[key] = start + 1.0 / max(self.weights.get(task.tenant, 1.0), 1e-6)
+        task.tag = (start, next(self._seq))
+
+        self._queues.setdefault(task.priority, {}).setdefault(task.tenant, deque()).append(task)
+        self.queued += 1
+
+    def _eligible(self, task: _Task) -> bool:
+
+        if self._running.get(task.tenant, 0) >= self.tenant_limit:
+            return False
+
+        if task.priority < 0 and self.active_background >= self.background_limit:
+            return False
+
+        return True
+
+    def _allowed(self, task: _Task, now: float) -> bool:
+        ''' Whether the limiters of `task` allow it to start now. If not,
+            notes when to try again, and counts the task as delayed by
+            the limiter holding it back, once per limiter.
+        '''
+
+        for limiter in task.limiters:
+            wait = limiter.wait(now)
+            if wait:
+                if limiter not in task.held_by:
+                    task.held_by.append(limiter)
+                    limiter.delayed += 1
+                self._retry_at = min(self._retry_at, now + wait)
+                return False
+
+        return True
+
+    def _first_allowed(self, queue: Deque[_Task], now: float) -> _Task:
+
+        for task in itertools.islice(queue, LIMIT_LOOKAHEAD):
+            if self._allowed(task, now):
+                return task
+
+        return None
+
+    def _next(self, now: float) -> _Task:
+        ''' Takes the next task to start off the queues, or returns
+            None if no queued task may start now.
+        '''
+
+        for priority in sorted(self._queues, reverse=True):
+            tenants = self._queues[priority]
+
+            best: _Task = None
+            for queue in tenants.values():
+                # Caps are per tenant and priority, so the head decides
+                if not self._eligible(queue[0]):
+                    continue
+
+                task = self._first_allowed(queue, now)
+                if task is not None and (best is None or task.tag < best.tag):
+                    best = task
+
+            if best is None:
+                continue
+
+            queue = tenants[best.tenant]
+            if queue[0] is best:
+                queue.popleft()
+            else:
+                queue.remove(best)
+                self.limited += 1
+            if not queue:
+                del tenants[best.tenant]
+                # Idle tenants start over from the current virtual time
+                self._finish_tags.pop((priority, best.tenant), None)
+                if not tenants:
+                    del self._queues[priority]
+
+            self._virtual_time[priority] = best.tag[0]
+            self.queued -= 1
+
+            return best
+
+        return None
+
+    def _dispatch(self) -> None:
+
+        starting: List[_Task] = []
+        with self._lock:
+            now = time.monotonic()
+            self._retry_at = math.inf
+            while self.active < self.pool.max_workers:
+                task = self._next(now)
+                if task is None:
+                    break
+
+                # Skip tasks cancelled while they were queued
+                if not task.future.set_running_or_notify_cancel():
+                    continue
+
+                for limiter in task.limiters:
+                    limiter.acquire(now)
+
+                self.active += 1
+                self.started += 1
+                self._running[task.tenant] = self._running.get(task.tenant, 0) + 1
+                if task.priority < 0:
+                    self.active_background += 1
+
+                starting.append(task)
+
+            if self.queued and self.active < self.pool.max_workers:
+                self._schedule_retry(now)
+
+        for task in starting:
+            try:
+                inner = self.pool.submit(task.func, *task.args, **task.kw)
+            except Exception as e:
+                self._finished(task, None, e)
+                continue
+
+            inner.add_done_callback(lambda fut, task=task: self._finished(task, fut))
+
+    def _schedule_retry(self, now: float) -> None:
+        ''' Arms a timer to dispatch again once a rate limiter holding
+            back queued tasks has a token due. Tasks held back by a
+            concurrency cap are dispatched as running tasks finish.
+        '''
+
+        if self._retry_at == math.inf:
+            return
+
+        if self._timer is not None and self._timer_at <= self._retry_at:
+            return
+
+        if self._timer is not None:
+            self._timer.cancel()
+
+        self._timer = threading.Timer(max(0.0, self._retry_at - now), self._retry)
+        self._timer_at = self._retry_at
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _retry(self) -> None:
+
+        with self._lock:
+            self._timer = None
+            self._timer_at = math.inf
+
+        self._dispatch()
+
+    def _finished(self, task: _Task, inner: Future, error: Exception=None) -> None:
+
+        with self._lock:
+            for limiter in task.limiters:
+                limiter.release()
+
+            self.active -= 1
+            self._running[task.tenant] -= 1
+            if not self._running[task.tenant]:
+                del self._running[task.tenant]
+            if task.priority < 0:
+                self.active_background -= 1
+
+        # Start the next task before running the callbacks of this one
+        self._dispatch()
+
+        if error is None and inner.cancelled():
+            error = RuntimeError('task was cancelled by its pool')
+        elif error is None:
+            error = inner.exception()
+
+        if error is not None:
+            task.future.set_exception(error)
+        else:
+            task.future.set_result(inner.result())
+
+    def stats(self) -> dict:
+
+        with self._lock:
+            queued_by_tenant: Dict[str, int] = {}
+            queued_by_priority: Dict[int, int] = {}
+            for priority, tenants in self._queues.items():
+                for tenant, queue in tenants.items():
+                    queued_by_tenant[tenant] = queued_by_tenant.get(tenant, 0) + len(queue)
+                    queued_by_priority[priority] = queued_by_priority.get(priority, 0) + len(queue)
+
+            return {
+                'queued': self.queued,
+                'active': self.active,
+                'active_background': self.active_background,
+                'started': self.started,
+                'limited': self.limited,
+                'tenant_limit': self.tenant_limit,
+                'background_limit': self.background_limit,
+                'queued_by_priority': queued_by_priority,
+                'queued_by_tenant': queued_by_tenant,
+                'active_by_tenant': dict(self._running),
+            }
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator
+
+log = logging.getLogger(__name__)
+
+
+class PhaseTimer(object):
+    ''' Records how long each named phase of a process takes,
+        in the order the phases ran.
+    '''
+
+    def __init__(self) -> None:
+
+        self.phases: OrderedDict = OrderedDict()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.monotonic() - start
+
+    @property
+    def total(self) -> float:
+
+        return sum(self.phases.values())
+
+    def report(self) -> dict:
+        ''' Phase durations, and their total, in milliseconds.
+        '''
+
+        return {
+            'phases': OrderedDict(
+                (name, round(seconds * 1000.0, 3)) for name, seconds in self.phases.items()
+            ),
+            'total': round(self.total * 1000.0, 3),
+        }
+
+    def log(self, what: str) -> None:
+
+        log.info(
+            '%s took %.1f ms (%s)',
+            what,
+            self.total * 1000.0,
+            ', '.join(
+                f'{name} {seconds * 1000.0:.1f} ms' for name, seconds in self.phases.items()
+            ),
+        )
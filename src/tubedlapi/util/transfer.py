@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import io
+import json
+import logging
+import os
+import time
+from typing import (
+    Callable,
+    Dict,
+)
+
+from fs.base import FS
+from fs.errors import (
+    FSError,
+    ResourceReadOnly,
+    Unsupported,
+)
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+MARKER_SUFFIX = '.transfer'
+
+
+def file_digest(path: str, buffer_size: int=DEFAULT_BUFFER_SIZE) -> str:
+    ''' Returns the hex SHA-256 of the file at `path`, reading it
+        in chunks of `buffer_size` bytes.
+    '''
+
+    digest = hashlib.sha256()
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    with io.open(path, 'rb') as f:
+        while True:
+            read = f.readinto(buf)
+            if not read:
+                break
+
+            digest.update(view[:read])
+
+    return digest.hexdigest()
+
+
+def marker_path(dst_path: str) -> str:
+    ''' Returns the path of the marker kept next to `dst_path` while
+        a resumable copy to it is incomplete.
+    '''
+
+    return f'{dst_path}{MARKER_SUFFIX}'
+
+
+def _source_marker(src_path: str) -> bytes:
+    ''' Identifies the local file at `src_path` as it is now, so
+        a partial copy of it can be told apart from any other file.
+    '''
+
+    stat = os.stat(src_path)
+    return json.dumps({
+        'path': os.path.abspath(src_path),
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns,
+    }, sort_keys=True).encode('utf-8')
+
+
+def _read_marker(dst_fs: FS, path: str) -> bytes:
+
+    try:
+        return dst_fs.getbytes(path)
+    except FSError:
+        return None
+
+
+def _remove_marker(dst_fs: FS, path: str) -> None:
+
+    try:
+        dst_fs.remove(path)
+    except FSError:
+        log.warning('could not remove transfer marker %s from %r', path, dst_fs)
+
+
+def copy_chunked(src_path: str, dst_fs: FS, dst_path: str,
+                 buffer_size: int=DEFAULT_BUFFER_SIZE, resume: bool=True,
+                 progress: Callable[[int, int], None]=None) -> Dict[str, float]:
+    ''' Copies the local file at `src_path` to `dst_path` on `dst_fs`
+        in chunks of `buffer_size` bytes.
+
+        If `resume` is set, a marker identifying the source is kept
+        next to `dst_path` until the copy completes. When a copy is
+        retried and finds the marker for the same source, only the
+        remaining bytes are sent, provided the backend supports opening
+        files for append, and a copy which was already complete is kept.
+        Without a matching marker, an existing file is overwritten.
+
+        `progress` is called with `(bytes_done, bytes_total)` after
+        each chunk. Returns transfer statistics.
+    '''
+
+    total = os.path.getsize(src_path)
+
+    marker = _source_marker(src_path) if resume else None
+    marker_at = marker_path(dst_path)
+
+    remote_size = None
+    if resume and dst_fs.exists(dst_path) and _read_marker(dst_fs, marker_at) == marker:
+        remote_size = dst_fs.getsize(dst_path)
+
+    offset = 0
+    transferred = 0
+    start = time.monotonic()
+
+    if remote_size == total:
+        log.info('%s is already complete on %r', dst_path, dst_fs)
+        offset = total
+        _remove_marker(dst_fs, marker_at)
+    else:
+        dst_file = None
+        if remote_size and remote_size < total:
+            try:
+                dst_file = dst_fs.openbin(dst_path, 'a')
+                offset = remote_size
+            except (ResourceReadOnly, Unsupported):
+                log.info('%r does not support append, not resuming %s', dst_fs, dst_path)
+
+        # A resumed copy already has its marker
+        marked = bool(offset)
+        if resume and not marked:
+            try:
+                dst_fs.setbytes(marker_at, marker)
+                marked = True
+            except FSError:
+                log.warning('could not write transfer marker %s to %r', marker_at, dst_fs)
+
+        with io.open(src_path, 'rb') as src_file:
+            src_file.seek(offset)
+            dst_file = dst_file or dst_fs.openbin(dst_path, 'w')
+
+            buf = bytearray(buffer_size)
+            view = memoryview(buf)
+            with dst_file:
+                while True:
+                    read = src_file.readinto(buf)
+                    if not read:
+                        break
+
+                    dst_file.write(view[:read])
+                    transferred += read
+
+                    if progress:
+                        progress(offset + transferred, total)
+
+        if marked:
+            _remove_marker(dst_fs, marker_at)
+
+    elapsed = time.monotonic() - start
+
+    return {
+        'bytes_total': total,
+        'bytes_resumed': offset,
+        'bytes_transferred': transferred,
+        'buffer_size': buffer_size,
+        'elapsed_seconds': elapsed,
+        'bytes_per_second': transferred / elapsed if elapsed > 0 else 0.0,
+    }
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+import logging
+import threading
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    List,
+    Set,
+    Tuple,
+)
+
+log = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer(object):
+    ''' Holds the latest value for each key in memory and hands it
+        to `writer` at most once per `interval` seconds per key.
+
+        Updates arriving between writes replace each other, so a
+        key updated a hundred times a second is still written about
+        once per interval. Writes happen on a background thread.
+
+        A key is written by one thread at a time, and its writes happen
+        in the order of its updates.
+    '''
+
+    def __init__(self, writer: Callable[[Hashable, Any], None], interval: float=1.0) -> None:
+
+        self.writer = writer
+        self.interval = interval
+        self.writes = 0
+        self.coalesced = 0
+
+        self._pending: Dict[Hashable, Any] = {}
+        self._last_write: Dict[Hashable, float] = {}
+        # Keys taken off `_pending` whose write has not finished yet
+        self._in_flight: Set[Hashable] = set()
+        self._cond = threading.Condition()
+        self._thread: threading.Thread = None
+
+    def update(self, key: Hashable, value: Any) -> None:
+
+        with self._cond:
+            if key in self._pending:
+                self.coalesced += 1
+
+            self._pending[key] = value
+
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run,
+                    name='tubedlapi-writebehind',
+                    daemon=True,
+                )
+                self._thread.start()
+
+            # `discard` and `flush` may be waiting on the condition too
+            self._cond.notify_all()
+
+    def discard(self, key: Hashable) -> None:
+        ''' Drops any pending value for `key` and waits for an
+            in-flight write of `key` to finish, so the caller can
+            write a newer value without it being overwritten.
+        '''
+
+        with self._cond:
+            self._pending.pop(key, None)
+            self._last_write.pop(key, None)
+
+            while key in self._in_flight:
+                self._cond.wait()
+
+    def flush(self) -> None:
+        ''' Writes every pending value now, after any in-flight
+            write of the same keys.
+        '''
+
+        with self._cond:
+            while self._in_flight.intersection(self._pending):
+                self._cond.wait()
+
+            due = self._take(list(self._pending), time.monotonic())
+
+        self._write(due)
+
+    def _take(self, keys: Iterable[Hashable], now: float) -> List[Tuple[Hashable, Any]]:
+        ''' Pops the pending values of `keys` and marks them in flight.
+            Called with the condition held.
+        '''
+
+        due = []
+        for key in keys:
+            due.append((key, self._pending.pop(key)))
+            self._in_flight.add(key)
+            self._last_write[key] = now
+
+        return due
+
+    def _due(self) -> Tuple[List[Tuple[Hashable, Any]], float]:
+        ''' Pops pending values which may be written now. Returns them
+            along with the time until the next value becomes due. Keys
+            still being written wait for that write to finish.
+        '''
+
+        now = time.monotonic()
+        ready = []
+        wait = None
+        for key in self._pending:
+            if key in self._in_flight:
+                continue
+
+            remaining = self._last_write.get(key, 0.0) + self.interval - now
+            if remaining <= 0:
+                ready.append(key)
+            elif wait is None or remaining < wait:
+                wait = remaining
+
+        due = self._take(ready, now)
+
+        # Forget keys which have gone quiet, they may be written right away.
+        for key, last_write in list(self._last_write.items()):
+            if key not in self._pending and now - last_write > self.interval:
+                del self._last_write[key]
+
+        return due, wait
+
+    def _run(self) -> None:
+
+        while True:
+            with self._cond:
+                due, wait = self._due()
+                while not due:
+                    self._cond.wait(timeout=wait)
+                    due, wait = self._due()
+
+            self._write(due)
+
+    def _write(self, due: List[Tuple[Hashable, Any]]) -> None:
+
+        for key, value in due:
+            try:
+                self.writer(key, value)
+                self.writes += 1
+            except Exception:
+                log.exception('write-behind failed for %s', key)
+            finally:
+                with self._cond:
+                    self._in_flight.discard(key)
+                    self._cond.notify_all()
+
+    def stats(self) -> dict:
+
+        return {
+            'pending': len(self._pending),
+            'writes': self.writes,
+            'coalesced': self.coalesced,
+        }
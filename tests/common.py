@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+''' Shared setup for tests which need the application components,
+    against a scratch SQLite database in a temporary directory.
+'''
+
+import base64
+import os
+import shutil
+import tempfile
+import unittest
+
+_app = None
+
+
+def setup_app():
+    ''' Creates the application once per process. Settings which are
+        not set in the environment get test defaults.
+    '''
+
+    global _app
+
+    if _app is not None:
+        return _app
+
+    workdir = tempfile.mkdtemp(prefix='tubedlapi-test-')
+    defaults = {
+        'CRYPTO_SECRET': base64.b64encode(os.urandom(32)).decode('ascii'),
+        'CRYPTO_SALT': base64.b64encode(os.urandom(16)).decode('ascii'),
+        'DB_URI': f"sqlite:///{os.path.join(workdir, 'tubedlapi.db')}",
+        'LOG_LEVEL': 'WARNING',
+        'SWAGGER': 'false',
+        'JOB_QUEUE': 'local',
+    }
+    for key, value in defaults.items():
+        os.environ.setdefault(key, value)
+
+    from tubedlapi.app import main
+    _app = main()
+
+    return _app
+
+
+class AppTestCase(unittest.TestCase):
+    ''' Runs each test in a fresh working directory, where downloads
+        are written, with the application set up.
+    '''
+
+    def setUp(self) -> None:
+
+        self.app = setup_app()
+        self.cwd = os.getcwd()
+        self.workdir = tempfile.mkdtemp(prefix='tubedlapi-test-')
+        os.chdir(self.workdir)
+
+    def tearDown(self) -> None:
+
+        from tubedlapi.model import close_connection
+
+        close_connection()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.workdir, ignore_errors=True)
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+import unittest
+from unittest import mock
+
+from diecast.registry import ComponentRegistry
+
+from tubedlapi.app import LazyWSGIApp
+from tubedlapi.util.procpool import RelayProcessPool
+from tubedlapi.util.timing import PhaseTimer
+
+
+class RecordingApp(object):
+
+    def __init__(self) -> None:
+
+        self.calls = []
+
+    def __call__(self, environ, start_response):
+
+        self.calls.append(environ)
+        start_response('200 OK', [])
+        return [b'ok']
+
+
+class LazyWSGIAppTest(unittest.TestCase):
+
+    def test_app_is_created_on_first_request(self):
+
+        app = RecordingApp()
+        factory = mock.Mock(return_value=app)
+        wsgi = LazyWSGIApp(factory)
+
+        factory.assert_not_called()
+
+        start_response = mock.Mock()
+        body = wsgi({'PATH_INFO': '/'}, start_response)
+
+        self.assertEqual(body, [b'ok'])
+        self.assertEqual(app.calls, [{'PATH_INFO': '/'}])
+        start_response.assert_called_once_with('200 OK', [])
+
+        wsgi({'PATH_INFO': '/job'}, start_response)
+        factory.assert_called_once_with()
+        self.assertEqual(len(app.calls), 2)
+
+    def test_load_creates_app_before_first_request(self):
+
+        app = RecordingApp()
+        factory = mock.Mock(return_value=app)
+        wsgi = LazyWSGIApp(factory)
+
+        self.assertIs(wsgi.load(), app)
+        self.assertIs(wsgi.load(), app)
+        wsgi({}, mock.Mock())
+
+        factory.assert_called_once_with()
+        self.assertEqual(len(app.calls), 1)
+
+    def test_warns_when_fetch_processes_fork_on_request(self):
+
+        registry = ComponentRegistry()
+        pool = mock.Mock(started=True)
+        registry.add(RelayProcessPool, init=lambda: pool, persist=True)
+
+        with mock.patch('tubedlapi.app.registry', registry):
+            wsgi = LazyWSGIApp(RecordingApp)
+            with self.assertLogs('tubedlapi.app', 'WARNING'):
+                wsgi({}, mock.Mock())
+
+            # Loaded ahead of time, nothing is forked on a request
+            wsgi = LazyWSGIApp(RecordingApp)
+            wsgi.load()
+            with mock.patch('tubedlapi.app.log') as log:
+                wsgi({}, mock.Mock())
+
+            log.warning.assert_not_called()
+
+    def test_concurrent_first_requests_create_one_app(self):
+
+        created = []
+
+        def factory():
+            time.sleep(0.1)
+            created.append(RecordingApp())
+            return created[-1]
+
+        wsgi = LazyWSGIApp(factory)
+        threads = [
+            threading.Thread(target=wsgi, args=({}, mock.Mock()))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(created), 1)
+        self.assertEqual(len(created[0].calls), 8)
+
+
+class PhaseTimerTest(unittest.TestCase):
+
+    def test_phases_are_reported_in_order(self):
+
+        timer = PhaseTimer()
+        with mock.patch('tubedlapi.util.timing.time.monotonic', side_effect=[0.0, 0.5, 1.0, 1.25]):
+            with timer.phase('settings'):
+                pass
+            with timer.phase('database'):
+                pass
+
+        self.assertEqual(list(timer.phases), ['settings', 'database'])
+        self.assertEqual(timer.total, 0.75)
+        self.assertEqual(timer.report(), {
+            'phases': {'settings': 500.0, 'database': 250.0},
+            'total': 750.0,
+        })
+
+    def test_repeated_phase_accumulates(self):
+
+        timer = PhaseTimer()
+        with mock.patch('tubedlapi.util.timing.time.monotonic', side_effect=[0.0, 0.1, 1.0, 1.2]):
+            with timer.phase('prewarm'):
+                pass
+            with timer.phase('prewarm'):
+                pass
+
+        self.assertAlmostEqual(timer.phases['prewarm'], 0.3)
+
+    def test_phase_is_recorded_when_it_raises(self):
+
+        timer = PhaseTimer()
+        with mock.patch('tubedlapi.util.timing.time.monotonic', side_effect=[0.0, 2.0]):
+            with self.assertRaises(RuntimeError):
+                with timer.phase('database'):
+                    raise RuntimeError('no database')
+
+        self.assertEqual(timer.phases['database'], 2.0)
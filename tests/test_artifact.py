@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+
+import os
+import uuid
+
+from common import AppTestCase
+
+
+class ArtifactUploadTest(AppTestCase):
+    ''' Downloads retained for reuse are uploaded under the job's own
+        name, whether they were fetched fresh or reused.
+    '''
+
+    def setUp(self) -> None:
+
+        super().setUp()
+
+        from flask import json
+
+        from tubedlapi.model.destination import Destination
+        from tubedlapi.model.profile import Profile
+
+        self.uploads = os.path.join(self.workdir, 'uploads')
+        os.makedirs(self.uploads)
+
+        suffix = uuid.uuid4().hex
+        self.profile = Profile.create(
+            name=f'test-{suffix}',
+            options=json.dumps({'quiet': True}).encode('utf-8'),
+        )
+        self.destination = Destination.create(
+            name=f'test-{suffix}',
+            url=f'osfs://{self.uploads}',
+        )
+
+    def tearDown(self) -> None:
+
+        self.destination.delete_instance()
+        self.profile.delete_instance()
+        super().tearDown()
+
+    def make_job(self):
+
+        from tubedlapi.model.job import Job
+
+        return Job.create(
+            status='queued',
+            meta={
+                'url': 'https://example.com/video',
+                'profile': self.profile.name,
+                'destinations': [self.destination.name],
+            },
+        )
+
+    def upload(self, job) -> dict:
+
+        from tubedlapi.exec.uploader import upload_file
+
+        return upload_file(job).result(timeout=30)
+
+    def test_fresh_and_reused_downloads_upload(self):
+
+        from tubedlapi.exec import stage
+        from tubedlapi.exec.youtubedl import JobPostProcessor
+        from tubedlapi.model.artifact import Artifact
+
+        source_key = uuid.uuid4().hex
+        video_id = uuid.uuid4().hex
+        content = os.urandom(4096)
+
+        # A fresh download, as youtube-dl leaves it in the working directory
+        fresh = self.make_job()
+        with open(f'{fresh.id}.mp4', 'wb') as f:
+            f.write(content)
+
+        processor = JobPostProcessor(fresh, format_key='format', source_key=source_key)
+        processor.run({
+            'extractor_key': 'Test',
+            'id': video_id,
+            'filepath': f'{fresh.id}.mp4',
+        })
+
+        downloaded = fresh.meta_dict['info']['downloaded']
+        self.assertEqual(downloaded['filename'], f'{fresh.id}.mp4')
+        self.assertEqual(downloaded['path'], os.path.abspath(f'{fresh.id}.mp4'))
+
+        results = self.upload(fresh)
+        self.assertNotIn('error', results[self.destination.name])
+        with open(os.path.join(self.uploads, f'{fresh.id}.mp4'), 'rb') as f:
+            self.assertEqual(f.read(), content)
+
+        # The stored info points at the retained file by absolute path
+        artifact = Artifact.find_source(source_key)
+        self.assertEqual(artifact.info['downloaded']['path'], artifact.filename)
+        self.assertTrue(os.path.isabs(artifact.filename))
+
+        # A reusing job is uploaded under its own name, from any directory
+        reused = self.make_job()
+        os.makedirs('elsewhere')
+        os.chdir('elsewhere')
+        stage.job_reuse_artifact(reused, artifact)
+
+        results = self.upload(reused)
+        self.assertNotIn('error', results[self.destination.name])
+        with open(os.path.join(self.uploads, f'{reused.id}.mp4'), 'rb') as f:
+            self.assertEqual(f.read(), content)
+
+
+class ArtifactHostTest(AppTestCase):
+    ''' Hosts sharing a database only use, and only forget,
+        artifacts they downloaded themselves.
+    '''
+
+    def record(self, video_id: str, content: bytes):
+
+        from tubedlapi.model.artifact import Artifact
+
+        filename = f'{uuid.uuid4().hex}.mp4'
+        with open(filename, 'wb') as f:
+            f.write(content)
+
+        return Artifact.record(
+            extractor='Test',
+            video_id=video_id,
+            format_key='format',
+            source_key=video_id,
+            filename=filename,
+            info={},
+        )
+
+    def test_other_hosts_artifacts_are_kept(self):
+
+        from unittest import mock
+
+        from tubedlapi.model.artifact import Artifact
+
+        video_id = uuid.uuid4().hex
+        with mock.patch('tubedlapi.model.artifact.local_host', return_value='host-a'):
+            artifact = self.record(video_id, b'a')
+
+        # The file is not on this host's disk, but it is not forgotten
+        os.remove(artifact.filename)
+        with mock.patch('tubedlapi.model.artifact.local_host', return_value='host-b'):
+            self.assertIsNone(Artifact.find('Test', video_id, 'format'))
+            self.assertIsNone(Artifact.find_source(video_id))
+            self.assertFalse(artifact.usable())
+
+            # This host keeps its own copy of the same video
+            own = self.record(video_id, b'b')
+            self.assertEqual(own.host, 'host-b')
+            self.assertEqual(Artifact.find('Test', video_id, 'format'), own)
+
+        self.assertTrue(Artifact.select().where(Artifact.id == artifact.id).exists())
+
+        # Its own host does forget it
+        with mock.patch('tubedlapi.model.artifact.local_host', return_value='host-a'):
+            self.assertIsNone(Artifact.find('Test', video_id, 'format'))
+
+        self.assertFalse(Artifact.select().where(Artifact.id == artifact.id).exists())
+
+
+class ArtifactSweepTest(AppTestCase):
+    ''' Retained files are forgotten by age, then by size, least
+        recently used first.
+    '''
+
+    def setUp(self) -> None:
+
+        super().setUp()
+
+        from unittest import mock
+
+        # Artifacts of other tests belong to other hosts
+        patcher = mock.patch(
+            'tubedlapi.model.artifact.local_host',
+            return_value=f'host-{uuid.uuid4().hex}',
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def record(self, size: int, idle: float, filename: str=None):
+
+        from datetime import (
+            datetime,
+            timedelta,
+        )
+
+        from tubedlapi.model.artifact import (
+            Artifact,
+            local_host,
+        )
+
+        video_id = uuid.uuid4().hex
+        if filename is None:
+            filename = os.path.abspath(f'{video_id}.mp4')
+            with open(filename, 'wb') as f:
+                f.write(os.urandom(size))
+
+        return Artifact.create(
+            host=local_host(),
+            extractor='Test',
+            video_id=video_id,
+            format_key='format',
+            source_key=video_id,
+            sha256=video_id,
+            size=size,
+            filename=filename,
+            info={},
+            last_used_at=datetime.now() - timedelta(seconds=idle),
+        )
+
+    def remaining(self) -> set:
+
+        from tubedlapi.model.artifact import (
+            Artifact,
+            local_host,
+        )
+
+        return {artifact.id for artifact in Artifact.select().where(Artifact.host == local_host())}
+
+    def test_old_artifacts_are_forgotten(self):
+
+        from tubedlapi.model.artifact import Artifact
+
+        fresh = self.record(10, idle=10)
+        old = self.record(10, idle=1000)
+
+        removed = Artifact.sweep(max_age=100)
+
+        self.assertEqual(removed, [old.filename])
+        self.assertFalse(os.path.exists(old.filename))
+        self.assertTrue(os.path.exists(fresh.filename))
+        self.assertEqual(self.remaining(), {fresh.id})
+
+    def test_least_recently_used_are_forgotten_for_size(self):
+
+        from tubedlapi.model.artifact import Artifact
+
+        newest = self.record(40, idle=10)
+        newer = self.record(40, idle=20)
+        oldest = self.record(40, idle=30)
+        recent = self.record(40, idle=1)
+
+        removed = Artifact.sweep(max_size=100, min_idle=5)
+
+        # The recently used artifact is kept even though it is over size
+        self.assertEqual(sorted(removed), sorted([newer.filename, oldest.filename]))
+        self.assertEqual(self.remaining(), {recent.id, newest.id})
+
+    def test_shared_files_are_kept_while_used(self):
+
+        from tubedlapi.model.artifact import Artifact
+
+        used = self.record(50, idle=10)
+        self.record(50, idle=1000, filename=used.filename)
+
+        removed = Artifact.sweep(max_age=100, max_size=60)
+
+        self.assertEqual(removed, [])
+        self.assertTrue(os.path.exists(used.filename))
+        self.assertEqual(self.remaining(), {used.id})
+
+        # A second artifact of the same file takes no more space
+        again = self.record(50, idle=20, filename=used.filename)
+        self.assertEqual(Artifact.sweep(max_size=60), [])
+        self.assertEqual(self.remaining(), {used.id, again.id})
+
+    def test_retention_sweeps_once_per_interval(self):
+
+        from unittest import mock
+
+        from tubedlapi.util.retention import ArtifactRetention
+
+        retention = ArtifactRetention(max_age=100, interval=60)
+        with mock.patch('tubedlapi.model.artifact.Artifact.sweep', return_value=[]) as sweep:
+            retention.sweep()
+            retention.sweep()
+
+        sweep.assert_called_once_with(100, 0, min_idle=60)
+
+        # Without limits, nothing is swept
+        with mock.patch('tubedlapi.model.artifact.Artifact.sweep') as sweep:
+            ArtifactRetention().sweep()
+
+        sweep.assert_not_called()
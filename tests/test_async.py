@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import unittest
+from concurrent.futures import Future
+
+from tubedlapi.util.async import (
+    STAGE_FETCH,
+    STAGE_UPLOAD,
+    JobExecutor,
+    StagePool,
+    gather_futures,
+)
+
+
+def wait_for(event: threading.Event, started: threading.Event=None) -> str:
+
+    if started is not None:
+        started.set()
+
+    event.wait(timeout=10)
+    return 'done'
+
+
+def fail() -> None:
+
+    raise OSError('connection reset')
+
+
+class StagePoolTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+
+        self.pool = StagePool('test', 1)
+        self.addCleanup(self.pool.shutdown)
+
+    def test_tasks_beyond_bound_are_queued(self):
+
+        hold = threading.Event()
+        started = threading.Event()
+
+        first = self.pool.submit(wait_for, hold, started)
+        second = self.pool.submit(wait_for, hold)
+        started.wait(timeout=10)
+
+        self.assertEqual(self.pool.stats(), {
+            'max_workers': 1,
+            'queued': 1,
+            'active': 1,
+            'completed': 0,
+            'failed': 0,
+            'utilization': 1.0,
+        })
+
+        hold.set()
+        self.assertEqual((first.result(timeout=10), second.result(timeout=10)),
+                         ('done', 'done'))
+
+        stats = self.pool.stats()
+        self.assertEqual((stats['queued'], stats['active'], stats['completed']), (0, 0, 2))
+
+    def test_failures_and_cancellations_are_counted(self):
+
+        hold = threading.Event()
+        started = threading.Event()
+        self.addCleanup(hold.set)
+
+        failed = self.pool.submit(fail)
+        with self.assertRaises(OSError):
+            failed.result(timeout=10)
+
+        running = self.pool.submit(wait_for, hold, started)
+        cancelled = self.pool.submit(wait_for, hold)
+        started.wait(timeout=10)
+        self.assertTrue(cancelled.cancel())
+
+        stats = self.pool.stats()
+        self.assertEqual((stats['failed'], stats['completed'], stats['queued']), (1, 1, 0))
+
+        hold.set()
+        running.result(timeout=10)
+
+    def test_tasks_run_in_task_context(self):
+
+        entered = []
+
+        class Scope(object):
+
+            def __enter__(self):
+                entered.append(threading.current_thread().name)
+
+            def __exit__(self, *exc):
+                entered.append('exit')
+
+        pool = StagePool('scoped', 1, task_context=Scope)
+        self.addCleanup(pool.shutdown)
+        pool.submit(fail).exception(timeout=10)
+
+        self.assertTrue(entered[0].startswith('tubedlapi-scoped'))
+        self.assertEqual(entered[1], 'exit')
+
+
+class JobExecutorTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+
+        self.executor = JobExecutor(limits={STAGE_FETCH: 1, STAGE_UPLOAD: 2})
+        for pool in self.executor.pools.values():
+            self.addCleanup(pool.shutdown)
+
+    def test_busy_stage_does_not_starve_another(self):
+
+        hold = threading.Event()
+        self.addCleanup(hold.set)
+
+        fetch = self.executor.execute_stage(STAGE_FETCH, wait_for, hold)
+        queued = self.executor.execute_stage(STAGE_FETCH, wait_for, hold)
+        upload = self.executor.execute_stage(STAGE_UPLOAD, lambda: 'uploaded')
+
+        self.assertEqual(upload.result(timeout=10), 'uploaded')
+        self.assertFalse(queued.done())
+
+        hold.set()
+        self.assertEqual((fetch.result(timeout=10), queued.result(timeout=10)),
+                         ('done', 'done'))
+
+    def test_stats_per_stage(self):
+
+        stats = self.executor.stats()
+
+        self.assertEqual(stats[STAGE_FETCH]['max_workers'], 1)
+        self.assertEqual(stats[STAGE_UPLOAD]['max_workers'], 2)
+        self.assertIn('scheduler', stats[STAGE_FETCH])
+        self.assertNotIn('scheduler', stats[STAGE_UPLOAD])
+
+
+class GatherFuturesTest(unittest.TestCase):
+
+    def test_resolves_once_all_are_done(self):
+
+        futs = [Future(), Future()]
+        gathered = gather_futures(futs, lambda done: [fut.result() for fut in done])
+
+        futs[1].set_result('b')
+        self.assertFalse(gathered.done())
+
+        futs[0].set_result('a')
+        self.assertEqual(gathered.result(timeout=0), ['a', 'b'])
+
+    def test_error_propagates(self):
+
+        futs = [Future(), Future()]
+        gathered = gather_futures(futs, lambda done: [fut.result() for fut in done])
+
+        futs[0].set_exception(OSError('connection reset'))
+        futs[1].set_result('b')
+
+        with self.assertRaisesRegex(OSError, 'connection reset'):
+            gathered.result(timeout=0)
+
+    def test_combine_error_propagates(self):
+
+        fut = Future()
+        fut.set_result(None)
+
+        gathered = gather_futures([fut], lambda done: 1 / 0)
+
+        self.assertIsInstance(gathered.exception(timeout=0), ZeroDivisionError)
+
+    def test_no_futures(self):
+
+        self.assertEqual(gather_futures([], len).result(timeout=0), 0)
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+import json
+import uuid
+from unittest import mock
+
+from common import AppTestCase
+
+
+class CreateManyTest(AppTestCase):
+
+    def test_creates_jobs_in_chunks(self):
+
+        from tubedlapi.model.job import Job
+
+        parent = Job.create(status='expanded', meta={'url': 'https://example.com/list'})
+        metas = [{'url': f'https://example.com/{index}'} for index in range(5)]
+
+        jobs = Job.create_many(metas, parent=parent, priorities=[0, 10, 0, -10, 0], chunk_size=2)
+
+        self.assertEqual([job.meta for job in jobs], metas)
+        for job in jobs:
+            self.assertFalse(job._dirty)
+
+        stored = {job.id: job for job in Job.select().where(Job.parent == parent.id)}
+        self.assertEqual(set(stored), {job.id for job in jobs})
+        for job in jobs:
+            self.assertEqual(stored[job.id].meta, job.meta)
+            self.assertEqual(stored[job.id].priority, job.priority)
+            self.assertEqual(stored[job.id].status, 'queued')
+
+        self.assertEqual([job.priority for job in jobs], [0, 10, 0, -10, 0])
+
+    def test_empty(self):
+
+        from tubedlapi.model.job import Job
+
+        self.assertEqual(Job.create_many([]), [])
+
+
+class BatchRouteTest(AppTestCase):
+
+    def setUp(self) -> None:
+
+        super().setUp()
+
+        from tubedlapi.model.profile import Profile
+
+        self.profile = Profile.create(name=f'test-{uuid.uuid4().hex}', options=b'{}')
+        self.addCleanup(self.profile.delete_instance)
+
+        patcher = mock.patch('tubedlapi.exec.stage.job_submit_many')
+        self.submit_many = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, payload) -> tuple:
+
+        client = self.app.test_client()
+        response = client.post(
+            '/jobs/batch',
+            data=json.dumps(payload),
+            content_type='application/json',
+            headers={'X-Client-Id': 'batch-test'},
+        )
+
+        return response.status_code, json.loads(response.get_data(as_text=True))
+
+    def test_creates_valid_jobs(self):
+
+        from tubedlapi.model.job import Job
+        from tubedlapi.util.scheduler import (
+            PRIORITY_HIGH,
+            PRIORITY_LOW,
+        )
+
+        status, data = self.post([
+            {'url': 'https://example.com/a', 'profile': self.profile.name},
+            {'url': 'https://example.com/b'},
+            {'url': 'https://example.com/c', 'profile': 'missing'},
+            {'url': 'https://example.com/d', 'profile': self.profile.name, 'priority': 'high'},
+            {'url': 'https://example.com/e', 'profile': self.profile.name, 'priority': 'soon'},
+            'https://example.com/f',
+        ])
+
+        self.assertEqual(status, 200)
+        self.assertEqual((data['created'], data['failed']), (2, 4))
+        self.assertEqual([result['index'] for result in data['jobs']], list(range(6)))
+        self.assertEqual([('id' in result) for result in data['jobs']],
+                         [True, False, False, True, False, False])
+        self.assertEqual(data['jobs'][2]['error'], 'profile not found: missing')
+
+        created = [Job.get(id=data['jobs'][index]['id']) for index in (0, 3)]
+        self.assertEqual([job.priority for job in created], [PRIORITY_LOW, PRIORITY_HIGH])
+        self.assertEqual(created[0].meta['url'], 'https://example.com/a')
+        self.assertEqual(created[0].meta['client'], 'batch-test')
+
+        # Every created job is handed to the pipeline in one call
+        self.assertEqual(self.submit_many.call_count, 1)
+        submitted = self.submit_many.call_args[0][0]
+        self.assertEqual([job.id for job, _ in submitted], [job.id for job in created])
+        self.assertEqual({profile.id for _, profile in submitted}, {self.profile.id})
+
+    def test_rejects_malformed_batch(self):
+
+        status, _ = self.post({'url': 'https://example.com/a'})
+        self.assertEqual(status, 400)
+
+        with mock.patch('tubedlapi.routes.job.BATCH_SIZE_MAX', 1):
+            status, _ = self.post([
+                {'url': 'https://example.com/a', 'profile': self.profile.name},
+                {'url': 'https://example.com/b', 'profile': self.profile.name},
+            ])
+        self.assertEqual(status, 400)
+
+        self.submit_many.assert_not_called()
+
+    def test_rejects_profile_which_is_not_a_name(self):
+
+        status, data = self.post([
+            {'url': 'https://example.com/a', 'profile': {'name': self.profile.name}},
+            {'url': 'https://example.com/b', 'profile': [self.profile.name]},
+            {'url': 'https://example.com/c', 'profile': self.profile.name},
+        ])
+
+        self.assertEqual(status, 200)
+        self.assertEqual((data['created'], data['failed']), (1, 2))
+        self.assertEqual([result.get('error') for result in data['jobs'][:2]],
+                         ['`profile` must be a string'] * 2)
+        self.assertIn('id', data['jobs'][2])
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+import uuid
+from concurrent.futures import Future
+
+from common import AppTestCase
+
+from tubedlapi.util.cancel import (
+    CancelRegistry,
+    JobCancelled,
+)
+
+
+class CancelRegistryTest(unittest.TestCase):
+
+    def test_cancel_flags_and_notifies(self):
+
+        cancels = CancelRegistry()
+        notified = []
+        cancels.add_listener(notified.append)
+
+        cancels.check('a')
+        cancels.cancel('a')
+        cancels.cancel('a')
+
+        self.assertTrue(cancels.is_cancelled('a'))
+        self.assertFalse(cancels.is_cancelled('b'))
+        self.assertRaises(JobCancelled, cancels.check, 'a')
+        self.assertEqual(notified, ['a'])
+        self.assertEqual(cancels.stats()['cancelled'], 1)
+
+        cancels.discard('a')
+        self.assertFalse(cancels.is_cancelled('a'))
+
+    def test_failing_listener_is_skipped(self):
+
+        def fail(job_id) -> None:
+
+            raise RuntimeError('listener failed')
+
+        cancels = CancelRegistry()
+        notified = []
+        cancels.add_listener(fail)
+        cancels.add_listener(notified.append)
+
+        cancels.cancel('a')
+
+        self.assertEqual(notified, ['a'])
+
+    def test_lookup_is_throttled(self):
+
+        cancelled = set()
+        lookups = []
+
+        def lookup(job_id) -> bool:
+
+            lookups.append(job_id)
+            return job_id in cancelled
+
+        cancels = CancelRegistry(lookup=lookup, lookup_interval=0.2)
+
+        self.assertFalse(cancels.is_cancelled('a'))
+        cancelled.add('a')
+        self.assertFalse(cancels.is_cancelled('a'))
+        self.assertEqual(lookups, ['a'])
+
+        time.sleep(0.25)
+        self.assertRaises(JobCancelled, cancels.check, 'a')
+        self.assertEqual(lookups, ['a', 'a'])
+
+        # Flagged now, so no more lookups
+        self.assertTrue(cancels.is_cancelled('a'))
+        self.assertEqual(lookups, ['a', 'a'])
+
+    def test_fresh_lookup(self):
+
+        cancelled = set()
+        cancels = CancelRegistry(lookup=lambda job_id: job_id in cancelled, lookup_interval=60.0)
+        notified = []
+        cancels.add_listener(notified.append)
+
+        self.assertFalse(cancels.is_cancelled('a'))
+        cancelled.add('a')
+        self.assertFalse(cancels.is_cancelled('a'))
+        self.assertTrue(cancels.is_cancelled('a', fresh=True))
+        self.assertEqual(notified, ['a'])
+
+
+class JobCancelTest(AppTestCase):
+
+    def make_job(self, status: str='queued', parent=None):
+
+        from tubedlapi.model.job import Job
+
+        return Job.create(
+            status=status,
+            meta={'url': 'https://example.com/video'},
+            parent=parent,
+        )
+
+    def test_cancel_descendants(self):
+
+        from tubedlapi.model.job import Job
+
+        parent = self.make_job(status='expanded')
+        running = self.make_job(status='downloading', parent=parent)
+        done = self.make_job(status='completed', parent=parent)
+
+        cancelled = Job.cancel(parent.id)
+
+        self.assertEqual(cancelled, {parent.id: 'expanded', running.id: 'downloading'})
+        self.assertEqual(Job.get(id=done.id).status, 'completed')
+        self.assertEqual(Job.cancel(parent.id), {})
+
+    def test_status_change_keeps_cancelled(self):
+
+        from tubedlapi.model.job import Job
+
+        job = self.make_job(status='downloading')
+
+        # Cancelled through another process, while this one still runs the job
+        Job.cancel(job.id)
+
+        job.status = 'completed'
+        job.meta_update(result={'dest': {'result': {}}})
+        job.save()
+
+        self.assertEqual(job.status, 'cancelled')
+        stored = Job.get(id=job.id)
+        self.assertEqual(stored.status, 'cancelled')
+        self.assertEqual(stored.result, {'dest': {'result': {}}})
+
+    def test_stage_callback_finds_cancellation_in_database(self):
+
+        from tubedlapi.exec import stage
+        from tubedlapi.model.job import Job
+
+        job = self.make_job(status='uploading')
+        Job.cancel(job.id)
+
+        done = Future()
+        fut = Future()
+        fut.set_result({})
+        stage.job_stage_callback(job, stage.STAGE_UPLOADING, done, fut)
+
+        self.assertEqual(done.result(timeout=5), 'cancelled')
+        self.assertEqual(Job.get(id=job.id).status, 'cancelled')
+
+    def test_cancel_route(self):
+
+        client = self.app.test_client()
+        job = self.make_job(status='downloading')
+
+        response = client.delete(f'/jobs/{job.id}')
+        self.assertEqual(response.status_code, 200)
+
+        response = client.delete(f'/jobs/{job.id}')
+        self.assertEqual(response.status_code, 409)
+
+        response = client.delete(f'/jobs/{uuid.uuid4()}')
+        self.assertEqual(response.status_code, 404)
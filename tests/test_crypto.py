@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+import base64
+import os
+import unittest
+from unittest import mock
+
+from tubedlapi.util import crypto
+from tubedlapi.util.crypto import (
+    CryptoProvider,
+    Keyring,
+)
+
+SECRET = b'secret'
+ITERATIONS = 1000
+
+
+class KeyringTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+
+        patcher = mock.patch.object(crypto, 'make_kdf', wraps=crypto.make_kdf)
+        self.make_kdf = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_derives_each_key_once(self):
+
+        keyring = Keyring()
+        salt = os.urandom(16)
+
+        key = keyring.derive(SECRET, salt, iterations=ITERATIONS)
+
+        self.assertEqual(len(key), 32)
+        self.assertIs(keyring.derive(SECRET, salt, iterations=ITERATIONS), key)
+        self.assertEqual(self.make_kdf.call_count, 1)
+
+        # Any other secret, salt or iteration count is another key
+        other = [
+            keyring.derive(b'other', salt, iterations=ITERATIONS),
+            keyring.derive(SECRET, os.urandom(16), iterations=ITERATIONS),
+            keyring.derive(SECRET, salt, iterations=ITERATIONS + 1),
+        ]
+        self.assertNotIn(key, other)
+        self.assertEqual(len(keyring), 4)
+        self.assertEqual(self.make_kdf.call_count, 4)
+
+    def test_clear_forgets_keys(self):
+
+        keyring = Keyring()
+        salt = os.urandom(16)
+
+        key = keyring.derive(SECRET, salt, iterations=ITERATIONS)
+        keyring.clear()
+
+        self.assertEqual(len(keyring), 0)
+        self.assertEqual(keyring.derive(SECRET, salt, iterations=ITERATIONS), key)
+        self.assertEqual(self.make_kdf.call_count, 2)
+
+    def test_providers_share_keyring(self):
+
+        keyring = Keyring()
+        salt = os.urandom(16)
+
+        first = CryptoProvider(SECRET, iterations=ITERATIONS, salt=salt, keyring=keyring)
+        second = CryptoProvider(SECRET, iterations=ITERATIONS, salt=salt, keyring=keyring)
+
+        self.assertEqual(self.make_kdf.call_count, 1)
+        message = first.encrypt_blob(b'blob')
+        self.assertEqual(second.decrypt_message(message), b'blob')
+
+
+class SaltRotationTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+
+        self.keyring = Keyring()
+        self.old_salt = os.urandom(16)
+        self.new_salt = os.urandom(16)
+
+    def provider(self, salt: bytes, previous_salts=None) -> CryptoProvider:
+
+        return CryptoProvider(
+            SECRET,
+            iterations=ITERATIONS,
+            salt=salt,
+            previous_salts=previous_salts,
+            keyring=self.keyring,
+        )
+
+    def test_previous_salts_decrypt_old_messages(self):
+
+        old = self.provider(self.old_salt)
+        message = old.encrypt_blob(b'written before rotation')
+
+        rotated = self.provider(self.new_salt, previous_salts=[self.old_salt])
+
+        self.assertEqual(rotated.decrypt_message(message), b'written before rotation')
+
+        # New messages are written with the current salt
+        salt = CryptoProvider.extract_salt_from_message(rotated.encrypt_blob(b'blob'))
+        self.assertEqual(base64.b64decode(salt), self.new_salt)
+
+    def test_unknown_salt_is_rejected(self):
+
+        message = self.provider(self.old_salt).encrypt_blob(b'blob')
+
+        self.assertRaises(ValueError, self.provider(self.new_salt).decrypt_message, message)
+
+    def test_current_salt_in_previous_salts_is_skipped(self):
+
+        provider = self.provider(self.new_salt, previous_salts=[self.new_salt, self.old_salt])
+
+        self.assertEqual([salt for salt, _ in provider.keys], [self.new_salt, self.old_salt])
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+import os
+import tempfile
+import threading
+import unittest
+
+import peewee
+
+from tubedlapi import model
+
+
+class InMemoryDatabaseTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+
+        # Restored afterwards, for tests sharing the application database
+        self.previous = (model.database_proxy.obj, model.database_migrator)
+
+    def tearDown(self) -> None:
+
+        model.close_connection()
+        database, model.database_migrator = self.previous
+        if database is not None:
+            model.database_proxy.initialize(database)
+
+    def test_default_uri_is_in_memory(self):
+
+        from tubedlapi.components.settings import Settings
+
+        database = model.init_database_from_uri(Settings.DATABASE_URI)
+
+        files = [row[2] for row in database.execute_sql('PRAGMA database_list').fetchall()]
+        self.assertEqual(files, [''])
+
+    def test_shared_between_threads(self):
+
+        database = model.init_database_from_uri('sqlite:///:memory:')
+        database.execute_sql('CREATE TABLE shared (value INTEGER)')
+        database.execute_sql('INSERT INTO shared VALUES (1)')
+        model.close_connection()
+
+        values = []
+
+        def read() -> None:
+
+            values.extend(database.execute_sql('SELECT value FROM shared').fetchall())
+            model.close_connection()
+
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join()
+
+        self.assertEqual(values, [(1,)])
+
+
+class SchemaUpgradeTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+
+        self.previous = (model.database_proxy.obj, model.database_migrator)
+
+    def tearDown(self) -> None:
+
+        model.close_connection()
+        database, model.database_migrator = self.previous
+        if database is not None:
+            model.database_proxy.initialize(database)
+
+    def test_artifact_table_gains_host(self):
+
+        path = os.path.join(tempfile.mkdtemp(prefix='tubedlapi-test-'), 'old.db')
+        old = peewee.SqliteDatabase(path)
+        old.execute_sql(
+            'CREATE TABLE artifact (id INTEGER PRIMARY KEY, extractor TEXT, video_id TEXT, '
+            'format_key TEXT, source_key TEXT, sha256 TEXT, size INTEGER, filename TEXT, '
+            'info BLOB, created_at DATETIME, last_used_at DATETIME)',
+        )
+        old.execute_sql(
+            'CREATE UNIQUE INDEX artifact_extractor_video_id_format_key '
+            'ON artifact (extractor, video_id, format_key)',
+        )
+        old.execute_sql(
+            "INSERT INTO artifact (extractor, video_id, format_key, source_key, sha256, size, "
+            "filename) VALUES ('Test', 'video', 'format', 'source', 'sha', 1, '/video.mp4')",
+        )
+        old.close()
+
+        from tubedlapi.model.artifact import local_host
+
+        database = model.init_database_from_uri(f'sqlite:///{path}')
+
+        indexes = {index.name: index for index in database.get_indexes('artifact')}
+        self.assertNotIn('artifact_extractor_video_id_format_key', indexes)
+        self.assertEqual(
+            indexes['artifact_host_extractor_video_id_format_key'].columns,
+            ['host', 'extractor', 'video_id', 'format_key'],
+        )
+
+        # Existing artifacts were downloaded by this host
+        hosts = database.execute_sql('SELECT host FROM artifact').fetchall()
+        self.assertEqual(hosts, [(local_host(),)])
+
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from tubedlapi.util.dlpool import YoutubeDLPool
+
+
+class FakeYoutubeDL(object):
+
+    def __init__(self, params: dict) -> None:
+
+        self.params = params
+        self._pps = []
+        self._progress_hooks = []
+
+    def __exit__(self, *args) -> None:
+        pass
+
+
+class YoutubeDLPoolTest(unittest.TestCase):
+
+    def test_prewarmed_instances_are_reused(self):
+
+        pool = YoutubeDLPool(max_idle=2, factory=FakeYoutubeDL)
+
+        self.assertEqual(pool.prewarm('profile', 'v1', {'quiet': True}, count=3), 2)
+        self.assertEqual(pool.prewarm('profile', 'v1', {'quiet': True}, count=3), 0)
+
+        with pool.checkout('profile', 'v1', {'quiet': True}) as dl:
+            self.assertEqual(dl.params, {'quiet': True})
+
+        self.assertEqual(pool.stats(), {'created': 2, 'reused': 1, 'idle': {'profile': 2}})
+
+    def test_prewarm_replaces_old_version(self):
+
+        pool = YoutubeDLPool(max_idle=2, factory=FakeYoutubeDL)
+        pool.prewarm('profile', 'v1', {'format': 'best'})
+
+        self.assertEqual(pool.prewarm('profile', 'v2', {'format': 'worst'}), 1)
+
+        with pool.checkout('profile', 'v2', {'format': 'worst'}) as dl:
+            self.assertEqual(dl.params, {'format': 'worst'})
+
+        self.assertEqual(pool.stats()['reused'], 1)
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import unittest
+from unittest import mock
+
+from flask import json
+
+from common import AppTestCase
+from tubedlapi.util.pubsub import PubSub
+
+
+def parse(chunk: str):
+
+    if chunk.startswith(':'):
+        return chunk.strip()
+
+    name, data = chunk.strip().split('\n')
+    return name[len('event: '):], json.loads(data[len('data: '):])
+
+
+class PubSubTest(unittest.TestCase):
+
+    def test_events_fan_out_to_subscribers(self):
+
+        hub = PubSub()
+        first = hub.subscribe('job')
+        second = hub.subscribe('job')
+        other = hub.subscribe('other')
+
+        self.assertEqual(hub.publish('job', 'event'), 2)
+        self.assertEqual(hub.publish('missing', 'event'), 0)
+
+        self.assertEqual(first.get(timeout=0), 'event')
+        self.assertEqual(second.get(timeout=0), 'event')
+        self.assertIsNone(other.get(timeout=0))
+
+    def test_slow_subscriber_drops_oldest(self):
+
+        hub = PubSub(maxsize=2)
+        subscription = hub.subscribe('job')
+        for event in range(3):
+            hub.publish('job', event)
+
+        self.assertEqual(subscription.dropped, 1)
+        self.assertEqual([subscription.get(timeout=0) for _ in range(3)], [1, 2, None])
+
+    def test_get_waits_for_event(self):
+
+        hub = PubSub()
+        subscription = hub.subscribe('job')
+        timer = threading.Timer(0.05, hub.publish, args=('job', 'event'))
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+        self.assertEqual(subscription.get(timeout=10), 'event')
+
+    def test_closing_removes_topic(self):
+
+        hub = PubSub()
+        with hub.subscribe('job'):
+            with hub.subscribe('job') as subscription:
+                self.assertEqual(hub.stats(), {'topics': 1, 'subscribers': 2})
+
+            # Closing twice is harmless
+            subscription.close()
+            self.assertTrue(hub.has_subscribers('job'))
+
+        self.assertFalse(hub.has_subscribers('job'))
+        self.assertEqual(hub.stats(), {'topics': 0, 'subscribers': 0})
+
+
+class StreamTest(AppTestCase):
+
+    def setUp(self) -> None:
+
+        super().setUp()
+
+        from tubedlapi.app import registry
+        from tubedlapi.components.settings import Settings
+
+        self.hub = registry[PubSub]
+
+        patcher = mock.patch.object(registry[Settings], 'EVENTS_KEEPALIVE_INTERVAL', 0.01)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def open(self, status: str='downloading'):
+
+        from tubedlapi.exec import events
+        from tubedlapi.model.job import Job
+
+        job = Job.create(status=status, meta={'url': 'https://example.com/video'})
+        subscription = events.subscribe(job.id)
+
+        return job, events.stream(subscription, job)
+
+    def test_finished_job_ends_immediately(self):
+
+        job, stream = self.open(status='completed')
+
+        self.assertEqual([parse(chunk)[0] for chunk in stream], ['status', 'end'])
+        self.assertFalse(self.hub.has_subscribers(job.id))
+
+    def test_published_events_are_relayed(self):
+
+        from tubedlapi.exec import events
+
+        from tubedlapi.model.job import Job
+
+        job, stream = self.open()
+        self.assertEqual(parse(next(stream))[1]['status'], 'downloading')
+
+        # The pipeline publishes from its own copy of the job
+        running = Job.get(id=job.id)
+        running.status = 'uploading'
+        self.assertEqual(events.publish_status(running), 1)
+        self.hub.publish(job.id, events.progress_event(running, {'percent': 50}))
+        running.status = 'completed'
+        events.publish_end(running)
+
+        chunks = [parse(chunk) for chunk in stream]
+        self.assertEqual([name for name, _ in chunks], ['status', 'progress', 'end'])
+        self.assertEqual(chunks[0][1]['status'], 'uploading')
+        self.assertEqual(chunks[1][1]['progress'], {'percent': 50})
+        self.assertEqual(chunks[2][1]['status'], 'completed')
+        self.assertFalse(self.hub.has_subscribers(job.id))
+
+    def test_keepalive_while_nothing_changes(self):
+
+        job, stream = self.open()
+        next(stream)
+
+        self.assertEqual(parse(next(stream)), ': keepalive')
+        self.assertEqual(parse(next(stream)), ': keepalive')
+
+        stream.close()
+        self.assertFalse(self.hub.has_subscribers(job.id))
+
+    def test_falls_back_to_database_on_timeout(self):
+
+        from tubedlapi.model.job import Job
+
+        job, stream = self.open()
+        next(stream)
+
+        # Changed by a worker process, whose events never reach this hub
+        Job.update(status='uploading').where(Job.id == job.id).execute()
+        self.assertEqual(parse(next(stream))[1]['status'], 'uploading')
+        self.assertEqual(parse(next(stream)), ': keepalive')
+
+        Job.update(status='failed').where(Job.id == job.id).execute()
+        chunks = [parse(chunk) for chunk in stream]
+        self.assertEqual([(name, data['status']) for name, data in chunks],
+                         [('status', 'failed'), ('end', 'failed')])
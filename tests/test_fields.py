@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+import uuid
+from unittest import mock
+
+from common import AppTestCase
+
+
+class EncryptedBlobFieldTest(AppTestCase):
+
+    def setUp(self) -> None:
+
+        super().setUp()
+
+        from tubedlapi.app import registry
+        from tubedlapi.util.crypto import (
+            CryptoProvider,
+            PlaintextCache,
+        )
+
+        self.crypt = registry[CryptoProvider]
+        self.cache = registry[PlaintextCache]
+        self.cache.clear()
+        self.names = []
+
+    def tearDown(self) -> None:
+
+        from tubedlapi.model.destination import Destination
+
+        Destination.delete().where(Destination.name.in_(self.names)).execute()
+        super().tearDown()
+
+    def make_destination(self, url: str):
+
+        from tubedlapi.model.destination import Destination
+
+        name = f'test-{uuid.uuid4().hex}'
+        self.names.append(name)
+        return Destination.create(name=name, url=url)
+
+    def stored_url(self, destination) -> bytes:
+
+        from tubedlapi.model.destination import Destination
+
+        query = Destination.select(Destination.url).where(Destination.id == destination.id)
+        return query.tuples().get()[0].message
+
+    def test_decrypted_on_first_read(self):
+
+        from tubedlapi.model.destination import Destination
+        from tubedlapi.model.fields import SealedValue
+
+        created = self.make_destination('mem://')
+
+        with mock.patch.object(self.crypt, 'decrypt_message',
+                               wraps=self.crypt.decrypt_message) as decrypt:
+            destination = Destination.get(id=created.id)
+            self.assertIsInstance(destination.__data__['url'], SealedValue)
+            self.assertEqual(decrypt.call_count, 0)
+
+            self.assertEqual(destination.url, 'mem://')
+            self.assertEqual(destination.url, 'mem://')
+            self.assertEqual(decrypt.call_count, 1)
+
+            # Cached by ciphertext for the next row read
+            self.assertEqual(Destination.get(id=created.id).url, 'mem://')
+            self.assertEqual(decrypt.call_count, 1)
+
+    def test_unread_value_saved_as_is(self):
+
+        from tubedlapi.model.destination import Destination
+
+        created = self.make_destination('mem://')
+        message = self.stored_url(created)
+
+        with mock.patch.object(self.crypt, 'encrypt_blob',
+                               wraps=self.crypt.encrypt_blob) as encrypt:
+            destination = Destination.get(id=created.id)
+            destination.name = f'{destination.name}-renamed'
+            self.names.append(destination.name)
+            destination.save()
+
+            self.assertEqual(encrypt.call_count, 0)
+
+        self.assertEqual(self.stored_url(created), message)
+
+    def test_unseal_rows_decrypts_each_message_once(self):
+
+        from tubedlapi.model.destination import Destination
+        from tubedlapi.model.fields import (
+            SealedValue,
+            unseal_rows,
+        )
+
+        first = self.make_destination('mem://first')
+        second = self.make_destination('mem://second')
+        # Another row with the very same ciphertext
+        copy = self.make_destination('mem://')
+        sealed = SealedValue(self.stored_url(first))
+        Destination.update(url=sealed).where(Destination.id == copy.id).execute()
+        self.cache.clear()
+
+        ids = [first.id, second.id, copy.id]
+        with mock.patch.object(self.crypt, 'decrypt_message',
+                               wraps=self.crypt.decrypt_message) as decrypt:
+            rows = unseal_rows(
+                Destination.select().where(Destination.id.in_(ids)).order_by(Destination.id),
+                Destination.url,
+            )
+
+            urls = [row.url for row in rows]
+            self.assertEqual(urls, ['mem://first', 'mem://second', 'mem://first'])
+            self.assertEqual(decrypt.call_count, 2)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import unittest
+from concurrent.futures import (
+    Future,
+    ThreadPoolExecutor,
+)
+
+from tubedlapi.util.fspool import FSPool
+
+
+def write(handle, name: str, hold: threading.Event=None) -> str:
+
+    if hold is not None:
+        hold.wait(timeout=10)
+
+    handle.touch(name)
+    return name
+
+
+class FSPoolTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+
+        self.pool = FSPool(max_connections=1)
+        self.executor = ThreadPoolExecutor(max_workers=2)
+
+    def tearDown(self) -> None:
+
+        self.executor.shutdown()
+        self.pool.close()
+
+    def test_handles_are_reused(self):
+
+        with self.pool.connection('dest', 'mem://') as first:
+            pass
+        with self.pool.connection('dest', 'mem://') as second:
+            pass
+
+        self.assertIs(first, second)
+        self.assertEqual(self.pool.stats()['dest'], {
+            'idle': 1,
+            'in_use': 0,
+            'opened': 1,
+            'waiting': 0,
+        })
+
+    def test_busy_destination_does_not_hold_threads(self):
+
+        hold = threading.Event()
+        first = self.pool.submit('busy', 'mem://', self.executor.submit, write, 'first', hold)
+        queued = self.pool.submit('busy', 'mem://', self.executor.submit, write, 'queued')
+
+        self.assertEqual(self.pool.stats()['busy']['waiting'], 1)
+
+        # The second executor thread is free for other destinations
+        other = self.pool.submit('other', 'mem://', self.executor.submit, write, 'other')
+        self.assertEqual(other.result(timeout=10), 'other')
+        self.assertFalse(queued.done())
+
+        hold.set()
+        self.assertEqual(first.result(timeout=10), 'first')
+        self.assertEqual(queued.result(timeout=10), 'queued')
+        self.assertEqual(self.pool.stats()['busy']['opened'], 1)
+
+    def test_url_change_keeps_the_cap(self):
+
+        hold = threading.Event()
+        old = self.pool.submit('dest', 'mem://', self.executor.submit, write, 'old', hold)
+        new = self.pool.submit('dest', 'mem://?new', self.executor.submit, write, 'new')
+
+        self.assertEqual(self.pool.stats()['dest']['waiting'], 1)
+        self.assertFalse(new.done())
+
+        hold.set()
+        old.result(timeout=10)
+        new.result(timeout=10)
+
+        # The handle for the old url was closed rather than kept
+        stats = self.pool.stats()['dest']
+        self.assertEqual(stats['opened'], 2)
+        self.assertEqual(stats['idle'], 1)
+
+    def test_cancelled_call_frees_its_slot(self):
+
+        submitted = []
+
+        def submit(func) -> Future:
+
+            submitted.append(Future())
+            return submitted[-1]
+
+        result = self.pool.submit('dest', 'mem://', submit, write, 'cancelled')
+        submitted[0].cancel()
+
+        self.assertTrue(result.cancelled())
+        with self.pool.connection('dest', 'mem://'):
+            pass
+
+    def test_failed_call_discards_its_handle(self):
+
+        def fail(handle) -> None:
+
+            raise OSError('connection reset')
+
+        result = self.pool.submit('dest', 'mem://', self.executor.submit, fail)
+
+        with self.assertRaises(OSError):
+            result.result(timeout=10)
+
+        self.assertEqual(self.pool.stats()['dest']['idle'], 0)
+
+    def test_discard_closes_idle_handles(self):
+
+        with self.pool.connection('dest', 'mem://') as handle:
+            pass
+
+        self.pool.discard('dest')
+
+        self.assertTrue(handle.isclosed())
+        self.assertEqual(self.pool.stats()['dest']['idle'], 0)
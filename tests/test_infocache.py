@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from tubedlapi.util.infocache import (
+    DiskInfoCache,
+    InfoCache,
+    MemoryInfoCache,
+    normalize_url,
+)
+
+
+class NormalizeUrlTest(unittest.TestCase):
+
+    def test_normalizes_url(self):
+
+        self.assertEqual(
+            normalize_url(' HTTPS://Example.COM/Watch?v=abc&list=x#t=10 '),
+            'https://example.com/Watch?list=x&v=abc',
+        )
+        self.assertEqual(normalize_url('https://example.com/?b=&a=1'),
+                         'https://example.com/?a=1&b=')
+
+    def test_key_of_equivalent_urls(self):
+
+        key = InfoCache.make_key('https://example.com/watch?v=abc&t=1', {'format': 'best'})
+
+        self.assertEqual(
+            key,
+            InfoCache.make_key('https://EXAMPLE.com/watch?t=1&v=abc#top', {'format': 'best'}),
+        )
+        self.assertNotEqual(
+            key,
+            InfoCache.make_key('https://example.com/watch?v=abc&t=1', {'format': 'worst'}),
+        )
+        self.assertNotEqual(
+            key,
+            InfoCache.make_key('https://example.com/watch?v=abc&t=1', {'format': 'best'},
+                               ie_key='Youtube'),
+        )
+
+
+class MemoryInfoCacheTest(unittest.TestCase):
+
+    def test_counts_hits_and_misses(self):
+
+        cache = MemoryInfoCache()
+
+        self.assertIsNone(cache.get('key'))
+        self.assertTrue(cache.put('key', {'id': 'abc'}))
+        self.assertEqual(cache.get('key'), {'id': 'abc'})
+
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(cache.stats()['size'], 1)
+
+    def test_entries_are_copied_on_read(self):
+
+        cache = MemoryInfoCache()
+        info = {'id': 'abc', 'formats': [{'format_id': '22'}]}
+        cache.put('key', info)
+        info['formats'].clear()
+
+        first = cache.get('key')
+        first['formats'].append({'format_id': '18'})
+
+        self.assertEqual(cache.get('key'), {'id': 'abc', 'formats': [{'format_id': '22'}]})
+
+    def test_entries_expire(self):
+
+        cache = MemoryInfoCache(ttl=60)
+        with mock.patch('tubedlapi.util.infocache.time.monotonic', return_value=1000.0):
+            cache.put('key', {'id': 'abc'})
+
+        with mock.patch('tubedlapi.util.infocache.time.monotonic', return_value=1059.0):
+            self.assertIsNotNone(cache.get('key'))
+
+        with mock.patch('tubedlapi.util.infocache.time.monotonic', return_value=1061.0):
+            self.assertIsNone(cache.get('key'))
+
+        self.assertEqual((cache.expired, len(cache)), (1, 0))
+
+    def test_size_is_bounded(self):
+
+        cache = MemoryInfoCache(maxsize=2)
+        for key in ('a', 'b'):
+            cache.put(key, {'id': key})
+
+        # Reading `a` makes `b` the least recently used
+        cache.get('a')
+        cache.put('c', {'id': 'c'})
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), {'id': 'a'})
+
+    def test_unserializable_info_is_not_cached(self):
+
+        cache = MemoryInfoCache()
+
+        self.assertFalse(cache.put('key', {'downloader': object()}))
+        self.assertFalse(InfoCache(maxsize=0).put('key', {'id': 'abc'}))
+        self.assertEqual(len(cache), 0)
+
+    def test_discard(self):
+
+        cache = MemoryInfoCache()
+        cache.put('key', {'id': 'abc'})
+        cache.discard('key')
+        cache.discard('missing')
+
+        self.assertIsNone(cache.get('key'))
+
+
+class DiskInfoCacheTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+
+        self.path = tempfile.mkdtemp(prefix='tubedlapi-test-')
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def test_shared_between_instances(self):
+
+        DiskInfoCache(path=self.path).put('key', {'id': 'abc'})
+        cache = DiskInfoCache(path=self.path)
+
+        first = cache.get('key')
+        first['id'] = 'changed'
+
+        self.assertEqual(cache.get('key'), {'id': 'abc'})
+        self.assertEqual((cache.hits, cache.misses), (2, 0))
+
+    def test_entries_expire(self):
+
+        cache = DiskInfoCache(path=self.path, ttl=60)
+        cache.put('key', {'id': 'abc'})
+
+        old = time.time() - 61
+        os.utime(os.path.join(self.path, 'key.json'), (old, old))
+
+        self.assertIsNone(cache.get('key'))
+        self.assertEqual((cache.expired, len(cache)), (1, 0))
+
+    def test_oldest_entries_are_pruned(self):
+
+        cache = DiskInfoCache(path=self.path, maxsize=2)
+        for age, key in enumerate(('c', 'b', 'a')):
+            cache.put(key, {'id': key})
+            mtime = time.time() - 10 * (3 - age)
+            os.utime(os.path.join(self.path, f'{key}.json'), (mtime, mtime))
+
+        cache.put('d', {'id': 'd'})
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('c'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('d'), {'id': 'd'})
+
+    def test_default_path_belongs_to_user(self):
+
+        with mock.patch.dict(os.environ, {'XDG_CACHE_HOME': self.path}):
+            cache = DiskInfoCache()
+
+        self.assertEqual(cache.path, os.path.join(self.path, 'tubedlapi', 'info'))
+        self.assertEqual(os.stat(cache.path).st_mode & 0o777, 0o700)
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+from unittest import mock
+
+from common import AppTestCase
+
+
+class JobSaveTest(AppTestCase):
+    ''' Jobs keep their large metadata sections in their own columns,
+        and only write the columns which changed.
+    '''
+
+    def make_job(self):
+
+        from tubedlapi.model.job import Job
+
+        job = Job.create(status='downloading', meta={'url': 'https://example.com/video'})
+        return Job.get(id=job.id)
+
+    def updates(self, job) -> list:
+        ''' Saves `job`, returning the UPDATE statements it ran.
+        '''
+
+        from tubedlapi.model import database_proxy
+
+        database = database_proxy.obj
+        with mock.patch.object(database, 'execute_sql', wraps=database.execute_sql) as execute:
+            job.save()
+
+        return [call[0][0] for call in execute.call_args_list
+                if call[0][0].startswith('UPDATE')]
+
+    def test_loaded_and_created_jobs_are_clean(self):
+
+        from tubedlapi.model.job import Job
+
+        self.assertEqual(self.make_job().dirty_fields, [])
+        created = Job.create_many([{'url': 'https://example.com/a'}])
+        self.assertEqual(created[0].dirty_fields, [])
+
+    def test_meta_update_marks_touched_columns(self):
+
+        job = self.make_job()
+        job.meta_update(progress={'percent': 10})
+        self.assertEqual(job._dirty, {'progress'})
+
+        job.meta_update(filename='video.mp4', info={'title': 'video'})
+        self.assertEqual(job._dirty, {'progress', 'meta', 'info'})
+
+    def test_sections_live_in_their_own_columns(self):
+
+        from tubedlapi.model.job import Job
+
+        job = self.make_job()
+        job.meta_update(info={'title': 'video'}, filename='video.mp4')
+        job.save()
+
+        stored = Job.get(id=job.id)
+        self.assertEqual(stored.meta, {'url': 'https://example.com/video',
+                                       'filename': 'video.mp4'})
+        self.assertEqual(stored.info, {'title': 'video'})
+        self.assertIsNone(stored.progress)
+        self.assertEqual(stored.meta_dict, {
+            'url': 'https://example.com/video',
+            'filename': 'video.mp4',
+            'info': {'title': 'video'},
+        })
+
+        listed = Job.select_page(limit=100).where(Job.id == job.id).get()
+        self.assertNotIn('info', listed.to_dict(sections=('progress',))['meta'])
+
+    def test_only_changed_columns_are_written(self):
+
+        job = self.make_job()
+        job.meta_update(progress={'percent': 50})
+
+        statement, = self.updates(job)
+        self.assertIn('"progress"', statement)
+        self.assertNotIn('"meta"', statement)
+        self.assertNotIn('"info"', statement)
+
+        # Nothing changed, nothing is written
+        self.assertEqual(self.updates(job), [])
+
+    def test_status_is_written_with_other_columns(self):
+
+        from tubedlapi.model import BaseModel
+        from tubedlapi.model.job import Job
+
+        job = self.make_job()
+        job.status = 'finished'
+        job.meta_update(result={'filename': 'video.mp4'})
+
+        with mock.patch.object(BaseModel, 'save', side_effect=RuntimeError('disk full')):
+            with self.assertRaises(RuntimeError):
+                job.save()
+
+        # The status change was rolled back with the failed save
+        stored = Job.get(id=job.id)
+        self.assertEqual((stored.status, stored.result), ('downloading', None))
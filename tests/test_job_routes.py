@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+
+import json
+from datetime import (
+    datetime,
+    timedelta,
+)
+
+from common import AppTestCase
+
+# Jobs of the pagination tests are created in this window, apart from
+# jobs created by other tests
+WINDOW_START = datetime(2001, 1, 1)
+WINDOW_END = datetime(2001, 1, 2)
+
+
+class ListJobsTest(AppTestCase):
+
+    def setUp(self) -> None:
+
+        super().setUp()
+
+        from tubedlapi.model.job import Job
+
+        self.jobs = []
+        for minutes, status in enumerate(['queued', 'completed', 'queued', 'failed', 'queued']):
+            self.jobs.append(self.make_job(WINDOW_START + timedelta(minutes=minutes), status))
+
+        # Jobs created at the same time are ordered by id
+        tied = WINDOW_START + timedelta(minutes=30)
+        for status in ('queued', 'completed', 'queued'):
+            self.jobs.append(self.make_job(tied, status))
+
+        self.jobs.sort(key=lambda job: (job.created_at, job.id.hex), reverse=True)
+        self.addCleanup(lambda: Job.delete().where(Job.id.in_([j.id for j in self.jobs])).execute())
+
+    def make_job(self, created_at: datetime, status: str):
+
+        from tubedlapi.model.job import Job
+
+        return Job.create(
+            created_at=created_at,
+            status=status,
+            meta={'url': 'https://example.com/video'},
+        )
+
+    def list_all(self, **query) -> list:
+        ''' Follows `next_cursor` through every page of the listing.
+        '''
+
+        client = self.app.test_client()
+        query.update({
+            'since': WINDOW_START.isoformat(),
+            'until': WINDOW_END.isoformat(),
+        })
+
+        pages = []
+        while True:
+            response = client.get('/jobs/', query_string=query)
+            self.assertEqual(response.status_code, 200)
+
+            data = json.loads(response.get_data(as_text=True))
+
+            pages.append([job['id'] for job in data['jobs']])
+            if not data['next_cursor']:
+                return pages
+
+            query['cursor'] = data['next_cursor']
+
+    def test_pages_cover_every_job_once(self):
+
+        pages = self.list_all(limit=3)
+
+        self.assertEqual([len(page) for page in pages], [3, 3, 2])
+        ids = [job_id for page in pages for job_id in page]
+        self.assertEqual(ids, [str(job.id) for job in self.jobs])
+
+    def test_status_filter(self):
+
+        pages = self.list_all(limit=2, status='completed,failed')
+
+        ids = [job_id for page in pages for job_id in page]
+        expected = [str(job.id) for job in self.jobs if job.status in ('completed', 'failed')]
+        self.assertEqual(ids, expected)
+
+    def test_limit_is_bounded(self):
+
+        pages = self.list_all(limit=0)
+
+        self.assertEqual(len(pages), len(self.jobs))
+
+    def test_malformed_cursor_is_bad_request(self):
+
+        client = self.app.test_client()
+
+        response = client.get('/jobs/', query_string={'cursor': 'not a cursor'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_malformed_time_is_bad_request(self):
+
+        client = self.app.test_client()
+
+        for value in ('yesterday', 'nan', 'inf', '-inf', '1e20', '-1e20'):
+            response = client.get('/jobs/', query_string={'since': value})
+            self.assertEqual(response.status_code, 400, value)
+
+            response = client.get('/jobs/', query_string={'until': value})
+            self.assertEqual(response.status_code, 400, value)
+
+    def test_timestamp_is_accepted(self):
+
+        client = self.app.test_client()
+
+        response = client.get('/jobs/', query_string={'since': '0', 'until': '4102444800'})
+        self.assertEqual(response.status_code, 200)
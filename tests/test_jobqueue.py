@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+
+from datetime import (
+    datetime,
+    timedelta,
+)
+
+from common import AppTestCase
+
+
+class QueueEntryTest(AppTestCase):
+
+    def setUp(self) -> None:
+
+        super().setUp()
+
+        from tubedlapi.model.jobqueue import QueueEntry
+
+        QueueEntry.delete().execute()
+        self.addCleanup(lambda: QueueEntry.delete().execute())
+
+    def make_jobs(self, priorities: list) -> list:
+
+        from tubedlapi.model.job import Job
+
+        metas = [{'url': f'https://example.com/{index}'} for index in range(len(priorities))]
+        return Job.create_many(metas, priorities=priorities)
+
+    def test_claims_by_priority_then_age(self):
+
+        from tubedlapi.model.jobqueue import (
+            QueueEntry,
+            STATE_CLAIMED,
+        )
+
+        jobs = self.make_jobs([0, 10, 0, -10])
+        QueueEntry.enqueue_many(jobs, chunk_size=3)
+
+        first = QueueEntry.claim('worker-a', limit=2, lease=60)
+        second = QueueEntry.claim('worker-b', limit=10, lease=60)
+
+        self.assertEqual([entry.job_id for entry in first], [jobs[1].id, jobs[0].id])
+        self.assertEqual([entry.job_id for entry in second], [jobs[2].id, jobs[3].id])
+        for entry in first:
+            self.assertEqual((entry.state, entry.worker, entry.attempts),
+                             (STATE_CLAIMED, 'worker-a', 1))
+
+        # Held entries are not claimed again while their leases last
+        self.assertEqual(QueueEntry.claim('worker-c', limit=10, lease=60), [])
+
+    def test_expired_lease_is_claimed_again(self):
+
+        from tubedlapi.model.jobqueue import QueueEntry
+
+        job, = self.make_jobs([0])
+        QueueEntry.enqueue(job)
+        entry, = QueueEntry.claim('worker-a', limit=1, lease=60)
+
+        # worker-a stopped renewing
+        (QueueEntry
+         .update(lease_expires_at=datetime.now() - timedelta(seconds=1))
+         .where(QueueEntry.id == entry.id)
+         .execute())
+
+        reclaimed, = QueueEntry.claim('worker-b', limit=1, lease=60)
+        self.assertEqual((reclaimed.id, reclaimed.worker, reclaimed.attempts),
+                         (entry.id, 'worker-b', 2))
+
+        # The entry is no longer worker-a's to renew
+        self.assertEqual(QueueEntry.renew('worker-a', [entry.id], lease=60), 0)
+
+    def test_renew_extends_own_leases(self):
+
+        from tubedlapi.model.jobqueue import QueueEntry
+
+        jobs = self.make_jobs([0, 0])
+        QueueEntry.enqueue_many(jobs)
+        mine, theirs = (QueueEntry.claim(worker, limit=1, lease=1)[0]
+                        for worker in ('worker-a', 'worker-b'))
+
+        renewed = QueueEntry.renew('worker-a', [mine.id, theirs.id], lease=600)
+
+        self.assertEqual(renewed, 1)
+        self.assertGreater(QueueEntry.get(id=mine.id).lease_expires_at,
+                           datetime.now() + timedelta(seconds=500))
+        self.assertLess(QueueEntry.get(id=theirs.id).lease_expires_at,
+                        datetime.now() + timedelta(seconds=500))
+        self.assertEqual(QueueEntry.renew('worker-a', [], lease=600), 0)
+
+    def test_cancel(self):
+
+        from tubedlapi.model.jobqueue import (
+            QueueEntry,
+            STATE_CANCELLED,
+        )
+
+        jobs = self.make_jobs([10, 0])
+        QueueEntry.enqueue_many(jobs)
+        claimed, = QueueEntry.claim('worker-a', limit=1, lease=60)
+
+        pending = QueueEntry.cancel([job.id for job in jobs])
+
+        # The waiting entry is dropped, the claimed one is left to its worker
+        self.assertEqual(pending, [jobs[1].id])
+        self.assertEqual([entry.id for entry in QueueEntry.select()], [claimed.id])
+        self.assertEqual(QueueEntry.get(id=claimed.id).state, STATE_CANCELLED)
+
+        self.assertEqual(QueueEntry.cancelled('worker-a', [claimed.id]), [jobs[0].id])
+        self.assertEqual(QueueEntry.cancelled('worker-b', [claimed.id]), [])
+
+        # Cancelled entries are never claimed, even once their leases expire
+        (QueueEntry
+         .update(lease_expires_at=datetime.now() - timedelta(seconds=1))
+         .execute())
+        self.assertEqual(QueueEntry.claim('worker-b', limit=10, lease=60), [])
+
+    def test_finish_only_by_current_claim(self):
+
+        from tubedlapi.model.jobqueue import QueueEntry
+
+        job, = self.make_jobs([0])
+        QueueEntry.enqueue(job)
+        first, = QueueEntry.claim('worker-a', limit=1, lease=60)
+
+        # The lease expires and the same worker claims the job again
+        (QueueEntry
+         .update(lease_expires_at=datetime.now() - timedelta(seconds=1))
+         .where(QueueEntry.id == first.id)
+         .execute())
+        second, = QueueEntry.claim('worker-a', limit=1, lease=60)
+        self.assertNotEqual(first.lease_token, second.lease_token)
+
+        (QueueEntry
+         .update(lease_expires_at=datetime.now() - timedelta(seconds=1))
+         .where(QueueEntry.id == first.id)
+         .execute())
+        third, = QueueEntry.claim('worker-b', limit=1, lease=60)
+
+        # Earlier claims finishing leave the entry to worker-b
+        self.assertFalse(first.finish())
+        self.assertFalse(second.finish())
+        self.assertTrue(QueueEntry.select().where(QueueEntry.id == third.id).exists())
+
+        self.assertTrue(third.finish())
+        self.assertFalse(QueueEntry.select().where(QueueEntry.id == third.id).exists())
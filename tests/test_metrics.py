@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from tubedlapi.util.metrics import Metrics
+
+
+class MetricsTest(unittest.TestCase):
+
+    def test_observations_are_recorded(self):
+
+        metrics = Metrics()
+        metrics.observe_query(0.01)
+        metrics.observe_crypto('decrypt', 0.001)
+
+        rendered = metrics.render()
+        self.assertIn('route="background"', rendered)
+        self.assertIn('operation="decrypt"', rendered)
+
+    def test_disabled_skips_observations(self):
+
+        metrics = Metrics(enabled=False)
+        metrics.observe_query(0.01)
+        metrics.observe_crypto('decrypt', 0.001)
+
+        rendered = metrics.render()
+        self.assertNotIn('route="background"', rendered)
+        self.assertNotIn('operation="decrypt"', rendered)
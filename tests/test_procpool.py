@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+import unittest
+
+from tubedlapi.util.procpool import (
+    RelayProcessPool,
+    RelayTimeout,
+    RemoteError,
+)
+
+
+def send_messages(relay, count: int) -> str:
+
+    for index in range(count):
+        relay.send('progress', index)
+
+    relay.send('postprocess', 'video.mp4')
+    return 'fetched'
+
+
+def fail(relay) -> None:
+
+    relay.send('progress', 0)
+    raise ValueError('extraction failed')
+
+
+def wait_for_cancel(relay, timeout: float) -> bool:
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if relay.cancelled():
+            return True
+
+        relay.send('progress', None)
+        time.sleep(0.05)
+
+    return False
+
+
+class RelayProcessPoolTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+
+        self.pool = RelayProcessPool(max_workers=2)
+        self.addCleanup(self.pool.shutdown)
+
+    def test_messages_are_handled_in_order_before_returning(self):
+
+        progress = []
+        stored = []
+
+        def postprocess(filename: str) -> None:
+
+            # Slow, like hashing a finished download
+            time.sleep(0.2)
+            stored.append(filename)
+
+        result = self.pool.call(
+            {'progress': progress.append, 'postprocess': postprocess},
+            send_messages,
+            20,
+        )
+
+        self.assertEqual(result, 'fetched')
+        self.assertEqual(progress, list(range(20)))
+        self.assertEqual(stored, ['video.mp4'])
+        self.assertEqual(self.pool.stats()['calls'], 0)
+
+    def test_slow_handler_does_not_hold_up_other_calls(self):
+
+        release = threading.Event()
+        results = {}
+
+        def slow(payload) -> None:
+
+            release.wait(5.0)
+
+        def run_slow() -> None:
+
+            results['slow'] = self.pool.call({'postprocess': slow}, send_messages, 0)
+
+        thread = threading.Thread(target=run_slow)
+        thread.start()
+        time.sleep(0.5)
+
+        try:
+            progress = []
+            self.assertEqual(
+                self.pool.call({'progress': progress.append}, send_messages, 3),
+                'fetched',
+            )
+            self.assertEqual(progress, [0, 1, 2])
+            self.assertNotIn('slow', results)
+        finally:
+            release.set()
+            thread.join(5.0)
+
+        self.assertEqual(results['slow'], 'fetched')
+
+    def test_raises_when_not_drained_in_time(self):
+
+        self.pool.drain_timeout = 0.1
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        with self.assertRaises(RelayTimeout):
+            self.pool.call({'postprocess': lambda _: release.wait(5.0)}, send_messages, 0)
+
+    def test_remote_error(self):
+
+        progress = []
+
+        with self.assertRaises(RemoteError) as raised:
+            self.pool.call({'progress': progress.append}, fail)
+
+        self.assertEqual(str(raised.exception), 'extraction failed')
+        self.assertEqual(progress, [0])
+
+    def test_cancel(self):
+
+        self.assertFalse(self.pool.cancel('unknown'))
+
+        results = {}
+
+        def run() -> None:
+
+            results['cancelled'] = self.pool.call({}, wait_for_cancel, 5.0, call_id='job')
+
+        thread = threading.Thread(target=run)
+        thread.start()
+
+        deadline = time.monotonic() + 5.0
+        while not self.pool.cancel('job') and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        thread.join(5.0)
+
+        self.assertTrue(results['cancelled'])
+        self.assertFalse(self.pool.cancel('job'))
+
+
+class RecordingRelay(object):
+
+    def __init__(self) -> None:
+
+        self.sent = []
+
+    def send(self, kind: str, payload=None) -> None:
+
+        self.sent.append((kind, payload))
+
+
+class RelayPostProcessorTest(unittest.TestCase):
+
+    def test_sends_info_the_parent_can_filter(self):
+
+        from tubedlapi.exec.youtubedl import (
+            JobPostProcessor,
+            RelayPostProcessor,
+        )
+
+        relay = RecordingRelay()
+        info = {'id': 'v1', 'filepath': 'v1.mp4', 'title': 'Video'}
+
+        self.assertEqual(RelayPostProcessor(relay).run(info), ([], info))
+
+        (kind, payload), = relay.sent
+        self.assertEqual(kind, 'postprocess')
+        self.assertNotIn('thumbnails', payload)
+
+        filtered = JobPostProcessor.filter_info(None, payload)
+        self.assertEqual(filtered['downloaded']['filename'], 'v1.mp4')
+        self.assertEqual(filtered['source']['thumbnails'], [])
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+import time
+import uuid
+from unittest import mock
+
+from common import AppTestCase
+
+
+class ProfileCacheTest(AppTestCase):
+    ''' Two caches stand in for two processes sharing the database.
+    '''
+
+    def setUp(self) -> None:
+
+        super().setUp()
+
+        from tubedlapi.model.profile import ProfileCache
+
+        self.here = ProfileCache(check_interval=0)
+        self.elsewhere = ProfileCache(check_interval=0)
+
+    def make_profile(self, options: bytes=b'{"format": "best"}'):
+
+        from tubedlapi.model.profile import Profile
+
+        profile = Profile.create(name=f'test-{uuid.uuid4().hex}', options=options)
+        self.addCleanup(profile.delete_instance)
+
+        return profile
+
+    def set_options(self, profile, options: bytes) -> None:
+
+        from tubedlapi.model.profile import Profile
+
+        Profile.update(options=options).where(Profile.id == profile.id).execute()
+
+    def test_cached_by_name_and_id(self):
+
+        profile = self.make_profile()
+
+        first = self.here.get(name=profile.name)
+        self.assertIs(self.here.get(name=profile.name), first)
+        self.assertIs(self.here.get(id=profile.id), first)
+        self.assertEqual(first.options_dict, {'format': 'best'})
+        self.assertEqual((self.here.hits, self.here.misses), (2, 1))
+
+    def test_invalidated_by_other_process(self):
+
+        from tubedlapi.model.profile import ProfileVersion
+
+        profile = self.make_profile()
+        self.here.get(name=profile.name)
+        self.set_options(profile, b'{"format": "worst"}')
+
+        # Not seen until the version counter is bumped
+        self.assertEqual(self.here.get(name=profile.name).options_dict, {'format': 'best'})
+
+        version = ProfileVersion.current()
+        self.elsewhere.invalidate()
+        self.assertEqual(ProfileVersion.current(), version + 1)
+
+        self.assertEqual(self.here.get(name=profile.name).options_dict, {'format': 'worst'})
+        self.assertEqual(self.here.invalidations, 1)
+        self.assertEqual(self.here.stats()['version'], version + 1)
+
+    def test_version_checked_once_per_interval(self):
+
+        from tubedlapi.model.profile import ProfileCache
+
+        cache = ProfileCache(check_interval=60)
+        profile = self.make_profile()
+        cache.get(name=profile.name)
+
+        self.set_options(profile, b'{"format": "worst"}')
+        self.elsewhere.invalidate()
+
+        with mock.patch('tubedlapi.model.profile.ProfileVersion.current') as current:
+            stale = cache.get(name=profile.name)
+
+        current.assert_not_called()
+        self.assertEqual(stale.options_dict, {'format': 'best'})
+
+        later = time.monotonic() + 61
+        with mock.patch('tubedlapi.model.profile.time.monotonic', return_value=later):
+            fresh = cache.get(name=profile.name)
+
+        self.assertEqual(fresh.options_dict, {'format': 'worst'})
+
+    def test_profile_loaded_before_invalidation_is_not_cached(self):
+
+        from tubedlapi.model.profile import Profile
+
+        profile = self.make_profile()
+        load = Profile.get
+
+        def load_then_invalidate(*args, **kwargs):
+
+            loaded = load(*args, **kwargs)
+            self.here.invalidate()
+            return loaded
+
+        with mock.patch.object(Profile, 'get', side_effect=load_then_invalidate):
+            self.here.get(name=profile.name)
+
+        self.assertEqual(len(self.here), 0)
+
+        self.here.get(name=profile.name)
+        self.assertEqual(len(self.here), 1)
+        self.assertEqual(self.here.misses, 2)
+
+    def test_get_many_and_all(self):
+
+        from tubedlapi.model.profile import Profile
+
+        first = self.make_profile()
+        second = self.make_profile()
+        self.here.get(name=first.name)
+
+        found = self.here.get_many([first.name, second.name, 'missing'])
+        self.assertEqual(set(found), {first.name, second.name})
+        self.assertEqual((self.here.hits, self.here.misses), (1, 3))
+
+        everything = self.here.all()
+        self.assertEqual([profile.id for profile in everything],
+                         [profile.id for profile in Profile.select().order_by(Profile.id)])
+
+        # The complete listing is served from the cache from now on
+        with mock.patch.object(Profile, 'select') as select:
+            self.assertEqual(len(self.here.all()), len(everything))
+
+        select.assert_not_called()
+
+    def test_invalid_options_are_not_cached(self):
+
+        profile = self.make_profile(options=b'[]')
+
+        loaded = self.here.get(name=profile.name)
+
+        with self.assertRaises(ValueError):
+            loaded.options_dict
+
+        self.assertEqual(len(self.here), 0)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+import unittest
+
+from tubedlapi.util.ratelimit import (
+    FetchLimits,
+    Limiter,
+    TokenBucket,
+    parse_limit,
+)
+
+
+class ParseLimitTest(unittest.TestCase):
+
+    def test_forms(self):
+
+        self.assertEqual(parse_limit(2), (2, 0.0, 1.0))
+        self.assertEqual(parse_limit('2'), (2, 0.0, 1.0))
+        self.assertEqual(parse_limit('2/0.5'), (2, 0.5, 1.0))
+        self.assertEqual(parse_limit('0/4/8'), (0, 4.0, 8.0))
+        self.assertEqual(parse_limit({'rate': 3}), (0, 3.0, 3.0))
+
+    def test_malformed(self):
+
+        for spec in ('1/2/3/4', 'many', '-1', '1/1/0.5', True, None):
+            self.assertRaises(ValueError, parse_limit, spec)
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_rate_and_burst(self):
+
+        bucket = TokenBucket(rate=2.0, burst=2.0)
+        now = bucket.updated
+
+        for _ in range(2):
+            self.assertEqual(bucket.wait(now), 0.0)
+            bucket.take(now)
+
+        self.assertAlmostEqual(bucket.wait(now), 0.5)
+        self.assertEqual(bucket.wait(now + 0.5), 0.0)
+
+        # Tokens do not pile up past the burst
+        self.assertEqual(bucket.wait(now + 60), 0.0)
+        self.assertEqual(bucket.tokens, 2.0)
+
+
+class LimiterTest(unittest.TestCase):
+
+    def test_concurrency(self):
+
+        limiter = Limiter('host:example.com', concurrency=1)
+
+        self.assertEqual(limiter.wait(0.0), 0.0)
+        limiter.acquire(0.0)
+        self.assertEqual(limiter.wait(0.0), float('inf'))
+        limiter.release()
+        self.assertEqual(limiter.wait(0.0), 0.0)
+        self.assertEqual(limiter.stats()['started'], 1)
+
+
+class FetchLimitsTest(unittest.TestCase):
+
+    def test_host_limit_covers_subdomains(self):
+
+        limits = FetchLimits({'host:example.com': 2})
+
+        limiter, = limits.limiters(host='media.cdn.Example.com')
+        self.assertEqual(limiter.key, 'host:example.com')
+        self.assertIs(limits.limiters(host='example.com')[0], limiter)
+        self.assertEqual(limits.limiters(host='example.org'), [])
+
+    def test_wildcards_limit_each_key(self):
+
+        limits = FetchLimits({'host:*': 1, 'extractor:*': '0/1', 'extractor:youtube': 3})
+
+        first = limits.limiters(host='a.example', extractor='Generic')
+        second = limits.limiters(host='b.example', extractor='Youtube')
+
+        self.assertEqual([limiter.key for limiter in first],
+                         ['host:a.example', 'extractor:generic'])
+        self.assertEqual([limiter.key for limiter in second],
+                         ['host:b.example', 'extractor:youtube'])
+        self.assertEqual(second[1].concurrency, 3)
+        self.assertIs(limits.limiters(host='a.example')[0], first[0])
+        self.assertTrue(limits.by_extractor)
+
+    def test_profile_limits_are_scoped(self):
+
+        limits = FetchLimits()
+        specs = {'host:example.com': 1}
+
+        mine, = limits.limiters(host='example.com', profile_id=1, profile_specs=specs)
+        theirs, = limits.limiters(host='example.com', profile_id=2, profile_specs=specs)
+
+        self.assertFalse(limits.enabled)
+        self.assertIsNot(mine, theirs)
+        self.assertEqual(mine.key, 'profile:1/host:example.com')
+
+    def test_malformed_specs_are_skipped(self):
+
+        limits = FetchLimits({'host:example.com': 'many', 'path:/': 1, 'extractor:generic': 1})
+
+        self.assertEqual(list(limits.specs), ['extractor:generic'])
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+
+import time
+import unittest
+from concurrent.futures import Future
+
+from tubedlapi.util.ratelimit import Limiter
+from tubedlapi.util.scheduler import (
+    PRIORITY_HIGH,
+    PRIORITY_LOW,
+    PRIORITY_NORMAL,
+    FairScheduler,
+    parse_priority,
+)
+
+
+class ManualPool(object):
+    ''' Stands in for a `StagePool`. Submitted tasks run only when
+        `finish` is called, oldest first.
+    '''
+
+    def __init__(self, max_workers: int) -> None:
+
+        self.max_workers = max_workers
+        self.running = []
+
+    def submit(self, func, *args, **kw) -> Future:
+
+        future = Future()
+        future.set_running_or_notify_cancel()
+        self.running.append((func, args, kw, future))
+
+        return future
+
+    def finish(self) -> None:
+
+        func, args, kw, future = self.running.pop(0)
+        future.set_result(func(*args, **kw))
+
+    def drain(self) -> None:
+
+        while self.running:
+            self.finish()
+
+
+class FairSchedulerTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+
+        self.order = []
+
+    def task(self, name: str):
+
+        return lambda: self.order.append(name)
+
+    def test_higher_priority_starts_first(self):
+
+        pool = ManualPool(max_workers=1)
+        scheduler = FairScheduler(pool)
+
+        scheduler.submit('a', PRIORITY_NORMAL, [], self.task('running'))
+        scheduler.submit('a', PRIORITY_LOW, [], self.task('low'))
+        scheduler.submit('b', PRIORITY_NORMAL, [], self.task('normal'))
+        scheduler.submit('c', PRIORITY_HIGH, [], self.task('high'))
+
+        pool.drain()
+
+        self.assertEqual(self.order, ['running', 'high', 'normal', 'low'])
+
+    def test_tenants_take_turns(self):
+
+        pool = ManualPool(max_workers=1)
+        scheduler = FairScheduler(pool)
+        scheduler.submit('x', PRIORITY_NORMAL, [], self.task('running'))
+
+        for index in range(4):
+            scheduler.submit('a', PRIORITY_NORMAL, [], self.task(f'a{index}'))
+        for index in range(2):
+            scheduler.submit('b', PRIORITY_NORMAL, [], self.task(f'b{index}'))
+
+        pool.drain()
+
+        # `b` came later, but does not wait behind all of `a`
+        self.assertEqual(self.order, ['running', 'a0', 'b0', 'a1', 'b1', 'a2', 'a3'])
+
+    def test_weights(self):
+
+        pool = ManualPool(max_workers=1)
+        scheduler = FairScheduler(pool, weights={'b': 2.0})
+        scheduler.submit('x', PRIORITY_NORMAL, [], self.task('running'))
+
+        for index in range(3):
+            scheduler.submit('a', PRIORITY_NORMAL, [], self.task(f'a{index}'))
+        for index in range(4):
+            scheduler.submit('b', PRIORITY_NORMAL, [], self.task(f'b{index}'))
+
+        pool.drain()
+
+        self.assertEqual(self.order, ['running', 'a0', 'b0', 'b1', 'a1', 'b2', 'b3', 'a2'])
+
+    def test_tenant_share_is_capped(self):
+
+        pool = ManualPool(max_workers=4)
+        scheduler = FairScheduler(pool, max_share=0.5)
+
+        for index in range(4):
+            scheduler.submit('a', PRIORITY_NORMAL, [], self.task(f'a{index}'))
+
+        self.assertEqual(len(pool.running), 2)
+
+        scheduler.submit('b', PRIORITY_NORMAL, [], self.task('b0'))
+        self.assertEqual(len(pool.running), 3)
+        self.assertEqual(scheduler.stats()['active_by_tenant'], {'a': 2, 'b': 1})
+
+        pool.drain()
+
+        self.assertEqual(sorted(self.order), ['a0', 'a1', 'a2', 'a3', 'b0'])
+
+    def test_background_share_is_capped(self):
+
+        pool = ManualPool(max_workers=4)
+        scheduler = FairScheduler(pool, background_share=0.25)
+
+        scheduler.submit('a', PRIORITY_LOW, [], self.task('low0'))
+        scheduler.submit('b', PRIORITY_LOW, [], self.task('low1'))
+        scheduler.submit('c', PRIORITY_NORMAL, [], self.task('normal'))
+
+        self.assertEqual(len(pool.running), 2)
+        self.assertEqual(scheduler.stats()['active_background'], 1)
+
+        pool.drain()
+
+        self.assertEqual(self.order, ['low0', 'normal', 'low1'])
+
+    def test_cancelled_task_is_skipped(self):
+
+        pool = ManualPool(max_workers=1)
+        scheduler = FairScheduler(pool)
+
+        scheduler.submit('a', PRIORITY_NORMAL, [], self.task('running'))
+        cancelled = scheduler.submit('a', PRIORITY_NORMAL, [], self.task('cancelled'))
+        scheduler.submit('a', PRIORITY_NORMAL, [], self.task('next'))
+
+        self.assertTrue(cancelled.cancel())
+        pool.drain()
+
+        self.assertEqual(self.order, ['running', 'next'])
+
+    def test_parse_priority(self):
+
+        self.assertEqual(parse_priority(None), PRIORITY_NORMAL)
+        self.assertEqual(parse_priority(None, PRIORITY_LOW), PRIORITY_LOW)
+        self.assertEqual(parse_priority('HIGH'), PRIORITY_HIGH)
+        self.assertEqual(parse_priority(5), 5)
+
+        for value in ('urgent', True, 1.5, []):
+            self.assertRaises(ValueError, parse_priority, value)
+
+
+class FairSchedulerLimitTest(unittest.TestCase):
+
+    def test_delayed_counted_once_per_task(self):
+
+        pool = ManualPool(max_workers=4)
+        scheduler = FairScheduler(pool)
+        limiter = Limiter('host:example.com', concurrency=1)
+
+        futures = [scheduler.submit('a', 0, [limiter], lambda i=i: i) for i in range(3)]
+
+        # Every submit scans the queue again
+        self.assertEqual(len(pool.running), 1)
+        self.assertEqual(limiter.delayed, 2)
+
+        pool.drain()
+
+        self.assertEqual([future.result() for future in futures], [0, 1, 2])
+        self.assertEqual(limiter.delayed, 2)
+        self.assertEqual(limiter.started, 3)
+        self.assertEqual(limiter.active, 0)
+
+    def test_held_task_does_not_block_other_hosts(self):
+
+        pool = ManualPool(max_workers=4)
+        scheduler = FairScheduler(pool)
+        limiter = Limiter('host:example.com', concurrency=1)
+
+        scheduler.submit('a', 0, [limiter], lambda: 'first')
+        held = scheduler.submit('a', 0, [limiter], lambda: 'held')
+        other = scheduler.submit('a', 0, [], lambda: 'other')
+
+        self.assertEqual(len(pool.running), 2)
+        self.assertEqual(scheduler.stats()['limited'], 1)
+
+        pool.drain()
+
+        self.assertEqual(held.result(), 'held')
+        self.assertEqual(other.result(), 'other')
+
+    def test_rate_limited_task_starts_when_token_is_due(self):
+
+        pool = ManualPool(max_workers=4)
+        scheduler = FairScheduler(pool)
+        limiter = Limiter('host:example.com', rate=20.0, burst=1.0)
+
+        scheduler.submit('a', 0, [limiter], lambda: 'first')
+        scheduler.submit('a', 0, [limiter], lambda: 'second')
+        self.assertEqual(len(pool.running), 1)
+
+        # Started by the retry timer, without anything finishing
+        deadline = time.monotonic() + 5.0
+        while len(pool.running) < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        self.assertEqual(len(pool.running), 2)
+        self.assertEqual(limiter.delayed, 1)
@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import uuid
+from concurrent.futures import Future
+from unittest import mock
+
+from common import AppTestCase
+
+
+class StageCallbackTest(AppTestCase):
+    ''' The pipeline future of a job is always resolved, even when
+        finishing a stage raises.
+    '''
+
+    def make_job(self, **meta):
+
+        from tubedlapi.model.job import Job
+
+        return Job.create(
+            status='downloading',
+            meta=dict({'url': 'https://example.com/video'}, **meta),
+        )
+
+    def test_error_finishing_stage_fails_job(self):
+
+        from tubedlapi.exec import stage
+        from tubedlapi.exec.youtubedl import Playlist
+        from tubedlapi.model.job import Job
+
+        job = self.make_job()
+        done = Future()
+        fut = Future()
+        fut.set_result(Playlist({}, []))
+
+        with mock.patch.object(stage, 'job_expand', side_effect=RuntimeError('no profile')):
+            stage.job_stage_callback(job, stage.STAGE_FETCHING, done, fut)
+
+        with self.assertRaisesRegex(RuntimeError, 'no profile'):
+            done.result(timeout=5)
+
+        stored = Job.get(id=job.id)
+        self.assertEqual(stored.status, 'failed')
+        self.assertEqual(stored.meta_dict['error'], {
+            'stage': stage.STAGE_FETCHING,
+            'message': 'no profile',
+        })
+
+    def test_error_beginning_upload_fails_job(self):
+
+        from tubedlapi.exec import stage
+        from tubedlapi.model.job import Job
+
+        job = self.make_job(destinations=['nowhere'])
+        done = Future()
+        fut = Future()
+        fut.set_result({})
+
+        with mock.patch.object(stage, 'upload_file', side_effect=TypeError('no filename')):
+            stage.job_stage_callback(job, stage.STAGE_FETCHING, done, fut)
+            self.assertEqual(done.result(timeout=5), 'failed')
+
+        self.assertEqual(Job.get(id=job.id).meta_dict['error'], {
+            'stage': stage.STAGE_UPLOADING,
+            'message': 'no filename',
+        })
+
+    def test_error_handing_off_stage_fails_job(self):
+
+        from tubedlapi.exec import stage
+        from tubedlapi.model.job import Job
+
+        job = self.make_job()
+        done = Future()
+        fut = Future()
+        fut.set_result({})
+
+        executor = mock.Mock()
+        executor.execute_stage.side_effect = RuntimeError('cannot schedule new futures')
+        stage._stage_done(executor, job, stage.STAGE_FETCHING, done, fut)
+
+        with self.assertRaises(RuntimeError):
+            done.result(timeout=5)
+
+        self.assertEqual(Job.get(id=job.id).status, 'failed')
+
+
+class PlaylistTest(AppTestCase):
+    ''' Playlists expand into child jobs, which finish their parent
+        once the last of them is done.
+    '''
+
+    def setUp(self) -> None:
+
+        super().setUp()
+
+        from tubedlapi.model.profile import Profile
+
+        self.profile = Profile.create(name=f'test-{uuid.uuid4().hex}', options=b'{}')
+        self.addCleanup(self.profile.delete_instance)
+
+        patcher = mock.patch('tubedlapi.exec.stage.job_submit_many')
+        self.submit_many = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_parent(self, total: int=0, status: str='expanded'):
+
+        from tubedlapi.model.job import Job
+
+        return Job.create(
+            status=status,
+            children_total=total,
+            meta={'url': 'https://example.com/list', 'profile': self.profile.name},
+        )
+
+    def make_children(self, parent, count: int) -> list:
+
+        from tubedlapi.model.job import Job
+
+        return Job.create_many(
+            [{'url': f'https://example.com/{index}'} for index in range(count)],
+            parent=parent,
+        )
+
+    def finish(self, children: list, statuses: list) -> None:
+
+        from tubedlapi.exec import stage
+
+        for child, status in zip(children, statuses):
+            child.status = status
+            child.save()
+            stage._child_finished(child)
+
+    def test_expand_creates_children(self):
+
+        from tubedlapi.exec import stage
+        from tubedlapi.exec.youtubedl import Playlist
+        from tubedlapi.model.job import Job
+
+        parent = self.make_parent(status='downloading')
+        parent.meta_update(destinations=['archive'])
+        parent.save()
+
+        playlist = Playlist({'title': 'list'}, [
+            {'url': 'https://example.com/a', 'ie_key': 'Generic'},
+            {'url': 'https://example.com/b', 'ie_key': 'Generic'},
+        ])
+        done = Future()
+        stage.job_expand(parent, playlist, done)
+
+        self.assertEqual(done.result(timeout=5), 'expanded')
+        stored = Job.get(id=parent.id)
+        self.assertEqual((stored.status, stored.children_total), ('expanded', 2))
+        self.assertEqual(stored.meta_dict['info'], {'title': 'list'})
+
+        children = list(Job.select().where(Job.parent == parent.id))
+        metas = sorted((child.meta_dict for child in children), key=lambda meta: meta['url'])
+        self.assertEqual([(meta['url'], meta['playlist_index'], meta['destinations'])
+                          for meta in metas],
+                         [('https://example.com/a', 1, ['archive']),
+                          ('https://example.com/b', 2, ['archive'])])
+
+        submitted = self.submit_many.call_args[0][0]
+        self.assertEqual({job.id for job, _ in submitted}, {child.id for child in children})
+        self.assertEqual({profile.id for _, profile in submitted}, {self.profile.id})
+
+    def test_empty_playlist_completes(self):
+
+        from tubedlapi.exec import stage
+        from tubedlapi.exec.youtubedl import Playlist
+
+        parent = self.make_parent(status='downloading')
+        done = Future()
+        stage.job_expand(parent, Playlist({}, []), done)
+
+        self.assertEqual(done.result(timeout=5), 'completed')
+
+    def test_parent_status_from_children(self):
+
+        from tubedlapi.model.job import Job
+
+        cases = (
+            (['completed', 'completed'], 'completed', (2, 0)),
+            (['completed', 'failed'], 'completed', (1, 1)),
+            (['failed', 'cancelled'], 'failed', (0, 2)),
+        )
+        for statuses, expected, counts in cases:
+            parent = self.make_parent(total=len(statuses))
+            children = self.make_children(parent, len(statuses))
+
+            self.finish(children[:-1], statuses[:-1])
+            self.assertEqual(Job.get(id=parent.id).status, 'expanded')
+
+            self.finish(children[-1:], statuses[-1:])
+            stored = Job.get(id=parent.id)
+            self.assertEqual(stored.status, expected)
+            self.assertEqual((stored.children_completed, stored.children_failed), counts)
+
+    def test_nested_playlist_finishes_grandparent(self):
+
+        from tubedlapi.model.job import Job
+
+        grandparent = self.make_parent(total=1)
+        parent, = self.make_children(grandparent, 1)
+        Job.update(status='expanded', children_total=1).where(Job.id == parent.id).execute()
+        child, = self.make_children(Job.get(id=parent.id), 1)
+
+        self.finish([child], ['completed'])
+
+        self.assertEqual(Job.get(id=parent.id).status, 'completed')
+        self.assertEqual(Job.get(id=grandparent.id).status, 'completed')
+
+    def test_concurrent_children_finish_parent_once(self):
+
+        from tubedlapi.model import close_connection
+        from tubedlapi.model.job import Job
+
+        count = 8
+        parent = self.make_parent(total=count)
+        finished = []
+
+        def finish(index: int) -> None:
+
+            try:
+                finished.append(Job.child_finished(parent.id, failed=index % 2 == 0)[1])
+            finally:
+                close_connection()
+
+        threads = [threading.Thread(target=finish, args=(index,)) for index in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(finished), [False] * (count - 1) + [True])
+        stored = Job.get(id=parent.id)
+        self.assertEqual((stored.children_completed, stored.children_failed), (4, 4))
+        self.assertEqual(stored.status, 'completed')
+
+    def test_cancel_cascades_to_children(self):
+
+        from tubedlapi.app import registry
+        from tubedlapi.exec import stage
+        from tubedlapi.model.job import Job
+        from tubedlapi.util.cancel import CancelRegistry
+
+        parent = self.make_parent(total=2)
+        running, waiting = self.make_children(parent, 2)
+        Job.update(status='downloading').where(Job.id == running.id).execute()
+
+        self.assertTrue(stage.job_cancel(parent))
+        self.assertFalse(stage.job_cancel(parent))
+
+        statuses = {job.id: job.status for job in Job.select().where(
+            Job.id.in_([parent.id, running.id, waiting.id])
+        )}
+        self.assertEqual(set(statuses.values()), {'cancelled'})
+
+        cancels = registry[CancelRegistry]
+        self.assertTrue(cancels.is_cancelled(running.id))
+        self.assertTrue(cancels.is_cancelled(waiting.id))
+
+        # The children's pipelines end cancelled, and so does the parent
+        for child in (running, waiting):
+            done = Future()
+            fut = Future()
+            fut.set_result({})
+            stage.job_stage_callback(Job.get(id=child.id), stage.STAGE_FETCHING, done, fut)
+            self.assertEqual(done.result(timeout=5), 'cancelled')
+
+        stored = Job.get(id=parent.id)
+        self.assertEqual(stored.status, 'cancelled')
+        self.assertEqual(stored.children_failed, 2)
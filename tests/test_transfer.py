@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from fs.memoryfs import MemoryFS
+
+from tubedlapi.util.transfer import (
+    copy_chunked,
+    marker_path,
+)
+
+
+class Interrupted(Exception):
+    pass
+
+
+class CopyChunkedTest(unittest.TestCase):
+
+    def setUp(self) -> None:
+
+        self.workdir = tempfile.mkdtemp(prefix='tubedlapi-test-')
+        self.src = os.path.join(self.workdir, 'video.mp4')
+        self.content = os.urandom(4096)
+        with open(self.src, 'wb') as f:
+            f.write(self.content)
+
+        self.fs = MemoryFS()
+
+    def tearDown(self) -> None:
+
+        self.fs.close()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def interrupt_copy(self, after: int) -> None:
+
+        def progress(done: int, total: int) -> None:
+
+            if done >= after:
+                raise Interrupted()
+
+        with self.assertRaises(Interrupted):
+            copy_chunked(self.src, self.fs, 'video.mp4', buffer_size=1024, progress=progress)
+
+    def test_copy(self):
+
+        transfer = copy_chunked(self.src, self.fs, 'video.mp4', buffer_size=1024)
+
+        self.assertEqual(self.fs.getbytes('video.mp4'), self.content)
+        self.assertEqual(transfer['bytes_transferred'], 4096)
+        self.assertFalse(self.fs.exists(marker_path('video.mp4')))
+
+    def test_resumes_interrupted_copy(self):
+
+        self.interrupt_copy(after=1024)
+        self.assertTrue(self.fs.exists(marker_path('video.mp4')))
+
+        transfer = copy_chunked(self.src, self.fs, 'video.mp4', buffer_size=1024)
+
+        self.assertEqual(self.fs.getbytes('video.mp4'), self.content)
+        self.assertEqual(transfer['bytes_resumed'], 1024)
+        self.assertEqual(transfer['bytes_transferred'], 3072)
+        self.assertFalse(self.fs.exists(marker_path('video.mp4')))
+
+    def test_keeps_complete_copy_with_marker(self):
+
+        # Interrupted after the last chunk, before the marker was removed
+        self.interrupt_copy(after=4096)
+
+        transfer = copy_chunked(self.src, self.fs, 'video.mp4', buffer_size=1024)
+
+        self.assertEqual(self.fs.getbytes('video.mp4'), self.content)
+        self.assertEqual(transfer['bytes_transferred'], 0)
+        self.assertFalse(self.fs.exists(marker_path('video.mp4')))
+
+    def test_overwrites_same_size_file_without_marker(self):
+
+        self.fs.setbytes('video.mp4', b'\0' * 4096)
+
+        transfer = copy_chunked(self.src, self.fs, 'video.mp4', buffer_size=1024)
+
+        self.assertEqual(self.fs.getbytes('video.mp4'), self.content)
+        self.assertEqual(transfer['bytes_resumed'], 0)
+        self.assertEqual(transfer['bytes_transferred'], 4096)
+
+    def test_overwrites_copy_of_changed_source(self):
+
+        self.interrupt_copy(after=1024)
+
+        self.content = os.urandom(4096)
+        with open(self.src, 'wb') as f:
+            f.write(self.content)
+        stat = os.stat(self.src)
+        os.utime(self.src, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+        transfer = copy_chunked(self.src, self.fs, 'video.mp4', buffer_size=1024)
+
+        self.assertEqual(self.fs.getbytes('video.mp4'), self.content)
+        self.assertEqual(transfer['bytes_resumed'], 0)
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+import unittest
+
+from tubedlapi.util.writebehind import WriteBehindBuffer
+
+
+class BlockingWriter(object):
+    ''' Records writes, and holds writes of `block_key` until released.
+    '''
+
+    def __init__(self, block_key=None) -> None:
+
+        self.block_key = block_key
+        self.writes = []
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def __call__(self, key, value) -> None:
+
+        if key == self.block_key:
+            self.started.set()
+            self.release.wait(5.0)
+
+        self.writes.append((key, value))
+
+
+class LateWriteBuffer(WriteBehindBuffer):
+    ''' Widens the gap between taking values off the buffer and
+        writing them, where `discard` used to slip in.
+    '''
+
+    def _write(self, due) -> None:
+
+        time.sleep(0.2)
+        super()._write(due)
+
+
+class WriteBehindBufferTest(unittest.TestCase):
+
+    def test_coalesces_updates(self):
+
+        writer = BlockingWriter()
+        buffer = WriteBehindBuffer(writer, interval=0.2)
+
+        buffer.update('job', 1)
+        time.sleep(0.05)
+        for value in range(2, 10):
+            buffer.update('job', value)
+
+        time.sleep(0.4)
+
+        self.assertEqual(writer.writes, [('job', 1), ('job', 9)])
+        self.assertEqual(buffer.stats()['coalesced'], 7)
+
+    def test_flush_writes_pending_values(self):
+
+        writer = BlockingWriter()
+        buffer = WriteBehindBuffer(writer, interval=60.0)
+
+        buffer.update('a', 1)
+        time.sleep(0.05)
+        buffer.update('a', 2)
+        buffer.update('b', 1)
+        buffer.flush()
+
+        self.assertEqual(sorted(writer.writes), [('a', 1), ('a', 2), ('b', 1)])
+        self.assertEqual(buffer.stats()['pending'], 0)
+
+    def test_discard_waits_for_taken_values(self):
+
+        writer = BlockingWriter()
+        buffer = LateWriteBuffer(writer, interval=0.05)
+
+        buffer.update('job', 'stale')
+        time.sleep(0.05)
+        buffer.discard('job')
+        writer.writes.append(('job', 'status'))
+        time.sleep(0.3)
+
+        self.assertEqual(writer.writes, [('job', 'stale'), ('job', 'status')])
+
+    def test_discard_waits_for_in_flight_write(self):
+
+        writer = BlockingWriter(block_key='job')
+        buffer = WriteBehindBuffer(writer, interval=0.05)
+
+        buffer.update('job', 'stale')
+        self.assertTrue(writer.started.wait(5.0))
+        buffer.update('job', 'newer')
+
+        discarded = threading.Event()
+
+        def discard() -> None:
+
+            buffer.discard('job')
+            # The status change is saved here, after every progress write
+            writer.writes.append(('job', 'status'))
+            discarded.set()
+
+        thread = threading.Thread(target=discard)
+        thread.start()
+
+        self.assertFalse(discarded.wait(0.2))
+
+        writer.release.set()
+        thread.join(5.0)
+        time.sleep(0.2)
+
+        self.assertEqual(writer.writes, [('job', 'stale'), ('job', 'status')])
+
+    def test_keys_do_not_wait_for_each_other(self):
+
+        writer = BlockingWriter(block_key='slow')
+        buffer = WriteBehindBuffer(writer, interval=60.0)
+
+        buffer.update('slow', 1)
+        self.assertTrue(writer.started.wait(5.0))
+
+        try:
+            buffer.discard('fast')
+            buffer.update('fast', 1)
+            flusher = threading.Thread(target=buffer.flush)
+            flusher.start()
+            flusher.join(1.0)
+
+            self.assertFalse(flusher.is_alive())
+            self.assertEqual(writer.writes, [('fast', 1)])
+        finally:
+            writer.release.set()